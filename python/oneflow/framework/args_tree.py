@@ -283,3 +283,83 @@ class ArgsTree(object):
             mapped_value = map_function(value)
 
         return mapped_value
+
+
+class ArgSpec(object):
+    r"""
+    A precomputed flatten/unflatten plan of io args with a fixed structure.
+
+    It is built once from an example of io args. Then `flatten` gets tensor leaves
+    and `unflatten` rebuilds the structure with new tensor leaves, both without
+    the NamedArg wrapping and the type checks of every node that ArgsTree does.
+    Leaves which are not tensor (such as None) are kept as they are in the example.
+
+    `flatten` checks that io args have the structure of the example, i.e. the
+    same container types, lengths, dict keys and tensor or non-tensor leaves,
+    and raises a ValueError otherwise.
+    """
+
+    _TENSOR = object()
+
+    def __init__(self, io_args: Union[Tuple, List, Dict]) -> None:
+        self._num_tensors = 0
+        self._structure = self._build(io_args)
+
+    def _build(self, value):
+        if _is_raw_type(value, tuple) or _is_raw_type(value, list):
+            return (value.__class__, [self._build(v) for v in value])
+        elif _is_raw_type(value, dict) or _is_raw_type(value, OrderedDict):
+            return (value.__class__, [(k, self._build(v)) for (k, v) in value.items()])
+        elif isinstance(value, Tensor):
+            self._num_tensors += 1
+            return ArgSpec._TENSOR
+        else:
+            return (None, value)
+
+    @property
+    def num_tensors(self):
+        return self._num_tensors
+
+    def flatten(self, io_args) -> List[Tensor]:
+        flattened = []
+        if not self._flatten(self._structure, io_args, flattened):
+            raise ValueError(
+                "The structure of io args differs from the one they were first "
+                "called with."
+            )
+        return flattened
+
+    def _flatten(self, structure, value, flattened):
+        if structure is ArgSpec._TENSOR:
+            flattened.append(value)
+            return isinstance(value, Tensor)
+        container_type, children = structure
+        if container_type is None:
+            return type(value) is type(children)
+        if value.__class__ is not container_type or len(value) != len(children):
+            return False
+        if container_type is dict or container_type is OrderedDict:
+            return all(
+                k in value and self._flatten(v, value[k], flattened)
+                for (k, v) in children
+            )
+        return all(self._flatten(c, v, flattened) for (c, v) in zip(children, value))
+
+    def unflatten(self, tensors: Union[Tuple, List]):
+        assert len(tensors) == self._num_tensors
+        return self._rebuild(self._structure, iter(tensors))
+
+    def _rebuild(self, structure, tensor_iter):
+        if structure is ArgSpec._TENSOR:
+            return next(tensor_iter)
+        container_type, children = structure
+        if container_type is None:
+            return children
+        if container_type is dict or container_type is OrderedDict:
+            return container_type(
+                (k, self._rebuild(v, tensor_iter)) for (k, v) in children
+            )
+        if container_type is tuple or container_type is list:
+            return container_type(self._rebuild(v, tensor_iter) for v in children)
+        # namedtuple such as oneflow.return_types
+        return container_type(*(self._rebuild(v, tensor_iter) for v in children))
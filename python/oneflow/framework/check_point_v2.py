@@ -13,8 +13,12 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import concurrent.futures
 import contextlib
 import os
+import shutil
+import threading
+import uuid
 import warnings
 from typing import (
     Any,
@@ -55,6 +59,7 @@ SNAPSHOT_DONE_FILENAME = "snapshot_done"
 META_INFO_FILENAME = "meta"
 PICKLE_FILENAME = "pickled_data"
 DATA_FILENAME = "out"
+SHARDED_INDEX_FILENAME = "sharded_index.json"
 PROTOCOL_VERSION = 1
 ONEFLOW_MAGIC_KEY = "__oneflow__"
 
@@ -62,6 +67,9 @@ MAP_LOCATION: TypeAlias = Optional[
     Union[Callable[[Tensor, str], Tensor], flow.device, str, flow.placement]
 ]
 FILE_LIKE: TypeAlias = Union[os.PathLike, BinaryIO, IO[bytes], Path]
+SBP_LIKE: TypeAlias = Optional[
+    Union["flow.sbp.sbp", Sequence["flow.sbp.sbp"], Callable[[Tuple[int]], Any]]
+]
 
 
 class _opener(object):
@@ -186,13 +194,16 @@ class FileBackendVariableBlob:
     def dtype(self) -> oneflow.dtype:
         return self.dtype_
 
-    def numpy(self) -> np.ndarray:
+    def numpy(self, mmap: bool = False) -> np.ndarray:
         if not self.has_meta_info_:
             raise RuntimeError("This variable does not have meta info")
-        return np.fromfile(
-            self.file_path,
-            dtype=dtype_util.convert_oneflow_dtype_to_numpy_dtype(self.dtype),
-        ).reshape(self.shape)
+        np_dtype = dtype_util.convert_oneflow_dtype_to_numpy_dtype(self.dtype)
+        if mmap and np.prod(self.shape).item() > 0:
+            # Copy-on-write mapping: pages are read lazily on first access and
+            # shared between processes until written, and writes never reach
+            # the file on disk.
+            return np.memmap(self.file_path, dtype=np_dtype, mode="c", shape=self.shape)
+        return np.fromfile(self.file_path, dtype=np_dtype).reshape(self.shape)
 
 
 def _save_tensor_to_disk(tensor: "oneflow.Tensor", dir_name: Union[str, Path]) -> None:
@@ -204,12 +215,19 @@ def _save_tensor_to_disk(tensor: "oneflow.Tensor", dir_name: Union[str, Path]) -
     )
     data_path = os.path.join(dir_name, DATA_FILENAME)
     with open(data_path, "wb") as f:
-        f.write(tensor.numpy().tobytes())
+        _write_array(f, tensor.numpy())
 
     with open(os.path.join(dir_name, META_INFO_FILENAME), "w") as f:
         f.write(text_format.MessageToString(meta_info))
 
 
+def _write_array(f, array: np.ndarray) -> None:
+    # Write from the memory of the array directly instead of building an
+    # intermediate bytes object with `tobytes()`.
+    array = np.ascontiguousarray(array)
+    f.write(memoryview(array.reshape(-1)).cast("B"))
+
+
 ValueContainer = Union[FileBackendVariableBlob, np.ndarray, "oneflow.Tensor"]
 
 
@@ -270,19 +288,39 @@ def _LoadSingleVariable(
     path: Optional[str],
     global_src_rank: Optional[int] = None,
     map_location: MAP_LOCATION = None,
+    mmap: bool = False,
+    sbp: SBP_LIKE = None,
 ) -> "flow.Tensor":
+    if sbp is not None:
+        # Every rank reads only the region of its own local tensor.
+        file_backed_blob = FileBackendVariableBlob(path)
+        return _load_global_by_regions(
+            file_backed_blob.shape,
+            file_backed_blob.dtype,
+            map_location,
+            sbp,
+            lambda box: file_backed_blob.numpy(mmap=True)[_box_to_slices(box)],
+        )
+
+    def read_blob():
+        file_backed_blob = FileBackendVariableBlob(path)
+        if mmap:
+            # flow.from_numpy shares memory with the mapped array, so the data
+            # is paged in only when the tensor is actually read.
+            return flow.from_numpy(file_backed_blob.numpy(mmap=True))
+        return flow.tensor(file_backed_blob.numpy(), dtype=file_backed_blob.dtype)
+
     if global_src_rank is not None:
         rank = flow.env.get_rank()
         if rank == global_src_rank:
-            file_backed_blob = FileBackendVariableBlob(path)
-            loaded = flow.tensor(file_backed_blob.numpy(), dtype=file_backed_blob.dtype)
+            loaded = read_blob()
         else:
             loaded = flow.tensor([])
         loaded = loaded.to_global(
             flow.placement("cpu", [global_src_rank]), flow.sbp.broadcast
         )
     else:
-        loaded = flow.tensor(FileBackendVariableBlob(path).numpy())
+        loaded = read_blob()
     return smart_to(loaded, map_location)
 
 
@@ -301,7 +339,10 @@ def _broadcast_py_object(obj, src: int = 0):
 def tensor_getstate(self):
     # context_data is not None means setstate/getstate is called inside
     # flow.save or flow.load
+    context_data = _get_context_data()
     if context_data is not None:
+        if context_data.sharded_writer is not None:
+            return {"sharded": context_data.sharded_writer.add(self)}
         if context_data.global_rank is None:
             assert (
                 self.is_local
@@ -357,12 +398,19 @@ def tensor_getstate(self):
 
 
 def tensor_setstate(self, pickle_dict):
+    context_data = _get_context_data()
     if context_data is not None:
-        if context_data.save_as_external_data:
+        if "sharded" in pickle_dict:
+            self.__init__(_load_sharded_tensor(pickle_dict["sharded"]))
+        elif context_data.save_as_external_data:
             rel_dir_name = pickle_dict["path"]
             abs_dir_name = context_data.path / rel_dir_name
             tmp_tensor = _LoadSingleVariable(
-                str(abs_dir_name), context_data.global_rank, context_data.map_location
+                str(abs_dir_name),
+                context_data.global_rank,
+                context_data.map_location,
+                mmap=context_data.mmap,
+                sbp=context_data.sbp,
             )
             self.__init__(tmp_tensor)
         else:
@@ -434,7 +482,12 @@ def is_dir_and_no_pickle_file(path: FILE_LIKE, support_pytorch_format: bool):
 
 @load_if(is_dir_and_no_pickle_file)
 def legacy_load(
-    path: Path, global_src_rank: Optional[int], map_location: MAP_LOCATION,
+    path: Path,
+    global_src_rank: Optional[int],
+    map_location: MAP_LOCATION,
+    *,
+    mmap: bool = False,
+    sbp: SBP_LIKE = None,
 ) -> Dict[str, "flow.Tensor"]:
     assert os.path.isdir(path), "Directory {} doesn't exist!".format(path)
     rank = flow.env.get_rank()
@@ -450,7 +503,9 @@ def legacy_load(
     for f in all_files:
         var_dir = os.path.join(path, f)
         try:
-            var_dict[f] = _LoadSingleVariable(var_dir, global_src_rank, map_location)
+            var_dict[f] = _LoadSingleVariable(
+                var_dir, global_src_rank, map_location, mmap=mmap, sbp=sbp
+            )
         except FileNotFoundError:
             warnings.warn(
                 f"'{var_dir}' does not have valid tensor data. Please check it if it is unexpected.",
@@ -465,13 +520,29 @@ def tensor_pickling_context(
     global_rank: Optional[int],
     mp: MAP_LOCATION,
     save_as_external_data: bool,
+    mmap: bool = False,
+    *,
+    sharded_writer: Optional["_ShardedTensorWriter"] = None,
+    sharded_index: Optional[Dict[str, Dict]] = None,
+    sbp: SBP_LIKE = None,
 ):
-    global context_data
-    context_data = ContextData(path, global_rank, mp, save_as_external_data)
+    # The context is thread local, so that asynchronous saving in background
+    # threads does not interfere with flow.save/flow.load in other threads.
+    prev_context_data = _get_context_data()
+    _thread_local.context_data = ContextData(
+        path,
+        global_rank,
+        mp,
+        save_as_external_data,
+        mmap,
+        sharded_writer=sharded_writer,
+        sharded_index=sharded_index,
+        sbp=sbp,
+    )
     try:
         yield
     finally:
-        context_data = None
+        _thread_local.context_data = prev_context_data
 
 
 def is_oneflow_pickle_file(path: FILE_LIKE, support_pytorch_format: bool) -> bool:
@@ -493,8 +564,16 @@ def is_oneflow_pickle_file(path: FILE_LIKE, support_pytorch_format: bool) -> boo
 # as `content`.
 @load_if(is_oneflow_pickle_file)
 def load_from_oneflow_single_file(
-    path: FILE_LIKE, global_src_rank, map_location: MAP_LOCATION, content: Any = None,
+    path: FILE_LIKE,
+    global_src_rank,
+    map_location: MAP_LOCATION,
+    content: Any = None,
+    *,
+    mmap: bool = False,
+    sbp: SBP_LIKE = None,
 ):
+    if mmap:
+        _warn_mmap_unsupported("a single-file checkpoint")
     rank = flow.env.get_rank()
     if global_src_rank is None or rank == global_src_rank:
         assert content["protocol_version"] == PROTOCOL_VERSION
@@ -510,7 +589,7 @@ def load_from_oneflow_single_file(
             warn_on_non_tensor_leaf=False,
         )
     res = _map_location(res, map_location)
-    return res
+    return _to_sbp(res, sbp)
 
 
 def is_file_and_support_pytorch_format(
@@ -532,8 +611,16 @@ def is_file_and_support_pytorch_format(
 
 @load_if(is_file_and_support_pytorch_format)
 def load_from_pytorch_file(
-    path: FILE_LIKE, global_src_rank, map_location: MAP_LOCATION, torch_obj: Any = None
+    path: FILE_LIKE,
+    global_src_rank,
+    map_location: MAP_LOCATION,
+    torch_obj: Any = None,
+    *,
+    mmap: bool = False,
+    sbp: SBP_LIKE = None,
 ):
+    if mmap:
+        _warn_mmap_unsupported("a PyTorch checkpoint")
     if torch_obj is not None:
         with flow.mock_torch.disable():
             import torch
@@ -555,7 +642,448 @@ def load_from_pytorch_file(
             warn_on_non_tensor_leaf=False,
         )
     flow_obj = _map_location(flow_obj, map_location)
-    return flow_obj
+    return _to_sbp(flow_obj, sbp)
+
+
+def _balanced_range(start: int, stop: int, num_parts: int, index: int):
+    # The same partition as BalancedSplitter in C++: the first `remainder` parts
+    # get one more element.
+    base, remainder = divmod(stop - start, num_parts)
+    begin = start + base * index + min(index, remainder)
+    return begin, begin + base + (1 if index < remainder else 0)
+
+
+def _sbp_to_state(sbp) -> Tuple[str, int]:
+    kind, axis = sbp.__getstate__()
+    return kind, axis
+
+
+def _sbp_from_state(state) -> "flow.sbp.sbp":
+    kind, axis = state
+    if kind == "S":
+        return flow.sbp.split(axis)
+    elif kind == "B":
+        return flow.sbp.broadcast
+    elif kind == "P":
+        return flow.sbp.partial_sum
+    raise ValueError(f"Invalid sbp state: {state}")
+
+
+def _get_shard_boxes(
+    shape: Sequence[int], ranks: np.ndarray, nd_sbp_state: Sequence[Tuple[str, int]]
+) -> Dict[int, Tuple[List[Tuple[int, int]], bool]]:
+    r"""Returns a dict mapping every rank in the placement to the (start, stop)
+    range it holds on each dim of the global tensor, and whether the rank is the
+    owner of that shard, i.e. the first replica of it along all broadcast (or
+    partial) hierarchy dims.
+    """
+    boxes = {}
+    for idx in np.ndindex(*ranks.shape):
+        box = [(0, dim) for dim in shape]
+        is_owner = True
+        for (hierarchy_axis, (kind, axis)) in enumerate(nd_sbp_state):
+            if kind == "S":
+                box[axis] = _balanced_range(
+                    *box[axis], ranks.shape[hierarchy_axis], idx[hierarchy_axis]
+                )
+            elif idx[hierarchy_axis] != 0:
+                is_owner = False
+        boxes[int(ranks[idx])] = (box, is_owner)
+    return boxes
+
+
+def _dtype_from_str(dtype_str: str) -> "flow.dtype":
+    return getattr(flow, dtype_str.split(".")[-1])
+
+
+def _numpy_dtype_of(dtype: "flow.dtype") -> np.dtype:
+    # Tensor.numpy() converts bfloat16 to float32
+    if dtype == flow.bfloat16:
+        dtype = flow.float32
+    return np.dtype(dtype_util.convert_oneflow_dtype_to_numpy_dtype(dtype))
+
+
+class _ShardedTensorWriter:
+    r"""Writes the shards of tensors owned by the current rank with a thread
+    pool, and records the metadata of all shards of all ranks in `index`.
+
+    The data of a shard is written from the memory returned by
+    `Tensor.numpy()` directly, which is zero-copy for cpu tensors. The total
+    bytes of shards copied to host but not yet written are bounded by
+    `max_inflight_bytes`.
+    """
+
+    def __init__(self, path: Path, num_threads: int, max_inflight_bytes: int):
+        self.path = path
+        self.rank = flow.env.get_rank()
+        self.index = OrderedDict()
+        self._max_inflight_bytes = max_inflight_bytes
+        self._inflight_bytes = 0
+        self._cond = threading.Condition()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            num_threads, thread_name_prefix="oneflow_checkpoint_writer"
+        )
+        self._futures = []
+
+    def add(self, tensor: "flow.Tensor") -> str:
+        name = f"tensor_{len(self.index)}"
+        shape = tuple(tensor.shape)
+        if tensor.is_local:
+            # Local tensors are assumed to be the same on all ranks, as in the
+            # non-sharded format.
+            placement_state = None
+            nd_sbp_state = None
+            boxes = {0: ([(0, dim) for dim in shape], True)}
+            local_tensor = tensor
+        else:
+            if flow.sbp.partial_sum in tensor.sbp:
+                tensor = tensor.to_global(
+                    sbp=[
+                        flow.sbp.broadcast if sbp == flow.sbp.partial_sum else sbp
+                        for sbp in tensor.sbp
+                    ]
+                )
+            placement_state = {
+                "type": tensor.placement.type,
+                "ranks": tensor.placement.ranks.tolist(),
+            }
+            nd_sbp_state = [_sbp_to_state(sbp) for sbp in tensor.sbp]
+            boxes = _get_shard_boxes(shape, tensor.placement.ranks, nd_sbp_state)
+            local_tensor = tensor.to_local() if self.rank in boxes else None
+        shards = []
+        for (shard_rank, (box, is_owner)) in boxes.items():
+            if not is_owner:
+                continue
+            file_name = f"{name}/shard_{shard_rank}"
+            shards.append(
+                {
+                    "file": file_name,
+                    "offsets": [start for (start, _) in box],
+                    "sizes": [stop - start for (start, stop) in box],
+                }
+            )
+            if shard_rank == self.rank:
+                self._submit(self.path / file_name, local_tensor)
+        self.index[name] = {
+            "shape": list(shape),
+            "dtype": repr(tensor.dtype),
+            "numpy_dtype": _numpy_dtype_of(tensor.dtype).str,
+            "placement": placement_state,
+            "sbp": nd_sbp_state,
+            "shards": shards,
+        }
+        return name
+
+    def _submit(self, file_path: Path, tensor: "flow.Tensor"):
+        nbytes = tensor.numel() * _numpy_dtype_of(tensor.dtype).itemsize
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._inflight_bytes == 0
+                or self._inflight_bytes + nbytes <= self._max_inflight_bytes
+            )
+            self._inflight_bytes += nbytes
+        # Device to host copy happens here for non-cpu tensors
+        array = tensor.numpy()
+        self._futures.append(
+            self._executor.submit(self._write_file, file_path, array, nbytes)
+        )
+
+    def _write_file(self, file_path: Path, array: np.ndarray, nbytes: int):
+        try:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(file_path, "wb") as f:
+                _write_array(f, array)
+        finally:
+            with self._cond:
+                self._inflight_bytes -= nbytes
+                self._cond.notify_all()
+
+    def wait(self):
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._executor.shutdown()
+
+
+def _save_sharded(
+    obj: Any,
+    path: Path,
+    num_threads: Optional[int],
+    max_inflight_bytes: int,
+    sync_ranks: bool = True,
+) -> None:
+    if num_threads is None:
+        num_threads = min(8, os.cpu_count() or 1)
+    path.mkdir(parents=True, exist_ok=True)
+    writer = _ShardedTensorWriter(path, num_threads, max_inflight_bytes)
+    obj = {"protocol_version": PROTOCOL_VERSION, ONEFLOW_MAGIC_KEY: None, "data": obj}
+    try:
+        with tensor_pickling_context(path, None, None, True, sharded_writer=writer):
+            pickled_bytes = pickle.dumps(obj)
+    finally:
+        writer.wait()
+    # Wait for the shards written by other ranks. Local tensors are written by
+    # rank 0 only, so there is nothing to wait for without global tensors.
+    if any(entry["placement"] is not None for entry in writer.index.values()):
+        flow.comm.barrier()
+    if flow.env.get_rank() == 0:
+        (path / PICKLE_FILENAME).write_bytes(pickled_bytes)
+        # The index is written at last, so a checkpoint with the index is
+        # always complete.
+        tmp_index_path = path / (SHARDED_INDEX_FILENAME + ".tmp")
+        with open(tmp_index_path, "w") as f:
+            json.dump(
+                {"protocol_version": PROTOCOL_VERSION, "tensors": writer.index}, f
+            )
+        os.replace(tmp_index_path, path / SHARDED_INDEX_FILENAME)
+    # Other ranks may load the checkpoint as soon as they return.
+    if sync_ranks and flow.env.get_world_size() > 1:
+        flow.comm.barrier()
+
+
+def _box_to_slices(box: Sequence[Tuple[int, int]]) -> Tuple[slice, ...]:
+    return tuple(slice(start, stop) for (start, stop) in box)
+
+
+def _read_shard(path: Path, shard: Dict, np_dtype: np.dtype, mmap: bool) -> np.ndarray:
+    file_path = os.path.join(path, shard["file"])
+    sizes = tuple(shard["sizes"])
+    if mmap and np.prod(sizes, dtype=np.int64) > 0:
+        return np.memmap(file_path, dtype=np_dtype, mode="c", shape=sizes)
+    return np.fromfile(file_path, dtype=np_dtype).reshape(sizes)
+
+
+def _read_sharded_region(
+    path: Path, entry: Dict, box: Sequence[Tuple[int, int]], mmap: bool
+) -> np.ndarray:
+    r"""Reads the region `box` of a tensor in the sharded format. Shards are
+    mapped into memory, so only the pages of the parts overlapping with `box`
+    are read from disk.
+    """
+    np_dtype = np.dtype(entry["numpy_dtype"])
+    shards = entry["shards"]
+    box = [tuple(dim_range) for dim_range in box]
+    for shard in shards:
+        shard_box = [
+            (offset, offset + size)
+            for (offset, size) in zip(shard["offsets"], shard["sizes"])
+        ]
+        if shard_box == box:
+            return _read_shard(path, shard, np_dtype, mmap)
+    array = np.empty([stop - start for (start, stop) in box], dtype=np_dtype)
+    if array.size == 0:
+        return array
+    for shard in shards:
+        overlap = [
+            (max(start, offset), min(stop, offset + size))
+            for ((start, stop), offset, size) in zip(
+                box, shard["offsets"], shard["sizes"]
+            )
+        ]
+        if any(lo >= hi for (lo, hi) in overlap):
+            continue
+        data = np.memmap(
+            os.path.join(path, shard["file"]),
+            dtype=np_dtype,
+            mode="r",
+            shape=tuple(shard["sizes"]),
+        )
+        dst = tuple(
+            slice(lo - start, hi - start)
+            for ((lo, hi), (start, _)) in zip(overlap, box)
+        )
+        src = tuple(
+            slice(lo - offset, hi - offset)
+            for ((lo, hi), offset) in zip(overlap, shard["offsets"])
+        )
+        array[dst] = data[src]
+    return array
+
+
+def _read_sharded_tensor(path: Path, entry: Dict, mmap: bool) -> np.ndarray:
+    box = [(0, dim) for dim in entry["shape"]]
+    return _read_sharded_region(path, entry, box, mmap)
+
+
+def _resolve_nd_sbp(
+    sbp: SBP_LIKE, shape: Sequence[int], placement: "flow.placement"
+) -> List["flow.sbp.sbp"]:
+    if callable(sbp) and not isinstance(sbp, flow.sbp.sbp):
+        sbp = sbp(tuple(shape))
+    if isinstance(sbp, flow.sbp.sbp):
+        sbp = [sbp]
+    sbp = list(sbp)
+    assert len(sbp) == placement.ranks.ndim, (
+        f"The number of sbp ({len(sbp)}) does not match the number of placement "
+        f"hierarchy dims ({placement.ranks.ndim})"
+    )
+    assert (
+        flow.sbp.partial_sum not in sbp
+    ), "partial_sum is not supported for loading global tensors"
+    return sbp
+
+
+def _load_global_by_regions(
+    shape: Sequence[int],
+    dtype: "flow.dtype",
+    placement: "flow.placement",
+    sbp: SBP_LIKE,
+    read_region: Callable[[List[Tuple[int, int]]], np.ndarray],
+) -> "flow.Tensor":
+    r"""Builds a global tensor on `placement` with `sbp`, in which every rank
+    reads only the region of its own local tensor with `read_region`, instead
+    of reading the whole tensor on one rank and boxing it.
+    """
+    assert isinstance(
+        placement, flow.placement
+    ), "'map_location' should be a placement to load global tensors with sbp"
+    nd_sbp = _resolve_nd_sbp(sbp, shape, placement)
+    boxes = _get_shard_boxes(
+        shape, placement.ranks, [_sbp_to_state(sbp) for sbp in nd_sbp]
+    )
+    rank = flow.env.get_rank()
+    if rank in boxes:
+        array = np.ascontiguousarray(read_region(boxes[rank][0]))
+        local_tensor = _tensor_from_numpy(array, dtype).to(placement.type)
+    else:
+        local_tensor = flow.empty(0, dtype=dtype, device=placement.type)
+    return flow._C.local_to_global(
+        local_tensor, placement, nd_sbp, tuple(shape), dtype, False
+    )
+
+
+def _tensor_from_numpy(array: np.ndarray, dtype: "flow.dtype") -> "flow.Tensor":
+    tensor = flow.from_numpy(array)
+    if tensor.dtype != dtype:
+        tensor = tensor.to(dtype)
+    return tensor
+
+
+def _load_sharded_tensor_as_global(
+    path: Path,
+    entry: Dict,
+    mmap: bool,
+    placement: Optional["flow.placement"] = None,
+    sbp: SBP_LIKE = None,
+) -> "flow.Tensor":
+    if placement is None:
+        placement = flow.placement(
+            entry["placement"]["type"], entry["placement"]["ranks"]
+        )
+        sbp = [_sbp_from_state(state) for state in entry["sbp"]]
+    return _load_global_by_regions(
+        entry["shape"],
+        _dtype_from_str(entry["dtype"]),
+        placement,
+        sbp,
+        lambda box: _read_sharded_region(path, entry, box, mmap),
+    )
+
+
+def _load_sharded_tensor(name: str) -> "flow.Tensor":
+    context_data = _get_context_data()
+    entry = context_data.sharded_index[name]
+    path = context_data.path
+    global_rank = context_data.global_rank
+    mmap = context_data.mmap
+    dtype = _dtype_from_str(entry["dtype"])
+    if context_data.sbp is not None:
+        # Re-shard onto the placement and sbp given to flow.load, which can be
+        # different from the saved ones.
+        return _load_sharded_tensor_as_global(
+            path, entry, mmap, context_data.map_location, context_data.sbp
+        )
+    if global_rank is not None:
+        if flow.env.get_rank() == global_rank:
+            loaded = _tensor_from_numpy(_read_sharded_tensor(path, entry, mmap), dtype)
+        else:
+            loaded = flow.tensor([], dtype=dtype)
+        loaded = loaded.to_global(
+            flow.placement("cpu", [global_rank]), flow.sbp.broadcast
+        )
+    elif (
+        entry["placement"] is not None
+        and context_data.map_location is None
+        and np.max(entry["placement"]["ranks"]) < flow.env.get_world_size()
+    ):
+        # Restore the saved placement and sbp when all ranks of the placement
+        # exist.
+        loaded = _load_sharded_tensor_as_global(path, entry, mmap)
+    else:
+        loaded = _tensor_from_numpy(_read_sharded_tensor(path, entry, mmap), dtype)
+    return smart_to(loaded, context_data.map_location)
+
+
+def is_sharded_dir(path: FILE_LIKE, support_pytorch_format: bool) -> bool:
+    if _is_path(path) and path.is_dir():
+        return (path / SHARDED_INDEX_FILENAME).exists()
+    return False
+
+
+@load_if(is_sharded_dir)
+def load_from_sharded_dir(
+    path: Path,
+    global_src_rank: Optional[int],
+    map_location: MAP_LOCATION,
+    *,
+    mmap: bool = False,
+    sbp: SBP_LIKE = None,
+):
+    def read_files():
+        with open(path / SHARDED_INDEX_FILENAME) as f:
+            index = json.load(f)
+        return (path / PICKLE_FILENAME).read_bytes(), index
+
+    if global_src_rank is not None:
+        if flow.env.get_rank() == global_src_rank:
+            pickle_bytes, index = read_files()
+            _broadcast_py_object((pickle_bytes, index), global_src_rank)
+        else:
+            pickle_bytes, index = _broadcast_py_object(None, global_src_rank)
+    else:
+        pickle_bytes, index = read_files()
+    assert index["protocol_version"] == PROTOCOL_VERSION
+
+    if map_location is not None:
+        assert isinstance(
+            map_location, (str, flow.device, flow.placement)
+        ), "'map_location' only supports str, device or placement."
+    with tensor_pickling_context(
+        path,
+        global_src_rank,
+        map_location,
+        True,
+        mmap,
+        sharded_index=index["tensors"],
+        sbp=sbp,
+    ):
+        res = pickle.loads(pickle_bytes)
+    assert res["protocol_version"] == PROTOCOL_VERSION
+    return res["data"]
+
+
+def _to_sbp(obj: Any, sbp: SBP_LIKE) -> Any:
+    # The tensor data is embedded in the pickled file in these formats, so it
+    # is read on every rank and then converted to the sbp.
+    if sbp is None:
+        return obj
+
+    def to_sbp(x):
+        if not isinstance(x, Tensor):
+            return x
+        return x.to_global(sbp=_resolve_nd_sbp(sbp, x.shape, x.placement))
+
+    return ArgsTree(obj).map_leaf(to_sbp)
+
+
+def _warn_mmap_unsupported(checkpoint_type: str):
+    warnings.warn(
+        f"`mmap=True` is ignored when loading {checkpoint_type}, because the "
+        "tensor data is embedded in the pickled file. Save it with "
+        "`save_as_external_data=True` to load it with mmap.",
+        stacklevel=4,
+    )
 
 
 def is_dir_and_has_pickle_file(path: FILE_LIKE, support_pytorch_format: bool) -> bool:
@@ -567,7 +1095,12 @@ def is_dir_and_has_pickle_file(path: FILE_LIKE, support_pytorch_format: bool) ->
 
 @load_if(is_dir_and_has_pickle_file)
 def load_from_oneflow_pickle_dir(
-    path: Path, global_src_rank: Optional[int], map_location: MAP_LOCATION,
+    path: Path,
+    global_src_rank: Optional[int],
+    map_location: MAP_LOCATION,
+    *,
+    mmap: bool = False,
+    sbp: SBP_LIKE = None,
 ):
     rank = flow.env.get_rank()
     pickle_path = path / PICKLE_FILENAME
@@ -584,7 +1117,9 @@ def load_from_oneflow_pickle_dir(
         assert isinstance(
             map_location, (str, flow.device, flow.placement)
         ), "'map_location' only supports str, device or placement."
-    with tensor_pickling_context(path, global_src_rank, map_location, True):
+    with tensor_pickling_context(
+        path, global_src_rank, map_location, True, mmap, sbp=sbp
+    ):
         res = pickle.loads(pickle_bytes)
     assert res["protocol_version"] == PROTOCOL_VERSION
     return res["data"]
@@ -596,6 +1131,8 @@ def load(
     map_location: MAP_LOCATION = None,
     *,
     support_pytorch_format: bool = True,
+    mmap: bool = False,
+    sbp: SBP_LIKE = None,
 ) -> Any:
     r"""Loads an object saved with oneflow.save() from a directory.
 
@@ -612,12 +1149,33 @@ def load(
             indicates the location where all tensors should be loaded.
         support_pytorch_format (bool, optional): whether to support
             loading the file saved by `torch.save`. Default: True
+        mmap (bool, optional): whether to memory-map the tensor data files
+            instead of reading them into memory. Tensors loaded to cpu share
+            memory with the mapped files, their data is paged in on first
+            access and the page cache is shared by all processes loading the
+            same checkpoint. Writing to such a tensor does not modify the file.
+            Only takes effect for checkpoints saved with
+            `save_as_external_data=True` or by the legacy directory format.
+            Default: False
+        sbp (flow.sbp.sbp, list of flow.sbp.sbp or callable, optional): the sbp
+            of the loaded global tensors on the placement `map_location`, or a
+            callable returning the sbp given the global shape of a tensor. All
+            ranks read the checkpoint together, and each rank reads only the
+            parts of the files it holds, so tensors can be re-sharded to any
+            placement and sbp without gathering them to a single rank. It
+            requires `map_location` to be a placement and `global_src_rank` to
+            be None. Default: None
 
     Returns:
         The loaded object
     """
     if isinstance(path, str):
         path = Path(path)
+    if sbp is not None:
+        assert isinstance(
+            map_location, flow.placement
+        ), "'map_location' should be a placement when 'sbp' is specified"
+        assert global_src_rank is None, "'sbp' does not support global_src_rank"
     rank = flow.env.get_rank()
     if global_src_rank is None or global_src_rank == rank:
         for i, (condition, load) in enumerate(load_methods):
@@ -637,7 +1195,9 @@ def load(
         load = load_methods[i][1]
         extra_data = ()
 
-    return load(path, global_src_rank, map_location, *extra_data)  # type: ignore
+    return load(
+        path, global_src_rank, map_location, *extra_data, mmap=mmap, sbp=sbp
+    )  # type: ignore
 
 
 def save_one_embedding_info(state_dict: Any, path: Union[str, Path]) -> None:
@@ -682,7 +1242,12 @@ def save(
     path_or_buffer: FILE_LIKE,
     global_dst_rank: Optional[int] = None,
     save_as_external_data: bool = False,
-) -> None:
+    *,
+    sharded: bool = False,
+    num_threads: Optional[int] = None,
+    max_inflight_bytes: int = 1024 ** 3,
+    async_: bool = False,
+) -> Optional[concurrent.futures.Future]:
     r"""Save an object to a directory.
 
     Args:
@@ -696,6 +1261,26 @@ def save(
             disk I/O.
         save_as_external_data (bool): useful only if path_or_buffer is a string or
            os.PathLike object containing a file name
+        sharded (bool): whether to save in the sharded format, in which every
+            rank writes the shards of global tensors it holds in parallel,
+            instead of gathering them to `global_dst_rank`. An index file
+            records the shape, dtype, placement, sbp and shards of every tensor,
+            so that `flow.load` can reassemble the tensors or restore them on
+            the same placement. All ranks must call `flow.save` together and
+            `path_or_buffer` must be a directory. Default: False
+        num_threads (int, optional): the number of threads writing shards on
+            each rank in the sharded format. Default: min(8, cpu count)
+        max_inflight_bytes (int): the maximum bytes of shards copied to host
+            but not yet written on each rank in the sharded format. Default: 1GiB
+        async_ (bool): whether to save asynchronously. Tensors are snapshotted
+            to host buffers, and a future is returned while the serialization
+            and fsync run in a background thread. The object is written to a
+            temporary path and renamed to `path_or_buffer` when completed.
+            Only local tensors are supported, which are the same on all ranks,
+            so rank 0 writes the object alone and the futures of other ranks
+            are done at once. At most one asynchronous save runs at the same
+            time, use :class:`oneflow.CheckpointManager` for more control.
+            Default: False
     """
     if isinstance(path_or_buffer, str):
         path_or_buffer = Path(path_or_buffer)
@@ -708,6 +1293,36 @@ def save(
         _save_graph(obj, path_or_buffer)
         return
 
+    if async_:
+        if not _is_path(path_or_buffer):
+            raise ValueError(
+                "path_or_buffer must be the type of {`str`, `pathlib.Path`} while async_ is True"
+            )
+        assert (
+            global_dst_rank is None
+        ), "global_dst_rank is not supported while async_ is True"
+        return _get_default_async_saver().submit(
+            obj,
+            path_or_buffer,
+            dict(
+                save_as_external_data=save_as_external_data,
+                sharded=sharded,
+                num_threads=num_threads,
+                max_inflight_bytes=max_inflight_bytes,
+            ),
+        )
+
+    if sharded:
+        if not _is_path(path_or_buffer):
+            raise ValueError(
+                "path_or_buffer must be the type of {`str`, `pathlib.Path`} while sharded is True"
+            )
+        assert (
+            global_dst_rank is None
+        ), "global_dst_rank is not supported while sharded is True"
+        _save_sharded(obj, path_or_buffer, num_threads, max_inflight_bytes)
+        return
+
     # this `path` is only used for `ContextData` and is set to empty when `path_or_buffer` is IO[bytes] or BinaryIO
     path: Path = Path(path_or_buffer if _is_path(path_or_buffer) else "")
     obj = {"protocol_version": PROTOCOL_VERSION, ONEFLOW_MAGIC_KEY: None, "data": obj}
@@ -737,6 +1352,270 @@ def save(
         write_file()
 
 
+class _SnapshotBufferPool:
+    r"""Reuses host buffers of snapshots across asynchronous saves, buffers for
+    tensors on cuda are pinned.
+    """
+
+    def __init__(self):
+        self._free_buffers = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, tensor: "flow.Tensor"):
+        key = (tuple(tensor.shape), tensor.dtype, tensor.is_cuda)
+        with self._lock:
+            free_buffers = self._free_buffers.get(key)
+            if free_buffers:
+                return key, free_buffers.pop()
+        buffer = flow.empty(
+            key[0], dtype=tensor.dtype, device="cpu", pin_memory=tensor.is_cuda
+        )
+        return key, buffer
+
+    def release(self, buffers):
+        with self._lock:
+            for (key, buffer) in buffers:
+                self._free_buffers.setdefault(key, []).append(buffer)
+
+
+def _snapshot(obj: Any, buffer_pool: _SnapshotBufferPool):
+    buffers = []
+
+    def snapshot_tensor(x):
+        if isinstance(x, (flow.nn.Module, graph_util.Graph)):
+            raise ValueError(
+                "Saving a Module or Graph asynchronously is not supported, "
+                "please save its state_dict() instead"
+            )
+        if not isinstance(x, Tensor):
+            return x
+        assert x.is_local, "Saving global tensors asynchronously is not supported"
+        key, buffer = buffer_pool.acquire(x)
+        # The copy is enqueued in the virtual machine before any later update of
+        # `x`, so the snapshot is consistent without waiting for it here.
+        buffer.copy_(x)
+        buffers.append((key, buffer))
+        return buffer
+
+    with flow.no_grad():
+        snapshot = ArgsTree(obj).map_leaf(snapshot_tensor)
+    return snapshot, buffers
+
+
+def _fsync_path(path: Path) -> None:
+    if path.is_dir():
+        for child in path.iterdir():
+            _fsync_path(child)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _remove_path(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    elif path.exists():
+        path.unlink()
+
+
+def _publish(tmp_path: Path, path: Path) -> None:
+    if path.is_dir():
+        # A directory can not be replaced atomically, move the old one away
+        # first so that `path` is never seen partially written.
+        trash_path = path.with_name(f".{path.name}.trash-{uuid.uuid4().hex}")
+        os.rename(path, trash_path)
+        os.rename(tmp_path, path)
+        _remove_path(trash_path)
+    else:
+        os.replace(tmp_path, path)
+    _fsync_path(path.parent)
+
+
+class _AsyncSaver:
+    def __init__(self, max_concurrent_saves: int):
+        assert max_concurrent_saves > 0
+        self._semaphore = threading.BoundedSemaphore(max_concurrent_saves)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_concurrent_saves, thread_name_prefix="oneflow_async_save"
+        )
+        self._buffer_pool = _SnapshotBufferPool()
+
+    def submit(
+        self,
+        obj: Any,
+        path: Path,
+        save_kwargs: Dict[str, Any],
+        callback: Optional[Callable[[Path], None]] = None,
+    ) -> concurrent.futures.Future:
+        if flow.env.get_rank() != 0:
+            # Only local tensors are snapshotted, which are the same on all
+            # ranks, so rank 0 writes and publishes the object alone. Other
+            # ranks must not publish into the same path, and collectives can
+            # not be called from the background threads, where they would be
+            # mixed up with the ones of training.
+            future = concurrent.futures.Future()
+            future.set_result(path)
+            return future
+        save_kwargs = dict(save_kwargs)
+        sharded = save_kwargs.pop("sharded", False)
+        # Block until there are fewer than `max_concurrent_saves` saves in
+        # progress, which bounds the host memory used by snapshots.
+        self._semaphore.acquire()
+        try:
+            snapshot, buffers = _snapshot(obj, self._buffer_pool)
+        except:
+            self._semaphore.release()
+            raise
+
+        def run():
+            tmp_path = path.with_name(f".{path.name}.tmp-{uuid.uuid4().hex}")
+            try:
+                if sharded:
+                    # No other rank writes, so there is no rank to wait for.
+                    _save_sharded(
+                        snapshot,
+                        tmp_path,
+                        save_kwargs.get("num_threads"),
+                        save_kwargs.get("max_inflight_bytes", 1024 ** 3),
+                        sync_ranks=False,
+                    )
+                else:
+                    save(snapshot, tmp_path, **save_kwargs)
+                _fsync_path(tmp_path)
+                _publish(tmp_path, path)
+                if callback is not None:
+                    callback(path)
+                return path
+            except:
+                _remove_path(tmp_path)
+                raise
+            finally:
+                self._buffer_pool.release(buffers)
+                self._semaphore.release()
+
+        return self._executor.submit(run)
+
+
+_default_async_saver = None
+
+
+def _get_default_async_saver() -> _AsyncSaver:
+    global _default_async_saver
+    if _default_async_saver is None:
+        _default_async_saver = _AsyncSaver(max_concurrent_saves=1)
+    return _default_async_saver
+
+
+class CheckpointManager:
+    r"""Saves checkpoints into `root_dir` asynchronously.
+
+    `save` snapshots the tensors to host buffers (pinned for cuda tensors, and
+    reused across checkpoints) and returns a future immediately, while the
+    serialization and fsync run in background threads. A checkpoint is written
+    to a temporary path and renamed to `root_dir/{prefix}_{step}` atomically
+    when completed, so an interrupted save never leaves a partial checkpoint.
+
+    Only local tensors are saved, which are the same on all ranks, so rank 0
+    writes the checkpoints alone, also in the sharded format, and :meth:`wait`
+    synchronizes all ranks.
+
+    Args:
+        root_dir (str or os.PathLike): the directory of checkpoints.
+        keep_last_n (int, optional): the number of latest completed checkpoints
+            to keep, older ones are removed. Default: None, keep all
+        max_concurrent_saves (int): the maximum number of checkpoints being
+            saved at the same time, `save` blocks when it is reached. Default: 1
+        prefix (str): the prefix of checkpoint names. Default: "checkpoint"
+        **save_kwargs: other arguments passed to :func:`oneflow.save`, such as
+            `save_as_external_data` and `sharded`.
+
+    For example:
+
+    .. code-block:: python
+
+        >>> import oneflow as flow
+        >>> manager = flow.CheckpointManager("./ckpts", keep_last_n=2)  # doctest: +SKIP
+        >>> for step in range(10):  # doctest: +SKIP
+        ...     train_one_step()
+        ...     manager.save(model.state_dict(), step)
+        >>> manager.wait()  # doctest: +SKIP
+        >>> model.load_state_dict(manager.load_latest())  # doctest: +SKIP
+
+    """
+
+    def __init__(
+        self,
+        root_dir: Union[str, os.PathLike],
+        *,
+        keep_last_n: Optional[int] = None,
+        max_concurrent_saves: int = 1,
+        prefix: str = "checkpoint",
+        **save_kwargs,
+    ):
+        assert keep_last_n is None or keep_last_n > 0
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.keep_last_n = keep_last_n
+        self.prefix = prefix
+        self._save_kwargs = save_kwargs
+        self._saver = _AsyncSaver(max_concurrent_saves)
+        self._futures = []
+        self._lock = threading.Lock()
+
+    def save(self, obj: Any, step: int) -> concurrent.futures.Future:
+        r"""Saves `obj` as the checkpoint of `step` asynchronously, returns a
+        future of the path of the checkpoint.
+        """
+        path = self.root_dir / f"{self.prefix}_{step}"
+        future = self._saver.submit(
+            obj, path, self._save_kwargs, callback=self._apply_retention
+        )
+        self._futures = [f for f in self._futures if not f.done()] + [future]
+        return future
+
+    def wait(self) -> None:
+        r"""Waits for all checkpoints in progress, and raises the first error
+        of them if any. All ranks must call it together, as checkpoints are
+        written by rank 0.
+        """
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+        # Checkpoints are written by rank 0, which other ranks wait for.
+        if flow.env.get_world_size() > 1:
+            flow.comm.barrier()
+
+    def checkpoints(self) -> List[Path]:
+        r"""Returns the paths of completed checkpoints sorted by step."""
+        steps = []
+        for child in self.root_dir.iterdir():
+            name, _, step = child.name.rpartition("_")
+            if name == self.prefix and step.isdigit():
+                steps.append(int(step))
+        return [self.root_dir / f"{self.prefix}_{step}" for step in sorted(steps)]
+
+    def latest(self) -> Optional[Path]:
+        r"""Returns the path of the latest completed checkpoint."""
+        checkpoints = self.checkpoints()
+        return checkpoints[-1] if len(checkpoints) > 0 else None
+
+    def load_latest(self, **load_kwargs) -> Any:
+        r"""Loads the latest completed checkpoint with :func:`oneflow.load`."""
+        path = self.latest()
+        if path is None:
+            raise FileNotFoundError(f"No checkpoint in {self.root_dir}")
+        return load(path, **load_kwargs)
+
+    def _apply_retention(self, path: Path) -> None:
+        if self.keep_last_n is None:
+            return
+        with self._lock:
+            for old_path in self.checkpoints()[: -self.keep_last_n]:
+                _remove_path(old_path)
+
+
 def _save_graph(obj: graph_util.Graph, path: Union[str, Path]):
     path: Path = Path(path)
     graph: graph_util.Graph = obj
@@ -783,11 +1662,24 @@ class ContextData:
         global_rank: Optional[int],
         map_location: Optional[Union[str, flow.device, flow.placement]],
         save_as_external_data: bool,
+        mmap: bool = False,
+        *,
+        sharded_writer: Optional[_ShardedTensorWriter] = None,
+        sharded_index: Optional[Dict[str, Dict]] = None,
+        sbp: SBP_LIKE = None,
     ):
         self.path = path
         self.global_rank = global_rank
         self.map_location = map_location
         self.save_as_external_data = save_as_external_data
+        self.mmap = mmap
+        self.sharded_writer = sharded_writer
+        self.sharded_index = sharded_index
+        self.sbp = sbp
+
+
+_thread_local = threading.local()
 
 
-context_data = None
+def _get_context_data() -> Optional[ContextData]:
+    return getattr(_thread_local, "context_data", None)
@@ -0,0 +1,381 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import collections.abc
+import os
+import threading
+import weakref
+
+import numpy as np
+
+import oneflow as flow
+from oneflow.multiprocessing import shared_memory
+
+container_abcs = collections.abc
+string_classes = (str, bytes)
+
+# Every tensor in a slab starts at a multiple of this many bytes.
+_ALIGNMENT = 64
+# Slabs are allocated in multiples of this many bytes, so that small
+# fluctuations of the batch size do not make a slab grow again and again.
+_SLAB_GRANULARITY = 1 << 20
+
+
+def _align(n, alignment):
+    return (n + alignment - 1) // alignment * alignment
+
+
+def _is_arena_candidate(x):
+    return (
+        isinstance(x, flow.Tensor)
+        and not isinstance(x, flow.nn.Parameter)
+        and not x.is_global
+        and x.device.type == "cpu"
+        and x.nelement() > 0
+    )
+
+
+def _collect_tensors(data, tensors):
+    if _is_arena_candidate(data):
+        tensors[id(data)] = data
+    elif isinstance(data, string_classes):
+        return
+    elif isinstance(data, container_abcs.Mapping):
+        for sample in data.values():
+            _collect_tensors(sample, tensors)
+    elif isinstance(data, container_abcs.Sequence):
+        for sample in data:
+            _collect_tensors(sample, tensors)
+
+
+def _map_tensors(data, fn):
+    if _is_arena_candidate(data):
+        return fn(data)
+    elif isinstance(data, string_classes):
+        return data
+    elif isinstance(data, container_abcs.Mapping):
+        return {k: _map_tensors(sample, fn) for k, sample in data.items()}
+    elif isinstance(data, tuple) and hasattr(data, "_fields"):  # namedtuple
+        return type(data)(*(_map_tensors(sample, fn) for sample in data))
+    elif isinstance(data, tuple):
+        return tuple(_map_tensors(sample, fn) for sample in data)
+    elif isinstance(data, container_abcs.Sequence):
+        return [_map_tensors(sample, fn) for sample in data]
+    else:
+        return data
+
+
+class _ArenaTensor(object):
+    r"""Placeholder of a tensor whose data has been written into a slab of a
+    :class:`SharedMemoryArena`. Pickling it only sends the location of the data,
+    the receiver rebuilds a tensor viewing the slab without any copy.
+    """
+
+    def __init__(self, arena, slab_index, offset, shape, dtype, requires_grad):
+        self.arena = arena
+        self.slab_index = slab_index
+        self.offset = offset
+        self.shape = shape
+        self.dtype = dtype
+        self.requires_grad = requires_grad
+
+    def __reduce__(self):
+        slab = self.arena.slabs_[self.slab_index]
+        return (
+            rebuild_arena_tensor,
+            (
+                self.arena.owner_pid,
+                self.arena.control_.name,
+                self.arena.num_slabs,
+                self.slab_index,
+                slab.name,
+                slab.size,
+                self.offset,
+                self.shape,
+                self.dtype,
+                self.requires_grad,
+            ),
+        )
+
+
+class SharedMemoryArena(object):
+    r"""A ring of pre-allocated shared memory slabs owned by one producer
+    process, e.g. a DataLoader worker.
+
+    :meth:`pack` writes all the tensors of a batch into one free slab and replaces
+    them by placeholders which are pickled as ``(slab, offset, shape, dtype)``,
+    so sending a batch to another process neither creates nor unlinks any shared
+    memory. The receiver rebuilds the tensors as views of the slab and the slab
+    is handed back to the producer once all of them have been released.
+
+    The number of outstanding tensors of every slab lives in a small control
+    block in shared memory. It is only set by the producer when a slab is free
+    (zero) and only decreased by the consumer after that, so no cross-process
+    lock is needed. When no slab is free, e.g. because the consumer holds many
+    batches, :meth:`pack` returns the batch unchanged and it is sent through the
+    regular per-tensor shared memory path.
+
+    Args:
+        num_slabs (int): number of slabs in the ring.
+        min_slab_size (int): minimal size in bytes of a slab. Slabs are created
+            lazily and grow to the size of the largest batch written into them.
+    """
+
+    def __init__(self, num_slabs, min_slab_size=_SLAB_GRANULARITY):
+        assert num_slabs > 0, "num_slabs must be positive"
+        self.num_slabs = num_slabs
+        self.min_slab_size = min_slab_size
+        self.owner_pid = os.getpid()
+        self.control_ = shared_memory.SharedMemory(
+            create=True, size=num_slabs * np.dtype(np.int32).itemsize
+        )
+        self.refcnts_ = np.ndarray(
+            (num_slabs,), dtype=np.int32, buffer=self.control_.buf
+        )
+        self.refcnts_[:] = 0
+        self.slabs_ = [None] * num_slabs
+        self.next_slab_ = 0
+        self.max_batch_nbytes_ = 0
+        self._reset_batch()
+        self.num_packed = 0
+        self.num_fallbacks = 0
+        self.num_slab_allocations = 0
+
+    def _acquire_slab(self, nbytes, exclude=None):
+        for i in range(self.num_slabs):
+            slab_index = (self.next_slab_ + i) % self.num_slabs
+            if slab_index == exclude or self.refcnts_[slab_index] != 0:
+                continue
+            slab = self.slabs_[slab_index]
+            if slab is None or slab.size < nbytes:
+                # The slab is free, so the consumer has no tensor viewing it and
+                # it can be replaced by a larger one.
+                if slab is not None:
+                    slab.close()
+                    slab.unlink()
+                size = _align(max(nbytes, self.min_slab_size), _SLAB_GRANULARITY)
+                self.slabs_[slab_index] = shared_memory.SharedMemory(
+                    create=True, size=size
+                )
+                self.num_slab_allocations += 1
+            self.next_slab_ = (slab_index + 1) % self.num_slabs
+            return slab_index
+        return None
+
+    def allocate(self, shape, dtype):
+        r"""Returns a tensor of ``shape`` and numpy ``dtype`` viewing the slab of
+        the batch being built, or ``None`` if it does not fit. The first call after
+        :meth:`pack` picks a free slab as large as the largest batch seen so far.
+        It can be passed to
+        :func:`oneflow.utils.data._utils.collate.collate_buffer_allocator` to
+        collate batches directly into shared memory.
+        """
+        if self.batch_slab_ is None:
+            self.batch_slab_ = self._acquire_slab(self.max_batch_nbytes_)
+            if self.batch_slab_ is None:
+                return None
+        slab = self.slabs_[self.batch_slab_]
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        if nbytes == 0 or self.batch_nbytes_ + nbytes > slab.size:
+            # Count it anyway, so that the next batch gets a slab large enough.
+            self.batch_overflow_nbytes_ += nbytes
+            return None
+        offset = self.batch_nbytes_
+        array = np.ndarray(shape, dtype=dtype, buffer=slab.buf, offset=offset)
+        tensor = flow.from_numpy(array)
+        self.batch_tensors_[id(tensor)] = (tensor, array, offset)
+        self.batch_nbytes_ = _align(offset + nbytes, _ALIGNMENT)
+        return tensor
+
+    def _reset_batch(self):
+        self.batch_slab_ = None
+        self.batch_nbytes_ = 0
+        self.batch_overflow_nbytes_ = 0
+        self.batch_tensors_ = {}
+
+    def pack(self, data):
+        r"""Writes the local cpu tensors in ``data`` into a free slab and returns
+        ``data`` with these tensors replaced by picklable placeholders. Nested
+        mappings, namedtuples, tuples and lists are supported. Tensors returned by
+        :meth:`allocate` since the last call are already in the slab and are not
+        copied again.
+        """
+        tensors = {}
+        _collect_tensors(data, tensors)
+        slab_index = self.batch_slab_
+        in_slab = {
+            key: self.batch_tensors_[key][1:]
+            for key in tensors
+            if key in self.batch_tensors_
+        }
+        nbytes = self.batch_nbytes_
+        self.max_batch_nbytes_ = max(
+            self.max_batch_nbytes_, nbytes + self.batch_overflow_nbytes_
+        )
+        self._reset_batch()
+        if len(tensors) == 0:
+            return data
+
+        arrays = {key: array for (key, (array, _)) in in_slab.items()}
+        offsets = {key: offset for (key, (_, offset)) in in_slab.items()}
+        to_copy = [key for key in tensors if key not in in_slab]
+        for key in to_copy:
+            arrays[key] = tensors[key].numpy()
+            offsets[key] = nbytes
+            nbytes = _align(nbytes + arrays[key].nbytes, _ALIGNMENT)
+        self.max_batch_nbytes_ = max(self.max_batch_nbytes_, nbytes)
+        if slab_index is None or nbytes > self.slabs_[slab_index].size:
+            # Lay out all the tensors again in a slab large enough. The slab of
+            # the batch is excluded since the tensors to copy may view it.
+            to_copy = list(tensors.keys())
+            nbytes = 0
+            for key in to_copy:
+                offsets[key] = nbytes
+                nbytes = _align(nbytes + arrays[key].nbytes, _ALIGNMENT)
+            slab_index = self._acquire_slab(nbytes, exclude=slab_index)
+            if slab_index is None:
+                self.num_fallbacks += 1
+                if len(in_slab) == 0:
+                    return data
+                # The slab of the batch is still free and may be overwritten
+                # before the batch is pickled, so copy the tensors viewing it.
+                return _map_tensors(
+                    data,
+                    lambda t: flow.from_numpy(t.numpy().copy())
+                    if id(t) in in_slab
+                    else t,
+                )
+
+        buf = self.slabs_[slab_index].buf
+        for key in to_copy:
+            array = arrays[key]
+            dst = np.ndarray(
+                array.shape, dtype=array.dtype, buffer=buf, offset=offsets[key]
+            )
+            dst[...] = array
+        placeholders = {
+            key: _ArenaTensor(
+                self,
+                slab_index,
+                offsets[key],
+                arrays[key].shape,
+                arrays[key].dtype,
+                tensors[key].requires_grad,
+            )
+            for key in tensors
+        }
+        # Publish the slab only after all data has been written.
+        self.refcnts_[slab_index] = len(placeholders)
+        self.num_packed += 1
+        return _map_tensors(data, lambda t: placeholders[id(t)])
+
+    def close(self):
+        for slab in self.slabs_:
+            if slab is not None:
+                slab.close()
+                slab.unlink()
+        self.slabs_ = [None] * self.num_slabs
+        self.refcnts_ = None
+        self.control_.close()
+        self.control_.unlink()
+
+
+class _AttachedArena(object):
+    def __init__(self, owner_pid, control_name, num_slabs):
+        self.owner_pid = owner_pid
+        self.control = shared_memory.SharedMemory(
+            name=control_name,
+            create=False,
+            size=num_slabs * np.dtype(np.int32).itemsize,
+        )
+        self.refcnts = np.ndarray((num_slabs,), dtype=np.int32, buffer=self.control.buf)
+        self.slabs = [None] * num_slabs
+        self.num_live_tensors = 0
+        self.detached = False
+
+    def close(self):
+        self.refcnts = None
+        for slab in self.slabs:
+            if slab is not None:
+                slab.close()
+        self.slabs = []
+        self.control.close()
+
+
+# Arenas of producer processes attached by this process, by control block name.
+_attached_arenas = {}
+_attached_arenas_lock = threading.Lock()
+
+
+def rebuild_arena_tensor(
+    owner_pid,
+    control_name,
+    num_slabs,
+    slab_index,
+    slab_name,
+    slab_size,
+    offset,
+    shape,
+    dtype,
+    requires_grad,
+):
+    with _attached_arenas_lock:
+        arena = _attached_arenas.get(control_name)
+        if arena is None:
+            arena = _AttachedArena(owner_pid, control_name, num_slabs)
+            _attached_arenas[control_name] = arena
+        slab = arena.slabs[slab_index]
+        if slab is None or slab.name != slab_name:
+            # The producer has replaced the slab by a larger one.
+            if slab is not None:
+                slab.close()
+            slab = shared_memory.SharedMemory(
+                name=slab_name, create=False, size=slab_size
+            )
+            arena.slabs[slab_index] = slab
+        arena.num_live_tensors += 1
+
+    def release_slab():
+        with _attached_arenas_lock:
+            arena.refcnts[slab_index] -= 1
+            arena.num_live_tensors -= 1
+            if arena.detached and arena.num_live_tensors == 0:
+                arena.close()
+
+    arr = np.ndarray(shape, dtype=dtype, buffer=slab.buf, offset=offset)
+    t = flow.from_numpy(arr)
+    # The storage of the tensor holds the array until after its delete hooks
+    # run, and a slab can't be closed while the array exports its buffer, so
+    # the slab is released when the array itself is freed.
+    weakref.finalize(arr, release_slab).atexit = False
+    t.requires_grad = requires_grad
+    return t
+
+
+def detach_arenas(owner_pids):
+    r"""Forgets the arenas of the given producer processes, e.g. when the workers
+    of a DataLoader are shut down. Their slabs are unmapped as soon as the last
+    tensor viewing them is released.
+    """
+    owner_pids = set(owner_pids)
+    with _attached_arenas_lock:
+        for (control_name, arena) in list(_attached_arenas.items()):
+            if arena.owner_pid not in owner_pids:
+                continue
+            del _attached_arenas[control_name]
+            arena.detached = True
+            if arena.num_live_tensors == 0:
+                arena.close()
@@ -13,11 +13,24 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import bisect
+import concurrent.futures
+import fcntl
+import hashlib
+import inspect
+import json
 import os
+import shutil
+import time
+import uuid
+import warnings
 import weakref
-from collections import deque, OrderedDict
-from typing import Dict, Union
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
 
+from google.protobuf import text_format
+
+import oneflow.core.job.plan_pb2 as plan_pb
 from oneflow.framework.args_tree import ArgsTree
 from oneflow.framework.tensor import Tensor
 import oneflow as flow
@@ -29,58 +42,85 @@ class LRUCache(object):
     def __init__(self, cache_size, keep_the_1st=True):
         assert cache_size >= 2
         self.cache_size = cache_size
-        self.hash_map = dict()
+        # Ordered from the least recently used to the most recently used.
+        # All operations on it are O(1).
+        self.hash_map = OrderedDict()
         self.keep_the_1st = keep_the_1st
-        self.queue = deque()
+        # The 1st item is kept out of hash_map so that it is never popped.
+        self.first_key = None
+        self.first_value = None
+
+    def __len__(self):
+        return len(self.hash_map) + (0 if self.first_value is None else 1)
+
+    def __contains__(self, key):
+        return key in self.hash_map or (
+            self.first_value is not None and key == self.first_key
+        )
 
     def is_empty(self):
-        return len(self.hash_map) == 0
+        return len(self) == 0
 
     def is_full(self):
-        return len(self.hash_map) >= self.cache_size
-
-    def pop(self):
-        if len(self.queue) == 0:
-            return None
-        pop_key = self.queue.pop()
-        value = self.hash_map.pop(pop_key)
-        del value
-        return pop_key
+        return len(self) >= self.cache_size
+
+    def pop(self, evictable=None):
+        # Pops the least recently used key for which evictable(key) is True.
+        for pop_key in self.hash_map:
+            if evictable is None or evictable(pop_key):
+                del self.hash_map[pop_key]
+                return pop_key
+        return None
 
-    def set(self, key, value):
+    def set(self, key, value, evictable=None):
         new_key = None
         old_key = None
-        if key in self.hash_map:
+        if key in self:
             return new_key, old_key
 
         if self.is_full():
-            old_key = self.pop()
-            assert old_key is not None, f"Cache size is {self.cache_size}, at least 2."
+            old_key = self.pop(evictable)
+            assert old_key is not None, "No key of the full cache can be evicted."
         assert not self.is_full()
 
-        if not (self.keep_the_1st and self.is_empty()):
-            self.queue.appendleft(key)
-
         value._oneflow_graph_cache_order = LRUCache._cnt
         LRUCache._cnt += 1
-        self.hash_map[key] = value
+        if self.keep_the_1st and self.is_empty():
+            self.first_key = key
+            self.first_value = value
+        else:
+            self.hash_map[key] = value
         new_key = key
         return new_key, old_key
 
     def get(self, key):
-        if key in self.hash_map:
-            if key in self.queue:
-                self.queue.remove(key)
-                self.queue.appendleft(key)
-            return self.hash_map[key]
-
+        value = self.hash_map.get(key)
+        if value is not None:
+            self.hash_map.move_to_end(key)
+            return value
+        if self.first_value is not None and key == self.first_key:
+            return self.first_value
         return None
 
     def items(self):
+        if self.first_value is not None:
+            yield (self.first_key, self.first_value)
         for (key, value) in self.hash_map.items():
             yield (key, value)
 
 
+class _EagerBuildView(object):
+    # Runs Graph.build eagerly, modules of the graph resolve to the original nn.Module.
+    def __init__(self, graph):
+        object.__setattr__(self, "_graph", graph)
+
+    def __getattr__(self, name):
+        graph = object.__getattribute__(self, "_graph")
+        if name in graph._blocks:
+            return graph._blocks[name].to(flow.nn.Module)
+        return getattr(graph, name)
+
+
 class AvoidRecursiveCacheCall(object):
     def __init__(self, graph) -> None:
         self._g = graph
@@ -94,7 +134,15 @@ class AvoidRecursiveCacheCall(object):
 
 
 class GraphCache(object):
-    def __init__(self, base_graph, cache_size=10, enable_graph_shared=True):
+    def __init__(
+        self,
+        base_graph,
+        cache_size=10,
+        enable_graph_shared=True,
+        memory_budget: Optional[int] = None,
+        buckets: Optional["ShapeBuckets"] = None,
+        async_compile: bool = False,
+    ):
         assert base_graph is not None and isinstance(base_graph, weakref.ProxyTypes)
         self._base_graph = base_graph
 
@@ -103,21 +151,226 @@ class GraphCache(object):
 
         self._enable_shared = enable_graph_shared
 
+        # Max estimated memory bytes of all cached graphs, None means no limit.
+        self._memory_budget = memory_budget
+        self._memory_used = 0
+
+        # Statistics of each cache key, kept after its graph is evicted.
+        self._stats = OrderedDict()
+
+        # Pad inputs to buckets of shape to bound the number of compiled graphs.
+        self._buckets = buckets
+
+        # Compile graphs in a background thread and run eagerly until ready.
+        self._async_compile = async_compile
+        self._compile_executor = None
+        self._compile_futures = dict()
+
     def set_cache_size(self, cache_size):
         self._cache_size = cache_size
 
+    def set_memory_budget(self, memory_budget):
+        assert memory_budget is None or memory_budget > 0
+        self._memory_budget = memory_budget
+
     def enable_shared(self, enabled=True):
         self._enable_shared = enabled
 
+    def stats(self):
+        r"""Returns the statistics of each cache key.
+
+        Each item contains the hit count, compile count, last compile time in
+        seconds, estimated memory bytes (only when a memory budget is set), count
+        of eager runs while compiling in background and whether the graph of the
+        key is still cached.
+        """
+        return OrderedDict(
+            (key, dict(key_stats)) for (key, key_stats) in self._stats.items()
+        )
+
     def __call__(self, *args, **kwargs):
-        graph = self.get_graph(*args, **kwargs)
-        with AvoidRecursiveCacheCall(graph):
-            return graph(*args, **kwargs)
+        if self._buckets is not None:
+            args, kwargs, unpad = self._buckets.pad(args, kwargs)
+        if self._async_compile:
+            graph = self._get_compiled_graph_or_schedule(*args, **kwargs)
+        else:
+            graph = self.get_graph(*args, **kwargs)
+        if graph is None:
+            outputs = self._run_eagerly(*args, **kwargs)
+        else:
+            with AvoidRecursiveCacheCall(graph):
+                if not graph._is_compiled:
+                    self._compile_graph(graph, *args, **kwargs)
+                outputs = graph(*args, **kwargs)
+        if self._buckets is not None:
+            outputs = unpad(outputs)
+        return outputs
 
     def _compile(self, *args, **kwargs):
+        if self._buckets is not None:
+            args, kwargs, unpad = self._buckets.pad(args, kwargs)
         graph = self.get_graph(*args, **kwargs)
         with AvoidRecursiveCacheCall(graph):
-            return graph._compile(*args, **kwargs)
+            if graph._is_compiled:
+                outputs = graph._compile(*args, **kwargs)
+            else:
+                outputs = self._compile_graph(graph, *args, **kwargs)
+        if self._buckets is not None and outputs is not None:
+            outputs = unpad(outputs)
+        return outputs
+
+    def _compile_graph(self, graph, *args, **kwargs):
+        compile_start = time.perf_counter()
+        outputs = graph._compile(*args, **kwargs)
+        self._record_compile(graph, time.perf_counter() - compile_start)
+        return outputs
+
+    def _record_compile(self, graph, compile_time):
+        cache_key = graph._oneflow_graph_cache_key
+        key_stats = self._stats[cache_key]
+        key_stats["compiles"] += 1
+        key_stats["compile_time"] = compile_time
+        if self._memory_budget is not None:
+            key_stats["nbytes"] = _estimate_graph_nbytes(graph)
+            self._memory_used += key_stats["nbytes"]
+            self._evict_to_memory_budget()
+        self._base_graph._print(
+            0,
+            1,
+            lambda: self._base_graph._shallow_repr()
+            + f" graph cache with key {cache_key} is compiled, stats {key_stats}.",
+        )
+
+    def _get_compiled_graph_or_schedule(self, *args, **kwargs):
+        # Returns None if the graph of the inputs is not ready, the caller should
+        # run eagerly then.
+        if self._cache is None:
+            self._cache = LRUCache(self._cache_size)
+
+        cache_key = self.gen_key(*args, **kwargs)
+        graph = self._cache.get(cache_key)
+        if graph is None:
+            if self._is_base_graph_pending():
+                # Graphs are shared from the compiled base graph, so they
+                # can only be created after the base graph is compiled.
+                return None
+            graph = self._init_and_get_a_graph_in_cache(cache_key)
+            self._schedule_compile(graph, *args, **kwargs)
+            self._stats[cache_key]["eager_runs"] += 1
+            return None
+
+        key_stats = self._stats[cache_key]
+        future = self._compile_futures.get(cache_key)
+        if future is not None:
+            if not future.done():
+                key_stats["eager_runs"] += 1
+                return None
+            # Raises the error of compilation if any.
+            compile_time = future.result()
+            del self._compile_futures[cache_key]
+            self._record_compile(graph, compile_time)
+        key_stats["hits"] += 1
+        return graph
+
+    def _is_base_graph_pending(self):
+        if not self._enable_shared or self._cache.is_empty():
+            return False
+        base_future = self._compile_futures.get(self._cache.first_key)
+        return base_future is not None and not base_future.done()
+
+    def _schedule_compile(self, graph, *args, **kwargs):
+        if self._compile_executor is None:
+            # Building a job uses the global job build context of the session,
+            # so graphs are compiled one by one.
+            self._compile_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="oneflow_graph_compile"
+            )
+
+        def compile_in_background():
+            compile_start = time.perf_counter()
+            graph._compile_this_graph(*args, **kwargs)
+            return time.perf_counter() - compile_start
+
+        future = self._compile_executor.submit(compile_in_background)
+        self._compile_futures[graph._oneflow_graph_cache_key] = future
+        return future
+
+    def _run_eagerly(self, *args, **kwargs):
+        with flow.no_grad():
+            return self._base_graph.__class__.build(
+                _EagerBuildView(self._base_graph), *args, **kwargs
+            )
+
+    def precompile(self, inputs_list, wait=True):
+        r"""Compiles graphs of each ``(args, kwargs)`` in ``inputs_list`` ahead of use.
+
+        With async compile, compilations run in the background thread, and this
+        method waits for them if ``wait`` is True.
+        """
+        if self._cache is None:
+            self._cache = LRUCache(self._cache_size)
+
+        futures = []
+        for (args, kwargs) in inputs_list:
+            if self._buckets is not None:
+                args, kwargs, _ = self._buckets.pad(args, kwargs)
+            cache_key = self.gen_key(*args, **kwargs)
+            if cache_key in self._cache:
+                continue
+            if self._is_base_graph_pending():
+                self._compile_futures[self._cache.first_key].result()
+            graph = self._init_and_get_a_graph_in_cache(cache_key)
+            if self._async_compile:
+                futures.append(self._schedule_compile(graph, *args, **kwargs))
+            else:
+                with AvoidRecursiveCacheCall(graph):
+                    self._compile_graph(graph, *args, **kwargs)
+        if wait:
+            for future in futures:
+                future.result()
+        return futures
+
+    def _evict_to_memory_budget(self):
+        # Keep the base graph and the most recently used graph.
+        while self._memory_used > self._memory_budget and len(self._cache.hash_map) > 1:
+            old_key = self._cache.pop(self._is_evictable)
+            if old_key is None:
+                break
+            self._on_evicted(old_key)
+            self._base_graph._print(
+                0,
+                0,
+                self._base_graph._shallow_repr()
+                + f" cache is over memory budget({self._memory_budget} bytes), "
+                + f"has deleted an old graph cache with key {old_key}.",
+            )
+
+    def _is_evictable(self, key):
+        # A graph being compiled in background is not evicted, so that the
+        # compile is neither wasted nor its error lost.
+        future = self._compile_futures.get(key)
+        return future is None or future.done()
+
+    def _wait_for_an_evictable_graph(self):
+        if not self._cache.is_full() or any(
+            self._is_evictable(key) for key in self._cache.hash_map
+        ):
+            return
+        # All the graphs which can be evicted are being compiled, waits for the
+        # least recently used one.
+        least_recent_key = next(iter(self._cache.hash_map))
+        concurrent.futures.wait([self._compile_futures[least_recent_key]])
+
+    def _on_evicted(self, key):
+        future = self._compile_futures.pop(key, None)
+        key_stats = self._stats[key]
+        key_stats["cached"] = False
+        self._memory_used -= key_stats["nbytes"]
+        key_stats["nbytes"] = 0
+        if future is not None:
+            # Raises the error of compilation if any.
+            key_stats["compile_time"] = future.result()
+            key_stats["compiles"] += 1
 
     def runtime_state_dict(
         self, destination=None, with_eager=False,
@@ -141,6 +394,7 @@ class GraphCache(object):
             self._base_graph._shallow_repr()
             + f" is creating a graph cache with key {cache_key}.",
         )
+        self._wait_for_an_evictable_graph()
         cur_is_base = False
         if self._cache.is_empty():
             # Has no graph yet
@@ -156,13 +410,28 @@ class GraphCache(object):
             graph._dynamic_input_graph_cache = None
             graph._cached_init_args = None
             graph._cached_init_kwargs = None
+            if self._base_graph._disk_cache is not None:
+                graph.enable_disk_cache(self._base_graph._disk_cache)
 
         if self._enable_shared is True:
             if cur_is_base:
                 graph.enable_shared()
             else:
                 graph.share_from(self._base_graph)
-        new_key, old_key = self._cache.set(cache_key, graph)
+        graph._oneflow_graph_cache_key = cache_key
+        new_key, old_key = self._cache.set(cache_key, graph, self._is_evictable)
+        assert new_key is not None
+        key_stats = self._stats.setdefault(
+            cache_key,
+            {
+                "hits": 0,
+                "compiles": 0,
+                "compile_time": 0.0,
+                "nbytes": 0,
+                "eager_runs": 0,
+            },
+        )
+        key_stats["cached"] = True
         if old_key is not None:
             self._base_graph._print(
                 0,
@@ -170,7 +439,7 @@ class GraphCache(object):
                 self._base_graph._shallow_repr()
                 + f" cache is full(cache size {self._cache_size}), has deleted an old graph cache with key {old_key}.",
             )
-        assert new_key is not None
+            self._on_evicted(old_key)
 
         return graph
 
@@ -196,20 +465,35 @@ class GraphCache(object):
                 graph.load_runtime_state_dict(
                     sub_state_dict, warmup_with_run=warmup_with_run
                 )
+            if self._memory_budget is not None:
+                self._stats[cache_key]["nbytes"] = _estimate_graph_nbytes(graph)
+                self._memory_used += self._stats[cache_key]["nbytes"]
 
     def gen_key(self, *args, **kwargs):
-        flattened_shapes = []
+        # A compiled graph is specialized on the shape, dtype and device(or placement
+        # and sbp) of input tensors, and on the structure of inputs.
+        if len(kwargs) == 0 and all(isinstance(arg, Tensor) for arg in args):
+            # Fast path for inputs of a tuple of tensors.
+            return tuple(_tensor_meta(arg) for arg in args)
+
+        key = []
         args_tree = ArgsTree((args, kwargs), False)
         for arg in args_tree.iter_nodes():
             if isinstance(arg, Tensor):
-                flattened_shapes.append(arg.shape)
-        return tuple(flattened_shapes)
+                key.append(_tensor_meta(arg))
+            elif isinstance(arg, (list, tuple)):
+                key.append((type(arg).__name__, len(arg)))
+            elif isinstance(arg, dict):
+                key.append((type(arg).__name__, tuple(arg.keys())))
+            else:
+                key.append(_arg_key(arg))
+        return tuple(key)
 
     def get_graph(self, *args, **kwargs):
         if self._cache is None:
             self._cache = LRUCache(self._cache_size)
 
-        cache_key = hash(self.gen_key(*args, **kwargs))
+        cache_key = self.gen_key(*args, **kwargs)
         graph = self._cache.get(cache_key)
 
         # Create graph
@@ -218,8 +502,479 @@ class GraphCache(object):
                 0,
                 0,
                 self._base_graph._shallow_repr()
-                + " got a new input shape, is compiling a new graph.",
+                + " got a new input signature, is compiling a new graph.",
             )
             graph = self._init_and_get_a_graph_in_cache(cache_key)
+        else:
+            self._stats[cache_key]["hits"] += 1
 
         return graph
+
+
+class ShapeBuckets(object):
+    r"""Pads dynamic dimensions of inputs up to the nearest bucket boundary.
+
+    ``buckets`` maps the index of a positional input to a dict from a dimension of
+    that input to its sorted bucket boundaries, e.g. ``{0: {1: [32, 64, 128]}}``
+    pads the dim 1 of the 1st input to 32, 64 or 128. A size larger than the
+    largest boundary is not padded. Dimensions may be negative.
+
+    If ``mask_name`` is not None, validity masks are passed to the graph as the
+    keyword argument ``mask_name``. The mask of an input is a bool tensor with
+    the padded size in bucketed dimensions and size 1 in other dimensions, True
+    for valid positions. The mask is a tensor if one input is bucketed, else a
+    tuple of masks ordered by input index.
+
+    Outputs are only sliced back as declared by ``output_dims``, which maps the
+    index of an output, 0 for a single tensor output, to a dict from a dimension
+    of that output to the ``(input index, input dimension)`` it is padded like,
+    e.g. ``{0: {1: (0, 1)}}`` slices the dim 1 of the 1st output to the original
+    size of the dim 1 of the 1st input.
+    """
+
+    def __init__(
+        self,
+        buckets: Dict[int, Dict[int, List[int]]],
+        *,
+        pad_value=0,
+        mask_name: Optional[str] = "bucket_mask",
+        output_dims: Optional[Dict[int, Dict[int, Tuple[int, int]]]] = None,
+    ):
+        assert len(buckets) > 0, "buckets must not be empty."
+        self._buckets = OrderedDict()
+        for arg_idx in sorted(buckets):
+            assert isinstance(arg_idx, int), "buckets must be keyed by input index."
+            dims = OrderedDict()
+            for dim in sorted(buckets[arg_idx]):
+                boundaries = sorted(buckets[arg_idx][dim])
+                assert len(boundaries) > 0 and boundaries[0] > 0
+                dims[dim] = boundaries
+            self._buckets[arg_idx] = dims
+        self._pad_value = pad_value
+        self._mask_name = mask_name
+        self._output_dims = dict(output_dims or {})
+        for dims in self._output_dims.values():
+            for (arg_idx, _) in dims.values():
+                assert arg_idx in self._buckets, f"Input {arg_idx} is not bucketed."
+
+    def _bucket_size(self, size, boundaries):
+        idx = bisect.bisect_left(boundaries, size)
+        return boundaries[idx] if idx < len(boundaries) else size
+
+    def pad(self, args, kwargs):
+        r"""Returns padded args, kwargs with masks and a function to slice outputs."""
+        args = list(args)
+        masks = []
+        # (input index, dim) -> original size of the bucketed input dims.
+        original_sizes = dict()
+        input_ndims = dict()
+        for (arg_idx, dims) in self._buckets.items():
+            assert arg_idx < len(args) and isinstance(
+                args[arg_idx], Tensor
+            ), f"Input {arg_idx} is bucketed so it must be a tensor."
+            x = args[arg_idx]
+            assert x.is_local, "Only local tensors can be bucketed."
+            input_ndims[arg_idx] = x.ndim
+            padded_shape = list(x.shape)
+            mask_shape = [1] * x.ndim
+            bucketed_dims = set()
+            for (dim, boundaries) in dims.items():
+                dim = _normalize_dim(dim, x.ndim)
+                assert dim not in bucketed_dims, f"Dim {dim} is bucketed twice."
+                bucketed_dims.add(dim)
+                padded_shape[dim] = self._bucket_size(x.shape[dim], boundaries)
+                mask_shape[dim] = padded_shape[dim]
+                original_sizes[(arg_idx, dim)] = x.shape[dim]
+
+            valid_slices = tuple(
+                slice(0, x.shape[d]) if d in bucketed_dims else slice(None)
+                for d in range(x.ndim)
+            )
+            if tuple(padded_shape) != tuple(x.shape):
+                padded_x = flow.full(
+                    tuple(padded_shape), self._pad_value, dtype=x.dtype, device=x.device
+                )
+                padded_x[valid_slices] = x
+                args[arg_idx] = padded_x
+            if self._mask_name is not None:
+                mask = flow.zeros(tuple(mask_shape), dtype=flow.bool, device=x.device)
+                mask[valid_slices] = True
+                masks.append(mask)
+
+        if self._mask_name is not None:
+            kwargs = dict(kwargs)
+            kwargs[self._mask_name] = masks[0] if len(masks) == 1 else tuple(masks)
+
+        def unpad_tensor(out, dims):
+            assert isinstance(out, Tensor), "Only tensor outputs can be unpadded."
+            slices = [slice(None)] * out.ndim
+            for (out_dim, (arg_idx, in_dim)) in dims.items():
+                key = (arg_idx, _normalize_dim(in_dim, input_ndims[arg_idx]))
+                assert (
+                    key in original_sizes
+                ), f"Dim {in_dim} of input {arg_idx} is not bucketed."
+                slices[_normalize_dim(out_dim, out.ndim)] = slice(
+                    0, original_sizes[key]
+                )
+            return out[tuple(slices)]
+
+        def unpad(outputs):
+            if len(self._output_dims) == 0:
+                return outputs
+            if isinstance(outputs, Tensor):
+                assert list(self._output_dims) == [0], "The output is a single tensor."
+                return unpad_tensor(outputs, self._output_dims[0])
+            unpadded = list(outputs)
+            for (out_idx, dims) in self._output_dims.items():
+                unpadded[out_idx] = unpad_tensor(unpadded[out_idx], dims)
+            return type(outputs)(unpadded)
+
+        return tuple(args), kwargs, unpad
+
+
+def _normalize_dim(dim, ndim):
+    assert -ndim <= dim < ndim, f"Dim {dim} is out of range of {ndim} dims."
+    return dim % ndim
+
+
+class GraphDiskCache(object):
+    r"""A content-addressed on-disk cache of compiled nn.Graph runtime states.
+
+    Each entry is the ``runtime_state_dict`` of a compiled graph, stored in a
+    sub directory named by the cache key. An entry is published with an atomic
+    rename, so many processes on one host can share a cache directory: readers
+    only ever see complete entries, and a process losing a publish race just
+    drops its own copy. Eviction by total size and by age runs under an
+    exclusive file lock.
+    """
+
+    _entry_file = "runtime_state"
+    _meta_file = "meta.json"
+    _lock_file = ".lock"
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_size: Optional[int] = 10 * 1024 ** 3,
+        max_age: Optional[float] = None,
+    ):
+        assert max_size is None or max_size > 0, "max_size must be positive."
+        assert max_age is None or max_age > 0, "max_age must be positive."
+        self._cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        os.makedirs(self._cache_dir, exist_ok=True)
+        self._max_size = max_size
+        self._max_age = max_age
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "errors": 0,
+        }
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    def stats(self) -> Dict[str, int]:
+        r"""Returns a copy of the hit/miss/store/eviction/error counters."""
+        return dict(self._stats)
+
+    def gen_key(self, graph, *args, **kwargs) -> str:
+        r"""Generates the cache key of ``graph`` called with ``args`` and ``kwargs``.
+
+        The job proto only exists after tracing ``build()``, which already registers
+        the job in the session, so the key is made of what determines the traced job
+        instead: the graph name and class, the sources of ``build()`` and of the
+        modules' ``forward()``, the public attributes of the graph, the
+        ``training`` flag, ``extra_repr()`` and public attributes of every module,
+        the meta of states and inputs, the graph config, ``ONEFLOW_*`` environment
+        variables and the oneflow version.
+
+        Attributes which are neither plain values nor containers of them are only
+        keyed by type, so control flow in ``build()`` should depend on plain
+        values.
+        """
+        hasher = hashlib.sha256()
+
+        def update(item):
+            hasher.update(repr(item).encode("utf-8"))
+            hasher.update(b"\0")
+
+        update(flow.__version__)
+        update(graph.name)
+        graph_cls = type(graph)
+        update(graph_cls.__module__ + "." + graph_cls.__qualname__)
+        update(_get_source(graph_cls.build))
+        update(graph.training)
+        update((graph._enable_shared_from_this, graph._build_with_shared_graph))
+        update(_attrs_key(graph))
+
+        module_classes = set()
+        for name, block in graph._blocks.items():
+            update(name)
+            for module_name, module in block.to(flow.nn.Module).named_modules():
+                module_classes.add(type(module))
+                # Hyperparameters such as strides or dropout rates are not states.
+                update((module_name, module.training, module.extra_repr()))
+                update(_attrs_key(module))
+        for module_cls in sorted(
+            module_classes, key=lambda c: c.__module__ + "." + c.__qualname__
+        ):
+            update(module_cls.__module__ + "." + module_cls.__qualname__)
+            update(_get_source(module_cls.forward))
+        for name, block in graph._blocks.items():
+            for state_name, state in block.to(flow.nn.Module).state_dict().items():
+                update((name, state_name, _tensor_meta(state)))
+
+        update(text_format.MessageToString(graph.config.proto))
+        for env_name in sorted(os.environ):
+            if env_name.startswith("ONEFLOW_") and env_name != _DISK_CACHE_DIR_ENV:
+                update((env_name, os.environ[env_name]))
+
+        for arg in ArgsTree((args, kwargs), False).iter_nodes():
+            if isinstance(arg, Tensor):
+                update(_tensor_meta(arg))
+            elif isinstance(arg, (list, tuple)):
+                update((type(arg).__name__, len(arg)))
+            elif isinstance(arg, dict):
+                update((type(arg).__name__, tuple(arg.keys())))
+            else:
+                update(arg)
+        return hasher.hexdigest()
+
+    def load(self, key: str):
+        r"""Returns the runtime state dict cached with ``key``, or None on a miss."""
+        entry_dir = os.path.join(self._cache_dir, key)
+        try:
+            state_dict = flow.load(os.path.join(entry_dir, self._entry_file))
+            # Touch the entry to make eviction least-recently-used.
+            os.utime(os.path.join(entry_dir, self._meta_file))
+        except FileNotFoundError:
+            self._stats["misses"] += 1
+            return None
+        except Exception as e:
+            warnings.warn(
+                f"nn.Graph disk cache failed to load entry {entry_dir}, "
+                f"will compile instead: {e}"
+            )
+            self._stats["errors"] += 1
+            self._stats["misses"] += 1
+            return None
+        self._stats["hits"] += 1
+        return state_dict
+
+    def store(self, key: str, state_dict) -> bool:
+        r"""Publishes ``state_dict`` with ``key``.
+
+        Returns False if the entry exists or has been published by another process.
+        """
+        entry_dir = os.path.join(self._cache_dir, key)
+        if os.path.isdir(entry_dir):
+            return False
+        tmp_dir = os.path.join(
+            self._cache_dir, f".tmp-{key}-{os.getpid()}-{uuid.uuid4().hex}"
+        )
+        published = False
+        try:
+            os.makedirs(tmp_dir)
+            entry_path = os.path.join(tmp_dir, self._entry_file)
+            flow.save(state_dict, entry_path)
+            meta = {
+                "graph_name": state_dict["graph_name"],
+                "oneflow_version": flow.__version__,
+                "created": time.time(),
+                "size": os.path.getsize(entry_path),
+            }
+            with open(os.path.join(tmp_dir, self._meta_file), "w") as f:
+                json.dump(meta, f)
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.rename(tmp_dir, entry_dir)
+                published = True
+            except OSError:
+                # Another process has published the same key.
+                pass
+        except Exception as e:
+            warnings.warn(f"nn.Graph disk cache failed to store entry {entry_dir}: {e}")
+            self._stats["errors"] += 1
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        if published:
+            self._stats["stores"] += 1
+            self.evict()
+        return published
+
+    def evict(self) -> int:
+        r"""Removes expired entries, then least recently used entries until the
+        cache fits in ``max_size``. Returns the number of evicted entries.
+        """
+        evicted = 0
+        with open(os.path.join(self._cache_dir, self._lock_file), "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                entries = []
+                for name in os.listdir(self._cache_dir):
+                    meta_path = os.path.join(self._cache_dir, name, self._meta_file)
+                    if name.startswith(".") or not os.path.isfile(meta_path):
+                        continue
+                    entries.append(
+                        (
+                            os.path.getmtime(meta_path),
+                            _dir_size(os.path.join(self._cache_dir, name)),
+                            name,
+                        )
+                    )
+                entries.sort()
+                total_size = sum(size for (_, size, _) in entries)
+                now = time.time()
+                for (used_time, size, name) in entries:
+                    expired = (
+                        self._max_age is not None and now - used_time > self._max_age
+                    )
+                    oversized = (
+                        self._max_size is not None and total_size > self._max_size
+                    )
+                    if not (expired or oversized):
+                        continue
+                    self._remove_entry(name)
+                    total_size -= size
+                    evicted += 1
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+        self._stats["evictions"] += evicted
+        return evicted
+
+    def clear(self) -> None:
+        r"""Removes all entries of the cache directory."""
+        with open(os.path.join(self._cache_dir, self._lock_file), "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                for name in os.listdir(self._cache_dir):
+                    if not name.startswith("."):
+                        self._remove_entry(name)
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _remove_entry(self, name):
+        # Rename first so that readers never see a half-removed entry.
+        trash_dir = os.path.join(
+            self._cache_dir, f".trash-{name}-{os.getpid()}-{uuid.uuid4().hex}"
+        )
+        try:
+            os.rename(os.path.join(self._cache_dir, name), trash_dir)
+        except OSError:
+            return
+        shutil.rmtree(trash_dir, ignore_errors=True)
+
+
+_DISK_CACHE_DIR_ENV = "ONEFLOW_NNGRAPH_DISK_CACHE_DIR"
+
+
+def _get_source(func):
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return getattr(func, "__qualname__", repr(func))
+
+
+def _plain_value_key(value):
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return (type(value).__name__, repr(value))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_plain_value_key(v) for v in value))
+    if isinstance(value, dict):
+        return (
+            "dict",
+            tuple((repr(k), _plain_value_key(v)) for (k, v) in value.items()),
+        )
+    if isinstance(value, (flow.dtype, flow.device)):
+        return repr(value)
+    # The repr of other objects may contain their addresses.
+    return type(value).__module__ + "." + type(value).__qualname__
+
+
+def _attrs_key(obj):
+    # Public python attributes may be hyperparameters or drive control flow.
+    return tuple(
+        (name, _plain_value_key(value))
+        for (name, value) in sorted(vars(obj).items())
+        if not name.startswith("_")
+        and name != "training"
+        and not isinstance(value, (Tensor, flow.nn.Module))
+    )
+
+
+def _advance_id_state(id_state):
+    # Ids are only moved forward, as graphs compiled before in this process
+    # already use the ids below the current state.
+    current = flow._oneflow_internal.get_id_state()
+    for name in (
+        "regst_desc_id_state",
+        "mem_block_id_state",
+        "chunk_id_state",
+        "job_id_state",
+    ):
+        setattr(id_state, name, max(getattr(id_state, name), getattr(current, name)))
+    for name in ("task_index_state", "stream_index_state"):
+        index_state = getattr(id_state, name)
+        for (k, v) in getattr(current, name).items():
+            index_state[k] = max(index_state.get(k, 0), v)
+        setattr(id_state, name, index_state)
+    return id_state
+
+
+def _tensor_meta(tensor):
+    if tensor.is_global:
+        return (
+            tuple(tensor.shape),
+            repr(tensor.dtype),
+            repr(tensor.placement),
+            repr(tensor.sbp),
+        )
+    return (tuple(tensor.shape), repr(tensor.dtype), repr(tensor.device))
+
+
+def _arg_key(arg):
+    # 1, 1.0 and True are equal keys of a dict, so the type is a part of the key.
+    # Floats are keyed by repr, as NaN is not equal to itself.
+    if isinstance(arg, float):
+        return ("float", repr(arg))
+    try:
+        hash(arg)
+    except TypeError:
+        return (type(arg).__name__, repr(arg))
+    return (type(arg).__name__, arg)
+
+
+def _estimate_graph_nbytes(graph):
+    # Device memory of a compiled graph is allocated by chunks and by memory blocks
+    # out of chunks in its plan, blocks shared with eager variables are not counted.
+    plan = plan_pb.Plan()
+    plan.ParseFromString(graph._c_nn_graph.plan)
+    rank = flow.env.get_rank()
+    nbytes = 0
+    for chunk in plan.block_chunk_list.chunk:
+        if chunk.machine_id == rank:
+            nbytes += chunk.mem_size
+    for mem_block in plan.block_chunk_list.mem_block:
+        if (
+            mem_block.machine_id == rank
+            and mem_block.chunk_id == -1
+            and mem_block.variable_op_name == ""
+        ):
+            nbytes += mem_block.mem_size
+    return nbytes
+
+
+def _dir_size(path):
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return size
@@ -22,7 +22,7 @@ import inspect
 import weakref
 from collections import OrderedDict
 from functools import partial, wraps
-from typing import Dict, Optional, Union, List, Callable
+from typing import Dict, Optional, Union, List, Callable, Tuple
 from google.protobuf import text_format
 from copy import deepcopy
 
@@ -53,7 +53,7 @@ from oneflow.nn.graph.util import (
     seq_to_func_return,
     sys_exc_error_msg,
 )
-from oneflow.framework.args_tree import ArgsTree
+from oneflow.framework.args_tree import ArgsTree, ArgSpec
 from oneflow.nn.modules.module import Module
 from oneflow.nn.optimizer.lr_scheduler import LRScheduler
 from oneflow.optim.optimizer import Optimizer
@@ -181,6 +181,16 @@ class Graph(object):
         # For run graph with dynamic shape cache
         self._run_with_cache = False
 
+        # Precomputed in the first run to reduce the overhead of each run.
+        self._input_arg_spec = None
+        self._output_arg_spec = None
+        self._run_graph_by_vm = False
+
+        # For load compiled graph from a disk cache.
+        self._disk_cache = None
+        if os.getenv("ONEFLOW_NNGRAPH_DISK_CACHE_DIR"):
+            self.enable_disk_cache(os.getenv("ONEFLOW_NNGRAPH_DISK_CACHE_DIR"))
+
         # For debug
         self._debug = False
         self._debug_min_s_level = 2
@@ -835,17 +845,129 @@ class Graph(object):
         if self._run_with_cache == True:
             return self._dynamic_input_graph_cache._compile(*args, **kwargs)
 
+        return self._compile_this_graph(*args, **kwargs)
+
+    def _compile_this_graph(self, *args, **kwargs):
+        # NOTE: Graph cache may call it from a background thread, so it must not
+        # change _run_with_cache.
         if not self._is_compiled:
+            disk_cache_key = None
+            if self._disk_cache is not None and self.__is_disk_cache_usable():
+                disk_cache_key = self._disk_cache.gen_key(self, *args, **kwargs)
+                state_dict = self._disk_cache.load(disk_cache_key)
+                if state_dict is not None:
+                    return self.__load_from_disk_cache(
+                        disk_cache_key, state_dict, *args, **kwargs
+                    )
+                self.__print(
+                    0,
+                    0,
+                    self._shallow_repr()
+                    + f" missed disk cache with key {disk_cache_key}.",
+                )
+
             if not self._build_with_shared_graph:
-                return self._compile_new(*args, **kwargs)
+                outputs = self._compile_new(*args, **kwargs)
             else:
-                return self._compile_from_shared(*args, **kwargs)
+                outputs = self._compile_from_shared(*args, **kwargs)
+
+            if disk_cache_key is not None:
+                self._disk_cache.store(
+                    disk_cache_key, self.runtime_state_dict(with_eager=False)
+                )
+            return outputs
         else:
             warnings.warn(
                 f"{self._shallow_repr()} has been compiled, no need to compile again."
             )
             return
 
+    def enable_disk_cache(
+        self,
+        cache_dir: Optional[str] = None,
+        *,
+        max_size: Optional[int] = 10 * 1024 ** 3,
+        max_age: Optional[float] = None,
+    ) -> None:
+        r"""Look up compiled graphs in an on-disk cache before compiling.
+
+        At compile time, a cache key is generated from the graph, its inputs' meta,
+        its config and the oneflow version. On a hit, the compiled plan is loaded with
+        ``load_runtime_state_dict`` instead of being compiled. On a miss, the graph
+        is compiled and its ``runtime_state_dict`` is published to the cache. The
+        cache directory can be shared by many processes on one host.
+
+        The disk cache can also be enabled for all graphs by setting the environment
+        variable ``ONEFLOW_NNGRAPH_DISK_CACHE_DIR``.
+
+        Note:
+            Only graphs without optimizer running on a single process use the disk
+            cache. The graph name is part of the cache key, so graphs should be
+            created in the same order across process restarts to hit the cache.
+
+        Args:
+            cache_dir (str or GraphDiskCache): the cache directory, or a cache object
+                to share with other graphs. ``None`` disables the disk cache.
+            max_size (int, optional): max total bytes of the cache directory. Least
+                recently used entries are evicted above it. Default: 10 GiB.
+            max_age (float, optional): entries not used for ``max_age`` seconds are
+                evicted. Default: ``None``, no eviction by age.
+        """
+        assert (
+            not self._is_compiled
+        ), " enable_disk_cache must be set before graph compile."
+        import oneflow.nn.graph.cache as cache
+
+        if cache_dir is None:
+            self._disk_cache = None
+            return
+        if isinstance(cache_dir, cache.GraphDiskCache):
+            self._disk_cache = cache_dir
+        else:
+            self._disk_cache = cache.GraphDiskCache(
+                cache_dir, max_size=max_size, max_age=max_age
+            )
+        # Cache entries are runtime state dicts.
+        self.enable_save_runtime_state_dict(True)
+
+    def __is_disk_cache_usable(self):
+        if self.training:
+            self.__print(
+                1,
+                0,
+                f"[WARNING]{self._shallow_repr()} has optimizer, disk cache is skipped.",
+            )
+            return False
+        if oneflow.env.get_world_size() > 1:
+            self.__print(
+                1,
+                0,
+                f"[WARNING]{self._shallow_repr()} runs with multiple processes, disk cache is skipped.",
+            )
+            return False
+        return True
+
+    def __load_from_disk_cache(self, disk_cache_key, state_dict, *args, **kwargs):
+        self.__print(
+            0, 0, self._shallow_repr() + f" hit disk cache with key {disk_cache_key}.",
+        )
+        if (
+            len(args) != 0
+            and len(kwargs) == 0
+            and all(isinstance(arg, Tensor) for arg in args)
+        ):
+            self._is_simple_tuple_input = True
+        import oneflow.nn.graph.cache as cache
+
+        state_dict["id_state"] = cache._advance_id_state(state_dict["id_state"])
+        self.load_runtime_state_dict(state_dict)
+        eager_outputs = seq_to_func_return(self._eager_outputs_buffer[0], True)
+        if isinstance(eager_outputs, (tuple, list)) and all(
+            isinstance(arg, Tensor) for arg in eager_outputs
+        ):
+            self._is_simple_tuple_output = True
+        return eager_outputs
+
     def _compile_new(self, *args, **kwargs):
         if (
             len(args) != 0
@@ -1676,14 +1798,33 @@ class Graph(object):
                     item, "graph_ouputs_buffer_" + str(b_idx) + "_" + str(i_idx)
                 )
 
+    def __prepare_run_spec(self, *args, **kwargs):
+        # NOTE: Precompute the flatten plan of inputs and the unflatten plan of
+        # outputs once, to reduce the overhead of traversal and parsing of io args
+        # in each run.
+        self._input_arg_spec = ArgSpec((args, kwargs))
+        self._output_arg_spec = ArgSpec(self._eager_outputs_buffer[0])
+        self._run_graph_by_vm = oneflow.support.env_var_util.parse_boolean_from_env(
+            "ONEFLOW_RUN_GRAPH_BY_VM", False
+        )
+
     def __run(self, *args, **kwargs):
         try:
-            flattened_eager_args = self.__ensure_input_tensors_contiguous_and_flatten(
-                *args, **kwargs
-            )
-            if oneflow.support.env_var_util.parse_boolean_from_env(
-                "ONEFLOW_RUN_GRAPH_BY_VM", False
+            if self._input_arg_spec is None:
+                self.__prepare_run_spec(*args, **kwargs)
+            if (
+                self._is_simple_tuple_input
+                and len(kwargs) == 0
+                and len(args) == self._input_arg_spec.num_tensors
+                and all(isinstance(arg, Tensor) for arg in args)
             ):
+                flattened_eager_args = args
+            else:
+                flattened_eager_args = self._input_arg_spec.flatten((args, kwargs))
+            for arg in flattened_eager_args:
+                if not arg.is_contiguous():
+                    arg.contiguous_()
+            if self._run_graph_by_vm:
                 eager_outputs = oneflow._oneflow_internal.nn.graph.RunLazyNNGraphByVM(
                     convert_to_tensor_tuple(flattened_eager_args), self._c_nn_graph,
                 )
@@ -1691,9 +1832,6 @@ class Graph(object):
                 outputs_tensor_tuple = self._outputs_tensor_tuple_buffer[
                     self._cur_index_of_ouputs_buffer
                 ]
-                eager_outputs = self._eager_outputs_buffer[
-                    self._cur_index_of_ouputs_buffer
-                ]
                 # oneflow._oneflow_internal.eager.Sync() NOTE(chengcheng): Need Sync?
                 oneflow._oneflow_internal.nn.graph.RunLazyNNGraph(
                     convert_to_tensor_tuple(flattened_eager_args),
@@ -1706,7 +1844,9 @@ class Graph(object):
                     self._cur_index_of_ouputs_buffer = 0
 
                 # Copy outputs from buffer
-                eager_outputs, _ = self.__copy_io("output", *eager_outputs)
+                with oneflow._oneflow_internal.lazy_mode.guard(False):
+                    copied_outputs = [t.to(copy=True) for t in outputs_tensor_tuple]
+                eager_outputs = self._output_arg_spec.unflatten(copied_outputs)
 
                 # Make sure that last used devices of tensors in `outputs_tensor_tuple` are
                 # "critical_section".
@@ -1900,14 +2040,6 @@ class Graph(object):
 
         return self.__map_io(io_type, func, *args, **kwargs)
 
-    def __copy_io(self, io_type, *args, **kwargs):
-        def func(tensor):
-            with oneflow._oneflow_internal.lazy_mode.guard(False):
-                build_arg = tensor.to(copy=True)
-                return build_arg
-
-        return self.__map_io(io_type, func, *args, **kwargs)
-
     def _add_module(self, name: str, module: Module = None) -> None:
         r"""Adds module to the graph as a block so that the module will
         be called in nn.Graph.build.
@@ -2035,40 +2167,131 @@ class Graph(object):
 
         args_tree.map_leaf(func)
 
-    def __ensure_input_tensors_contiguous_and_flatten(self, *args, **kwargs):
-        flattened_args = []
+    def dynamic_input_graph_cache_stats(self):
+        r"""Returns the statistics of the graph cache created by
+        ``with_dynamic_input_shape``.
 
-        def func(value):
-            if isinstance(value, Tensor) and not value.is_contiguous():
-                value.contiguous_()
-            return value
+        It's an ordered dict from cache key(the signature of inputs) to a dict with
+        ``hits``, ``compiles``, ``compile_time`` (seconds of the last compilation),
+        ``nbytes`` (estimated memory, only counted with ``memory_budget``),
+        ``eager_runs`` (runs while compiling with ``async_compile``) and ``cached``.
+        Returns None if the graph is not decorated with ``with_dynamic_input_shape``.
+        """
+        if not self._run_with_cache:
+            return None
+        return self._dynamic_input_graph_cache.stats()
 
-        # NOTE(lixiang): Reduce the overhead of traversal and parsing of input args.
-        if self._is_simple_tuple_input:
-            args_tree = ArgsTree(args, False)
-            # contiguous
-            args_tree.map_tuple_leaf(func)
-            # flatten
-            for arg in args_tree.iter_nodes():
-                if isinstance(arg, Tensor):
-                    flattened_args.append(arg)
-                else:
-                    continue
-            return flattened_args
+    def precompile(
+        self,
+        shapes=None,
+        *,
+        inputs=None,
+        dtype: oneflow.dtype = oneflow.float32,
+        device: Union[str, oneflow.device] = "cpu",
+        wait: bool = True,
+    ):
+        r"""Compile graphs for some inputs ahead of use, e.g. to warm up the graph
+        cache at startup.
 
-        args_tree = ArgsTree((args, kwargs), False)
-        # contiguous
-        args_tree.map_leaf(func)
-        # flatten
-        for arg in args_tree.iter_nodes():
-            if isinstance(arg, Tensor):
-                flattened_args.append(arg)
-            else:
-                continue
-        return flattened_args
+        Only graphs decorated with ``with_dynamic_input_shape`` can be precompiled.
+        With ``async_compile``, graphs are compiled in the background thread of the
+        graph cache, and this method waits for them if ``wait`` is True.
+
+        Args:
+            shapes (list): each item is the shape of the single input, or a tuple
+                of shapes of positional inputs. Inputs are created with ``dtype``
+                and ``device``.
+            inputs (list): each item is a tuple of positional inputs, or a tuple of
+                ``(args, kwargs)`` if the last item is a dict. Used instead of
+                ``shapes`` for inputs with different dtypes or devices.
+
+        For example:
+
+        .. code-block:: python
+
+            g = MyDynamicShapeGraph()
+            g.precompile(shapes=[(1, 32), (1, 64), (1, 128)], dtype=flow.int64)
+        """
+        assert (
+            self._run_with_cache
+        ), "precompile only supports graphs decorated with with_dynamic_input_shape."
+        assert (shapes is None) != (
+            inputs is None
+        ), "precompile needs either shapes or inputs."
+        inputs_list = []
+        if shapes is not None:
+            for shape in shapes:
+                if len(shape) > 0 and all(isinstance(s, int) for s in shape):
+                    shape = (shape,)
+                args = tuple(
+                    oneflow.zeros(tuple(s), dtype=dtype, device=device) for s in shape
+                )
+                inputs_list.append((args, {}))
+        else:
+            for item in inputs:
+                if len(item) == 2 and isinstance(item[1], dict):
+                    inputs_list.append((tuple(item[0]), item[1]))
+                else:
+                    inputs_list.append((tuple(item), {}))
+        return self._dynamic_input_graph_cache.precompile(inputs_list, wait=wait)
 
     @staticmethod
-    def with_dynamic_input_shape(*, size: int = 10, enable_shared: bool = True):
+    def with_dynamic_input_shape(
+        *,
+        size: int = 10,
+        enable_shared: bool = True,
+        memory_budget: Optional[int] = None,
+        buckets: Optional[Dict[int, Dict[int, List[int]]]] = None,
+        pad_value=0,
+        mask_name: Optional[str] = "bucket_mask",
+        output_dims: Optional[Dict[int, Dict[int, Tuple[int, int]]]] = None,
+        async_compile: bool = False,
+    ):
+        r"""Decorate ``__init__`` of a nn.Graph subclass to cache a compiled graph for
+        each signature of inputs, up to ``size`` graphs.
+
+        Args:
+            size (int): max number of cached graphs. Default: 10.
+            enable_shared (bool): share parameters and the compiled job of the 1st
+                graph with later graphs. Default: True.
+            memory_budget (int, optional): max estimated memory bytes of all cached
+                graphs. Default: None, no limit.
+            buckets (dict, optional): pad dynamic dimensions up to bucket boundaries
+                so that only a few graphs are compiled. It maps the index of a
+                positional input to a dict from dimension to sorted boundaries, e.g.
+                ``{0: {1: [32, 64, 128]}}``. See
+                ``oneflow.nn.graph.cache.ShapeBuckets``.
+            pad_value (scalar): value used to pad bucketed inputs. Default: 0.
+            mask_name (str, optional): name of the keyword argument passing validity
+                masks of bucketed inputs to ``build()``, None to not pass masks.
+                Default: ``"bucket_mask"``.
+            output_dims (dict, optional): output dimensions sliced back to the
+                original size of bucketed input dimensions. It maps the index of an
+                output to a dict from dimension to ``(input index, input
+                dimension)``, e.g. ``{0: {1: (0, 1)}}``. Default: None, outputs are
+                not sliced.
+            async_compile (bool): compile a graph for new inputs in a background
+                thread and run ``build()`` eagerly with the original modules until
+                the graph is ready. Only for graphs without optimizer. Default: False.
+
+        For example:
+
+        .. code-block:: python
+
+            class BertGraph(flow.nn.Graph):
+                @flow.nn.Graph.with_dynamic_input_shape(
+                    size=4,
+                    buckets={0: {1: [32, 64, 128, 256]}},
+                    output_dims={0: {1: (0, 1)}},
+                )
+                def __init__(self, bert):
+                    super().__init__()
+                    self.bert = bert
+
+                def build(self, input_ids, bucket_mask):
+                    return self.bert(input_ids, attention_mask=bucket_mask)
+        """
+
         def deco_with_config(graph_init_func):
             @wraps(graph_init_func)
             def deco_func(self, *args, **kwargs):
@@ -2080,7 +2303,21 @@ class Graph(object):
                     weakref.proxy(self),
                     cache_size=size,
                     enable_graph_shared=enable_shared,
+                    memory_budget=memory_budget,
+                    buckets=None
+                    if buckets is None
+                    else cache.ShapeBuckets(
+                        buckets,
+                        pad_value=pad_value,
+                        mask_name=mask_name,
+                        output_dims=output_dims,
+                    ),
+                    async_compile=async_compile,
                 )
+                if async_compile:
+                    assert (
+                        not self.training
+                    ), "async_compile only supports graphs without optimizer."
                 self._cached_init_args = args
                 self._cached_init_kwargs = kwargs
 
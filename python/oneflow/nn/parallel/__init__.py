@@ -13,6 +13,13 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+from . import comm_hooks
 from .distributed import DistributedDataParallel
+from .fully_sharded import FullyShardedDataParallel
+from .zero import ZeroRedundancyOptimizer
 
-__all__ = ["DistributedDataParallel"]
+__all__ = [
+    "DistributedDataParallel",
+    "FullyShardedDataParallel",
+    "ZeroRedundancyOptimizer",
+]
@@ -0,0 +1,310 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+r"""Communication hooks of :func:`~flow.nn.parallel.DistributedDataParallel`.
+
+A communication hook ``hook(state, bucket)`` replaces the allreduce of a bucket
+of gradients, see :class:`GradBucket`. The gradients given to the hook are
+already divided by the world size, so that the hook averages them by summing
+them over the ranks, and writes the result back into ``bucket.buffer()``.
+
+The hooks count the bytes each rank sends in ``bucket.num_bytes_sent``, using
+the costs of the ring algorithms.
+"""
+import oneflow as flow
+
+
+class GradBucket(object):
+    r"""A bucket of gradients given to a communication hook.
+
+    Args:
+        index (int): the index of the bucket, buckets are allreduced in order.
+        buffer (Tensor): the gradients of the bucket, whose views are the
+            gradients of the parameters.
+        parameters (list of Tensor): the parameters of the bucket.
+        is_last (bool): whether the bucket is the last one of the backward.
+    """
+
+    def __init__(self, index, buffer, parameters, is_last):
+        self._index = index
+        self._buffer = buffer
+        self._parameters = parameters
+        self._is_last = is_last
+        self.num_bytes_sent = 0
+
+    def index(self):
+        return self._index
+
+    def buffer(self):
+        return self._buffer
+
+    def parameters(self):
+        return self._parameters
+
+    def gradients(self):
+        return [p.grad for p in self._parameters]
+
+    def is_last(self):
+        return self._is_last
+
+
+def _nbytes(tensor):
+    return tensor.numel() * tensor.dtype.bytes
+
+
+def _all_reduce(bucket, tensor):
+    world_size = flow.env.get_world_size()
+    bucket.num_bytes_sent += 2 * (world_size - 1) * _nbytes(tensor) // world_size
+    flow._C.local_all_reduce(tensor, inplace=True)
+
+
+def _all_gather(bucket, output, input):
+    bucket.num_bytes_sent += (flow.env.get_world_size() - 1) * _nbytes(input)
+    flow._C.local_all_gather(output, input)
+
+
+def _all_reduce_by_all_to_all(bucket, tensor):
+    # The cpu collectives cannot reduce half precision tensors, so the
+    # reduce-scatter is an all-to-all followed by a local sum in float32.
+    world_size = flow.env.get_world_size()
+    flat = tensor.reshape(-1)
+    chunk_size = (flat.numel() + world_size - 1) // world_size
+    padding = chunk_size * world_size - flat.numel()
+    if padding > 0:
+        zeros = flow.zeros(padding, dtype=flat.dtype, device=flat.device)
+        flat = flow.cat([flat, zeros])
+    inputs = [flat[i * chunk_size : (i + 1) * chunk_size] for i in range(world_size)]
+    outputs = [flow.empty_like(x) for x in inputs]
+    bucket.num_bytes_sent += (world_size - 1) * _nbytes(inputs[0])
+    flow.comm.all_to_all(outputs, inputs)
+    reduced = flow.stack(outputs).to(flow.float32).sum(dim=0).to(flat.dtype)
+    gathered = flow.empty_like(flat)
+    _all_gather(bucket, gathered, reduced)
+    tensor.copy_(gathered[: tensor.numel()].reshape(tensor.shape))
+
+
+def allreduce_hook(state, bucket):
+    r"""The default hook, which allreduces the bucket."""
+    _all_reduce(bucket, bucket.buffer())
+
+
+def _compressed_all_reduce(bucket, dtype):
+    buffer = bucket.buffer()
+    compressed = buffer.to(dtype)
+    if compressed.device.type == "cpu":
+        _all_reduce_by_all_to_all(bucket, compressed)
+    else:
+        _all_reduce(bucket, compressed)
+    buffer.copy_(compressed.to(buffer.dtype))
+
+
+def fp16_compress_hook(state, bucket):
+    r"""Casts the bucket to float16 before allreducing it, which halves the
+    communication of float32 gradients.
+    """
+    _compressed_all_reduce(bucket, flow.float16)
+
+
+def bf16_compress_hook(state, bucket):
+    r"""Casts the bucket to bfloat16 before allreducing it. Unlike float16,
+    bfloat16 has the range of float32, but less precision.
+    """
+    _compressed_all_reduce(bucket, flow.bfloat16)
+
+
+def _orthogonalize(matrix, epsilon=1e-8):
+    # Gram-Schmidt of the few columns of matrix.
+    columns = []
+    for i in range(matrix.shape[1]):
+        column = matrix[:, i]
+        for q in columns:
+            column = column - (q * column).sum() * q
+        columns.append(column / (column.norm() + epsilon))
+    return flow.stack(columns, dim=1)
+
+
+class PowerSGDState(object):
+    r"""The state of :func:`powerSGD_hook`.
+
+    Args:
+        matrix_approximation_rank (int, optional): the rank of the approximation
+            of the gradients. Default: 1.
+        start_powerSGD_iter (int, optional): the number of iterations whose
+            gradients are allreduced without compression, which should cover
+            the first steps where gradients change fast. Default: 10.
+        min_compression_rate (float, optional): the gradients whose size is not
+            at least ``min_compression_rate`` times the size of their
+            approximation are allreduced without compression. Default: 2.
+        use_error_feedback (bool, optional): whether to add the error of the
+            approximation of a gradient to the gradient of the next iteration.
+            Default: ``True``.
+        warm_start (bool, optional): whether to start the power iteration of
+            every step from the result of the previous step. Default: ``True``.
+        random_seed (int, optional): the seed of the initial matrices, which
+            must be the same on all ranks. Default: 0.
+    """
+
+    def __init__(
+        self,
+        matrix_approximation_rank=1,
+        start_powerSGD_iter=10,
+        min_compression_rate=2,
+        use_error_feedback=True,
+        warm_start=True,
+        random_seed=0,
+    ):
+        self.matrix_approximation_rank = matrix_approximation_rank
+        self.start_powerSGD_iter = start_powerSGD_iter
+        self.min_compression_rate = min_compression_rate
+        self.use_error_feedback = use_error_feedback
+        self.warm_start = warm_start
+        self.generator = flow.Generator()
+        self.generator.manual_seed(random_seed)
+        self.iter = 0
+        self.error_dict = {}
+        self.q_memory_dict = {}
+
+    def _should_compress(self, grad):
+        if grad.ndim < 2:
+            return False
+        n, m = grad.shape[0], grad.numel() // grad.shape[0]
+        rank = min(n, m, self.matrix_approximation_rank)
+        return n * m >= self.min_compression_rate * (n + m) * rank
+
+    def _initial_q(self, param, m, rank, matrix):
+        q = self.q_memory_dict.get(param) if self.warm_start else None
+        if q is None:
+            q = flow.randn(m, rank, generator=self.generator)
+            q = q.to(device=matrix.device, dtype=matrix.dtype)
+        return q
+
+
+def _all_reduce_matrices(bucket, matrices):
+    # A single allreduce for the matrices of all the parameters of the bucket.
+    flat = flow.cat([m.reshape(-1) for m in matrices])
+    _all_reduce(bucket, flat)
+    result, offset = [], 0
+    for m in matrices:
+        result.append(flat[offset : offset + m.numel()].reshape(m.shape))
+        offset += m.numel()
+    return result
+
+
+def powerSGD_hook(state, bucket):
+    r"""Allreduces a low-rank approximation of the gradient matrices of a
+    bucket, computed by a step of power iteration, see
+    `PowerSGD <https://arxiv.org/abs/1905.13727>`_. The gradients of the
+    parameters with less than 2 dimensions are allreduced as they are.
+
+    The approximation of a ``n`` by ``m`` gradient of rank ``r`` costs the
+    communication of ``(n + m) * r`` elements. With error feedback, the part
+    of the gradient lost by the approximation is added to the next gradient.
+
+    Args:
+        state (PowerSGDState): the state of the hook.
+        bucket (GradBucket): the bucket.
+    """
+    if state.iter < state.start_powerSGD_iter:
+        allreduce_hook(None, bucket)
+        if bucket.is_last():
+            state.iter += 1
+        return
+    uncompressed, compressed = [], []
+    for (param, grad) in zip(bucket.parameters(), bucket.gradients()):
+        if state._should_compress(grad):
+            compressed.append((param, grad))
+        else:
+            uncompressed.append(grad)
+    if len(uncompressed) > 0:
+        reduced = _all_reduce_matrices(bucket, uncompressed)
+        for (grad, r) in zip(uncompressed, reduced):
+            grad.copy_(r)
+    if len(compressed) > 0:
+        matrices, ps, qs = [], [], []
+        for (param, grad) in compressed:
+            matrix = grad.reshape(grad.shape[0], -1)
+            if state.use_error_feedback and param in state.error_dict:
+                matrix = matrix + state.error_dict[param]
+            (n, m) = matrix.shape
+            rank = min(n, m, state.matrix_approximation_rank)
+            q = state._initial_q(param, m, rank, matrix)
+            matrices.append(matrix)
+            ps.append(flow.matmul(matrix, q))
+        ps = [_orthogonalize(p) for p in _all_reduce_matrices(bucket, ps)]
+        for (matrix, p) in zip(matrices, ps):
+            qs.append(flow.matmul(matrix.t(), p))
+        qs = _all_reduce_matrices(bucket, qs)
+        for ((param, grad), matrix, p, q) in zip(compressed, matrices, ps, qs):
+            approximation = flow.matmul(p, q.t())
+            if state.use_error_feedback:
+                state.error_dict[param] = matrix - approximation
+            state.q_memory_dict[param] = q
+            grad.copy_(approximation.reshape(grad.shape))
+    if bucket.is_last():
+        state.iter += 1
+
+
+class TopKState(object):
+    r"""The state of :func:`topk_hook`.
+
+    Args:
+        compress_ratio (float, optional): the fraction of the gradients sent by
+            every rank. Default: 0.01.
+        use_error_feedback (bool, optional): whether to add the gradients which
+            were not sent to the gradients of the next iteration.
+            Default: ``True``.
+    """
+
+    def __init__(self, compress_ratio=0.01, use_error_feedback=True):
+        if not 0 < compress_ratio <= 1:
+            raise ValueError(
+                "compress_ratio should be in (0, 1], but got "
+                "compress_ratio={}".format(compress_ratio)
+            )
+        self.compress_ratio = compress_ratio
+        self.use_error_feedback = use_error_feedback
+        self.error_dict = {}
+
+
+def topk_hook(state, bucket):
+    r"""Sparsifies the bucket before communication: every rank sends the
+    indices and the values of its ``compress_ratio`` fraction of gradients of
+    largest magnitude, which are summed on all ranks. With error feedback, the
+    gradients which were not sent are added to the next gradients.
+
+    Args:
+        state (TopKState): the state of the hook.
+        bucket (GradBucket): the bucket.
+    """
+    buffer = bucket.buffer()
+    flat = buffer.reshape(-1)
+    # The buckets are rebuilt after the first iteration, so they are identified
+    # by their parameters.
+    key = tuple(id(p) for p in bucket.parameters())
+    if state.use_error_feedback and key in state.error_dict:
+        flat = flat + state.error_dict[key]
+    k = max(1, int(flat.numel() * state.compress_ratio))
+    (_, indices) = flow.topk(flat.abs(), k)
+    values = flat[indices]
+    if state.use_error_feedback:
+        sent = flow.zeros_like(flat).index_add_(0, indices, values)
+        state.error_dict[key] = flat - sent
+    world_size = flow.env.get_world_size()
+    all_indices = flow.empty(world_size * k, dtype=indices.dtype, device=flat.device)
+    all_values = flow.empty(world_size * k, dtype=values.dtype, device=flat.device)
+    _all_gather(bucket, all_indices, indices)
+    _all_gather(bucket, all_values, values)
+    dense = flow.zeros_like(flat).index_add_(0, all_indices, all_values)
+    buffer.copy_(dense.reshape(buffer.shape))
@@ -13,58 +13,204 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+import functools
 import warnings
-from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
 
 import oneflow as flow
 from oneflow.support.env_var_util import parse_boolean_from_env
 from oneflow.framework.tensor_tuple_util import convert_to_tensor_tuple
-from oneflow.nn.utils.parameters_grouping import ContiguousParamsGroup
+from oneflow.nn.utils.parameters_grouping import (
+    ContiguousParamsGroup,
+    numel_in_bucket,
+)
 from oneflow.framework.args_tree import ArgsTree
+from oneflow.nn.parallel.comm_hooks import GradBucket, allreduce_hook
 
 
-def allreduce_fn(module, param, use_bucket):
-    ddp_state_for_reversed_params = module._ddp_state_for_reversed_params
+def _bucket_nbytes(param):
+    return numel_in_bucket(param) * (flow.finfo(param.dtype).bits // 8)
 
-    def allreduce_with_bucket(grad):
-        buckets = module._buckets
-        bucket_tensors = module._bucket_tensors
-        ddp_state_for_reversed_params[param][0] = True
-        for index, bucket in enumerate(buckets):
-            deleted = all(ddp_state_for_reversed_params[x][1] for x in bucket)
-            if deleted:
-                continue
 
-            assert not any(ddp_state_for_reversed_params[x][1] for x in bucket)
+def _assign_buckets(params, bucket_cap_bytes, first_bucket_cap_bytes, bucket_size):
+    # Fills buckets in the order of params. The first bucket is smaller so that
+    # the first allreduce starts early in backward.
+    buckets = []
+    bucket, nbytes = [], 0
+    for param in params:
+        if len(bucket) > 0 and param.dtype != bucket[0].dtype:
+            buckets.append(bucket)
+            bucket, nbytes = [], 0
+        bucket.append(param)
+        nbytes += _bucket_nbytes(param)
+        cap = first_bucket_cap_bytes if len(buckets) == 0 else bucket_cap_bytes
+        if nbytes >= cap or (bucket_size is not None and len(bucket) >= bucket_size):
+            buckets.append(bucket)
+            bucket, nbytes = [], 0
+    if len(bucket) > 0:
+        buckets.append(bucket)
+    return buckets
 
-            all_params_in_bucket_ready = all(
-                ddp_state_for_reversed_params[x][0] for x in bucket
+
+class _GradReducer(object):
+    """Allreduces the gradients of the parameters of a ddp module, bucket by
+    bucket, as soon as all the gradients of a bucket are ready.
+
+    Buckets are allreduced in the same order on all ranks, i.e. a ready bucket
+    waits for the buckets before it. Every bucket counts its pending gradients,
+    so that a gradient hook is O(1). The buckets are first filled in the
+    reversed declaration order of the parameters, and rebuilt before the second
+    forward in the order in which gradients were ready on rank 0.
+
+    Gradients are only averaged when ``require_sync`` is set by the forward,
+    i.e. outside of ``no_sync`` and on the last of ``gradient_accumulation_steps``
+    micro-batches. Otherwise they are accumulated locally, and the gradients
+    accumulated since the last synchronization are averaged at once.
+
+    A bucket is allreduced by ``comm_hook``, see
+    :mod:`oneflow.nn.parallel.comm_hooks`, and ``num_bytes_sent`` counts the
+    bytes sent by this rank.
+    """
+
+    def __init__(
+        self,
+        params,
+        use_bucket,
+        bucket_cap_bytes,
+        first_bucket_cap_bytes,
+        bucket_size,
+        gradient_accumulation_steps,
+    ):
+        # The parameters requiring grad, in the reversed declaration order.
+        self.params = params
+        self.use_bucket = use_bucket
+        self.bucket_cap_bytes = bucket_cap_bytes
+        self.first_bucket_cap_bytes = first_bucket_cap_bytes
+        self.bucket_size = bucket_size
+        self.gradient_accumulation_steps = gradient_accumulation_steps
+        self.num_micro_batches = 0
+        self.sync_disabled = False
+        self.require_sync = True
+        self.comm_hook = allreduce_hook
+        self.comm_state = None
+        self.num_bytes_sent = 0
+        # Buckets can only be moved to new buffers when ddp created the buffers.
+        self.owns_buffers = all(p._ref_tensor is None for p in params)
+        self.ready_order = [] if self.owns_buffers or not use_bucket else None
+        self._build_buckets(params, group_on_current_buffer=not self.owns_buffers)
+        self.reset()
+
+    def _build_buckets(self, ordered_params, group_on_current_buffer):
+        if self.use_bucket:
+            self.buckets = _assign_buckets(
+                ordered_params,
+                self.bucket_cap_bytes,
+                self.first_bucket_cap_bytes,
+                self.bucket_size,
             )
-            if all_params_in_bucket_ready:
-                for x in bucket:
-                    ddp_state_for_reversed_params[x][1] = True
-                # NOTE(jianhao)(higher-order-grad):
-                # local allreduce doesn't have gradient function, higher-order grad may be unsupported
-                flow._C.local_all_reduce(bucket_tensors[index], inplace=True)
-            else:
-                break
-
-    def allreduce_without_bucket(grad):
-        ddp_state_for_reversed_params[param][0] = True
-        for cur_param, (ready, deleted) in ddp_state_for_reversed_params.items():
-            if deleted:
-                continue
-            if ready:
-                ddp_state_for_reversed_params[cur_param][1] = True
-                # NOTE(jianhao)(higher-order-grad): local allreduce doesn't have gradient function, higher-order grad may be unsupported
-                if cur_param is param:
-                    flow._C.local_all_reduce(grad, True)
-                else:
-                    flow._C.local_all_reduce(cur_param.grad, True)
+            self.params_group = ContiguousParamsGroup(
+                self.buckets, group_on_current_buffer=group_on_current_buffer
+            )
+            self.bucket_tensors = self.params_group.grouped_parameters_grad
+        else:
+            self.buckets = [[p] for p in ordered_params]
+        self.bucket_index = {
+            p: i for (i, bucket) in enumerate(self.buckets) for p in bucket
+        }
+
+    def reset(self):
+        self.ready = {p: False for p in self.params}
+        self.num_pending = [len(bucket) for bucket in self.buckets]
+        self.grads = [None] * len(self.buckets)
+        self.next_bucket = 0
+
+    def prepare_for_backward(self):
+        self.reset()
+        if flow.is_grad_enabled():
+            self.num_micro_batches += 1
+        self.require_sync = (
+            not self.sync_disabled
+            and self.num_micro_batches % self.gradient_accumulation_steps == 0
+        )
+
+    def rebuild_buckets(self):
+        # All ranks must allreduce the same buckets in the same order, so the
+        # order of rank 0 is used.
+        recorded = set(self.ready_order)
+        order = self.ready_order + [p for p in self.params if p not in recorded]
+        self.ready_order = None
+        param_index = {p: i for (i, p) in enumerate(self.params)}
+        order = flow.tensor(
+            [param_index[p] for p in order],
+            dtype=flow.int64,
+            device=self.params[0].device,
+        )
+        flow._C.comm_broadcast(order, inplace=True)
+        ordered_params = [self.params[i] for i in order.numpy().tolist()]
+        grads = [p.grad for p in self.params]
+        self._build_buckets(ordered_params, group_on_current_buffer=False)
+        if self.use_bucket:
+            with flow.no_grad():
+                for (p, grad) in zip(self.params, grads):
+                    if grad is not None:
+                        p.grad.copy_(grad)
+        self.reset()
+
+    def mark_ready(self, param, grad):
+        if self.ready[param]:
+            return
+        self.ready[param] = True
+        if self.ready_order is not None:
+            self.ready_order.append(param)
+        if not self.require_sync:
+            return
+        index = self.bucket_index[param]
+        self.num_pending[index] -= 1
+        if not self.use_bucket:
+            self.grads[index] = grad
+        while (
+            self.next_bucket < len(self.buckets)
+            and self.num_pending[self.next_bucket] == 0
+        ):
+            index = self.next_bucket
+            if self.use_bucket:
+                buffer = self.bucket_tensors[index]
             else:
-                break
+                buffer = self.grads[index]
+                self.grads[index] = None
+            bucket = GradBucket(
+                index, buffer, self.buckets[index], index == len(self.buckets) - 1
+            )
+            # NOTE(jianhao)(higher-order-grad):
+            # local allreduce doesn't have gradient function, higher-order grad may be unsupported
+            self.comm_hook(self.comm_state, bucket)
+            self.num_bytes_sent += bucket.num_bytes_sent
+            self.next_bucket += 1
+
+
+def allreduce_fn(module, param):
+    def allreduce(grad):
+        module._ddp_reducer.mark_ready(param, grad)
+
+    return allreduce
+
+
+def _register_comm_hook(module, state, hook):
+    reducer = module._ddp_reducer
+    reducer.comm_state = state
+    reducer.comm_hook = hook
 
-    return allreduce_with_bucket if use_bucket else allreduce_without_bucket
+
+@contextmanager
+def _no_sync(module):
+    reducer = module._ddp_reducer
+    sync_disabled = reducer.sync_disabled
+    reducer.sync_disabled = True
+    try:
+        yield
+    finally:
+        reducer.sync_disabled = sync_disabled
 
 
 def DistributedDataParallel(
@@ -72,15 +218,78 @@ def DistributedDataParallel(
     *,
     broadcast_buffers: bool = True,
     broadcast_parameters: bool = True,
-    bucket_size: int = 10,
+    bucket_size: Optional[int] = None,
     use_bucket: bool = True,
+    bucket_cap_mb: float = 25,
+    first_bucket_cap_mb: float = 1,
+    gradient_accumulation_steps: int = 1,
 ):
-    assert all(x.dtype == flow.float32 for x in module.parameters())
+    r"""Updates ``module`` inplace to average its gradients over all ranks.
+
+    The gradients are allreduced in buckets while backward is running. A bucket
+    is full once it holds ``bucket_cap_mb`` megabytes of gradients, or
+    ``first_bucket_cap_mb`` for the first bucket, whose allreduce is the first
+    one to start. The buckets are rebuilt before the second forward from the
+    order in which the gradients were ready in the first backward.
+
+    To accumulate gradients over several micro-batches, the gradients of the
+    forwards run in the ``module.no_sync()`` context are not averaged, and are
+    averaged together with the gradients of the next forward out of it:
+
+    .. code-block:: python
+
+        >>> model = flow.nn.parallel.DistributedDataParallel(model)  # doctest: +SKIP
+        >>> with model.no_sync():  # doctest: +SKIP
+        ...     model(x0).sum().backward()
+        >>> model(x1).sum().backward()  # doctest: +SKIP
+
+    ``module.register_comm_hook(state, hook)`` replaces the allreduce of the
+    buckets by ``hook(state, bucket)``, e.g. to compress the gradients, see
+    :mod:`oneflow.nn.parallel.comm_hooks`:
+
+    .. code-block:: python
+
+        >>> from oneflow.nn.parallel import comm_hooks  # doctest: +SKIP
+        >>> state = comm_hooks.PowerSGDState()  # doctest: +SKIP
+        >>> model.register_comm_hook(state, comm_hooks.powerSGD_hook)  # doctest: +SKIP
+
+    ``gradient_accumulation_steps`` does the same without the context, i.e.
+    only the gradients of every ``gradient_accumulation_steps``-th forward are
+    averaged, together with the ones accumulated since the previous average.
+
+    Args:
+        module (flow.nn.Module): the module.
+        broadcast_buffers (bool, optional): whether to broadcast the buffers
+            from rank 0 before every forward. Default: ``True``.
+        broadcast_parameters (bool, optional): whether to broadcast the
+            parameters from rank 0. Default: ``True``.
+        bucket_size (int, optional): if not ``None``, the maximum number of
+            parameters in a bucket. Default: ``None``.
+        use_bucket (bool, optional): if ``False``, the gradients are allreduced
+            one by one. Default: ``True``.
+        bucket_cap_mb (float, optional): the size of a bucket in megabytes.
+            Default: 25.
+        first_bucket_cap_mb (float, optional): the size of the first bucket in
+            megabytes. Default: 1.
+        gradient_accumulation_steps (int, optional): the number of forwards
+            whose gradients are averaged at once. Default: 1.
+    """
+    # Gradients of different dtypes are in different buckets.
+    assert all(
+        flow.is_floating_point(x) for x in module.parameters() if x.requires_grad
+    )
     if use_bucket and parse_boolean_from_env("ONEFLOW_DISABLE_VIEW", False):
         warnings.warn(
             "because the environment variable 'ONEFLOW_DISABLE_VIEW' is set to true, so the view mechanism is disabled, and we will set use_bucket=False"
         )
         use_bucket = False
+    if not isinstance(gradient_accumulation_steps, int) or (
+        gradient_accumulation_steps < 1
+    ):
+        raise ValueError(
+            "gradient_accumulation_steps should be a positive integer, but got "
+            "gradient_accumulation_steps={}".format(gradient_accumulation_steps)
+        )
     world_size = flow.env.get_world_size()
     if broadcast_parameters:
         with flow.no_grad():
@@ -91,32 +300,23 @@ def DistributedDataParallel(
                 # after flow._C.comm_broadcast
                 x.requires_grad_(requires_grad)
 
+    reversed_param_list = list(
+        reversed([param for param in module.parameters() if param.requires_grad])
+    )
     if use_bucket:
         all_grad_size = sum([x.numel() for x in module.parameters()])
         if all_grad_size > 0:
             device = list(module.parameters())[0].device
             assert all(x.device == device for x in module.parameters())
-        reversed_param_list = list(
-            reversed(
-                list([param for param in module.parameters() if param.requires_grad])
-            )
-        )
-
-        module._bucket_index = {
-            x: i // bucket_size for i, x in enumerate(reversed_param_list)
-        }
-        module._buckets = [
-            reversed_param_list[i : i + bucket_size]
-            for i in range(0, len(reversed_param_list), bucket_size)
-        ]
-
-        module._params_group = ContiguousParamsGroup(module._buckets)
-        module._bucket_tensors = module._params_group.grouped_parameters_grad
 
-    ddp_state_for_reversed_params = OrderedDict(
-        reversed([(x, [False, False]) for x in module.parameters() if x.requires_grad])
+    module._ddp_reducer = _GradReducer(
+        reversed_param_list,
+        use_bucket,
+        int(bucket_cap_mb * 1024 * 1024),
+        int(first_bucket_cap_mb * 1024 * 1024),
+        bucket_size,
+        gradient_accumulation_steps,
     )
-    module._ddp_state_for_reversed_params = ddp_state_for_reversed_params
     # The gradient shoule be averaged by all the nodes, so besides allreduce,
     # a division by world_size is required.
     # Use x * (1 / world_size) instead of x / world_size for two reasons:
@@ -126,24 +326,30 @@ def DistributedDataParallel(
     mul_factor = 1 / world_size
 
     def inplace_mul_and_return_none(x):
-        x.mul_(mul_factor)
+        # Accumulated gradients are averaged when they are allreduced.
+        if module._ddp_reducer.require_sync:
+            x.mul_(mul_factor)
         return None
 
     for param in module.parameters():
         if param.requires_grad:
             param._register_post_grad_accumulation_hook(inplace_mul_and_return_none)
-            param._register_post_grad_accumulation_hook(
-                allreduce_fn(module, param, use_bucket)
-            )
+            param._register_post_grad_accumulation_hook(allreduce_fn(module, param))
+
+    def rebuild_buckets_hook(module, input):
+        reducer = module._ddp_reducer
+        if reducer.ready_order is not None and len(reducer.ready_order) > 0:
+            reducer.rebuild_buckets()
+
+    if len(reversed_param_list) > 0:
+        module.register_forward_pre_hook(rebuild_buckets_hook)
 
     def post_forward_hook(module, input, output):
-        ddp_state_for_reversed_params = module._ddp_state_for_reversed_params
-        for state in ddp_state_for_reversed_params.values():
-            state[0], state[1] = False, False
+        reducer = module._ddp_reducer
+        reducer.prepare_for_backward()
         output = ArgsTree(output).map_leaf(
             lambda x: flow._C.select_top_n(
-                convert_to_tensor_tuple([x, *ddp_state_for_reversed_params.keys()]),
-                n=1,
+                convert_to_tensor_tuple([x, *reducer.params]), n=1,
             )[0]
         )
         buffers = list(module.buffers())
@@ -162,6 +368,8 @@ def DistributedDataParallel(
 
         module.register_forward_pre_hook(pre_forward_hook)
 
+    module.no_sync = functools.partial(_no_sync, module)
+    module.register_comm_hook = functools.partial(_register_comm_hook, module)
     module._is_ddp_module = True
 
     return module
@@ -0,0 +1,357 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import collections
+import functools
+from typing import Iterable, Optional
+
+import oneflow as flow
+from oneflow.nn.utils.parameters_grouping import ContiguousParamsGroup
+
+# A parameter saved for backward by an op of a unit, which is gathered again
+# when backward needs it.
+_SavedParam = collections.namedtuple(
+    "_SavedParam", ["flat_param", "offset", "numel", "shape"]
+)
+
+
+class _GatheredParams(flow.autograd.Function):
+    # Makes the gathered parameters of a flat parameter depend on its shard, so
+    # that their gradients are reduce-scattered into the gradient of the shard.
+    @staticmethod
+    def forward(ctx, shard, full):
+        return full.detach()
+
+    @staticmethod
+    def backward(ctx, grad):
+        world_size = flow.env.get_world_size()
+        grad_shard = flow.empty(
+            grad.numel() // world_size, dtype=grad.dtype, device=grad.device
+        )
+        flow._C.local_reduce_scatter(grad_shard, grad.contiguous())
+        return grad_shard.mul_(1 / world_size), None
+
+
+class _FlatParam(object):
+    """The parameters of a dtype and device of a unit, flattened into a buffer
+    padded to a multiple of the world size, of which every rank keeps a shard.
+    """
+
+    def __init__(self, buffer, params, owners, world_size, rank):
+        self.world_size = world_size
+        self.shard_size = (buffer.numel() + world_size - 1) // world_size
+        with flow.no_grad():
+            padded = flow.zeros(
+                self.shard_size * world_size, dtype=buffer.dtype, device=buffer.device,
+            )
+            padded[: buffer.numel()] = buffer
+            # The parameters of all ranks start from the ones of rank 0.
+            flow._C.comm_broadcast(padded, inplace=True)
+            shard = padded[rank * self.shard_size : (rank + 1) * self.shard_size]
+            self.shard = flow.nn.Parameter(shard.clone())
+        self.shard._register_post_grad_accumulation_hook(self._free_backward_full)
+        self.views = [
+            (owner, name, p._ref_index, p.numel(), p.shape)
+            for p in params
+            for (owner, name) in owners[p]
+        ]
+        self.prefetched = None
+        self.backward_full = None
+
+    def _free_backward_full(self, grad):
+        # All the ops of the unit which need the parameters ran before.
+        self.backward_full = None
+        return None
+
+    def gather(self):
+        with flow.no_grad():
+            full = flow.empty(
+                self.shard_size * self.world_size,
+                dtype=self.shard.dtype,
+                device=self.shard.device,
+            )
+            flow._C.local_all_gather(full, self.shard.detach())
+        return full
+
+
+class _FSDPUnit(object):
+    """The parameters of a module which are gathered in its forward, i.e. the
+    ones of its submodules which are not in another unit.
+    """
+
+    def __init__(self, module, owners, world_size, rank):
+        self.module = module
+        params = list(owners.keys())
+        self.flat_params = []
+        if len(params) == 0:
+            return
+        # The buffers are made in the order of the first parameter of every key.
+        keys = collections.OrderedDict.fromkeys((p.dtype, p.device) for p in params)
+        group = ContiguousParamsGroup([params], group_on_current_buffer=False)
+        for (key, buffer) in zip(keys, group.grouped_parameters):
+            buffer_params = [p for p in params if (p.dtype, p.device) == key]
+            self.flat_params.append(
+                _FlatParam(buffer, buffer_params, owners, world_size, rank)
+            )
+        for (p, param_owners) in owners.items():
+            for (owner, name) in param_owners:
+                del owner._parameters[name]
+        for (i, flat_param) in enumerate(self.flat_params):
+            flat_param.unit = self
+            module.register_parameter("_fsdp_flat_param_{}".format(i), flat_param.shard)
+
+    def prefetch(self):
+        for flat_param in self.flat_params:
+            if flat_param.prefetched is None:
+                flat_param.prefetched = flat_param.gather()
+
+    def prefetch_for_backward(self):
+        for flat_param in self.flat_params:
+            if flat_param.backward_full is None:
+                flat_param.backward_full = flat_param.gather()
+
+
+class _FSDPState(object):
+    """Gathers the parameters of the units of a module around their forward,
+    and again in backward through the hooks of saved tensors.
+
+    The order of the forward of the units is recorded in the first forward, and
+    then the parameters of the next unit are gathered before the forward of a
+    unit, and the ones of the previous unit before its backward, so that
+    communications overlap computations.
+    """
+
+    def __init__(self, root_unit, units, prefetch):
+        self.root_unit = root_unit
+        self.units = units
+        self.prefetch = prefetch
+        self.forward_order = []
+        self.order_index = None
+        self.in_forward = False
+        # The units whose parameters are gathered, and these parameters by id.
+        self.gathered = []
+        self.views = {}
+        self.hooks = flow.autograd.graph.saved_tensors_hooks(self.pack, self.unpack)
+
+    def pack(self, tensor):
+        saved = self.views.get(id(tensor))
+        if saved is not None and saved[0] is tensor:
+            return saved[1]
+        return tensor
+
+    def unpack(self, packed):
+        if not isinstance(packed, _SavedParam):
+            return packed
+        flat_param = packed.flat_param
+        if flat_param.backward_full is None:
+            unit = flat_param.unit
+            unit.prefetch_for_backward()
+            # Backward runs the units in the reverse order of forward.
+            i = self.order_index.get(unit) if self.order_index is not None else None
+            if self.prefetch and i is not None and i > 0:
+                self.forward_order[i - 1].prefetch_for_backward()
+        full = flat_param.backward_full
+        return full[packed.offset : packed.offset + packed.numel].view(packed.shape)
+
+    def gather(self, unit):
+        self.gathered.append(unit)
+        for flat_param in unit.flat_params:
+            full = flat_param.prefetched
+            flat_param.prefetched = None
+            if full is None:
+                full = flat_param.gather()
+            full = _GatheredParams.apply(flat_param.shard, full)
+            for (owner, name, offset, numel, shape) in flat_param.views:
+                param = full[offset : offset + numel].view(shape)
+                owner.__dict__[name] = param
+                self.views[id(param)] = (
+                    param,
+                    _SavedParam(flat_param, offset, numel, shape),
+                )
+
+    def free(self, unit):
+        self.gathered.remove(unit)
+        for flat_param in unit.flat_params:
+            for (owner, name, _, _, _) in flat_param.views:
+                # Missing if the gather raised.
+                param = owner.__dict__.pop(name, None)
+                if param is not None:
+                    del self.views[id(param)]
+
+    def pre_forward(self, unit):
+        if not self.in_forward:
+            raise RuntimeError(
+                "the forward of a unit of FullyShardedDataParallel ran outside "
+                "the forward of the wrapped module, e.g. when it is recomputed "
+                "by flow.utils.checkpoint, which is not supported"
+            )
+        if self.order_index is None:
+            if unit not in self.forward_order:
+                self.forward_order.append(unit)
+        elif self.prefetch and unit in self.order_index:
+            i = self.order_index[unit]
+            if i + 1 < len(self.forward_order):
+                self.forward_order[i + 1].prefetch()
+        self.gather(unit)
+
+    def root_forward(self, forward, *args, **kwargs):
+        for unit in self.units + [self.root_unit]:
+            for flat_param in unit.flat_params:
+                flat_param.backward_full = None
+        if self.order_index is None:
+            # An order recorded by a forward which raised is incomplete.
+            self.forward_order = []
+        self.in_forward = True
+        try:
+            with self.hooks:
+                self.gather(self.root_unit)
+                output = forward(*args, **kwargs)
+        finally:
+            self.in_forward = False
+            # The root unit, and the units whose forward raised.
+            for unit in list(self.gathered):
+                self.free(unit)
+            # The parameters prefetched for units which were skipped.
+            for unit in self.units:
+                for flat_param in unit.flat_params:
+                    flat_param.prefetched = None
+        if self.order_index is None:
+            self.order_index = {unit: i for (i, unit) in enumerate(self.forward_order)}
+        return output
+
+
+def _unit_pre_forward_hook(module, input):
+    (state, unit) = module._fsdp_unit
+    state.pre_forward(unit)
+
+
+def _unit_post_forward_hook(module, input, output):
+    (state, unit) = module._fsdp_unit
+    state.free(unit)
+
+
+def FullyShardedDataParallel(
+    module: "flow.nn.Module",
+    *,
+    unit_modules: Optional[Iterable["flow.nn.Module"]] = None,
+    prefetch: bool = True,
+):
+    r"""Shards the parameters of a module over the ranks, for the modules which
+    do not fit in the memory of a rank, i.e. ZeRO stage 3 for local tensors.
+
+    The parameters of every unit, i.e. of every module of ``unit_modules`` and
+    its submodules, are flattened by
+    :class:`~flow.nn.utils.parameters_grouping.ContiguousParamsGroup` and every
+    rank keeps a shard of the flat buffer, registered as a parameter of the
+    unit, so that an optimizer over :meth:`parameters` only keeps the states of
+    the shards. The parameters of a unit are all-gathered just before its
+    forward and freed after it, and gathered again in backward when the ops of
+    the unit need them. The gradients of the parameters of a unit are
+    reduce-scattered and averaged into the gradients of its shards.
+
+    The parameters of the next unit are gathered ahead, in the order of the
+    first forward, so that communications overlap computations.
+
+    The parameters which are not in a unit are gathered during the whole
+    forward of ``module``. The parameters which do not require grad are not
+    sharded. The parameters are broadcast from rank 0.
+
+    Args:
+        module (Module): the module to wrap, which is modified in place.
+        unit_modules (iterable of Module, optional): the submodules whose
+            parameters are gathered together, e.g. the layers of a transformer.
+            Default: the children of ``module``.
+        prefetch (bool, optional): whether to gather the parameters of the next
+            unit ahead. Default: ``True``.
+
+    .. note::
+        The parameters of a unit are only attributes of their modules during
+        the forward of the unit, and the parameters saved for backward by the
+        ops of the unit are freed and gathered again. A tensor computed from a
+        parameter, e.g. ``weight.t()``, which is saved by an op keeps the
+        memory of the gathered parameters until backward.
+
+    .. note::
+        The parameters of the units are replaced by their shards, so
+        :meth:`state_dict` returns the shards of the rank under the names
+        ``<unit>._fsdp_flat_param_<i>`` instead of the original names of the
+        parameters, and the full parameters cannot be exported from it.
+
+    .. warning::
+        The parameters are gathered again in backward through
+        :class:`~flow.autograd.graph.saved_tensors_hooks`, of which only the
+        innermost pair applies. Hooks of saved tensors set inside the forward
+        of ``module``, e.g. by :func:`flow.utils.checkpoint.checkpoint`, keep
+        the gathered parameters until backward, and recomputing the forward of
+        a unit in backward raises a ``RuntimeError``.
+
+    For example:
+
+    .. code-block:: python
+
+        >>> model = flow.nn.Sequential(*layers)  # doctest: +SKIP
+        >>> model = flow.nn.parallel.FullyShardedDataParallel(model)  # doctest: +SKIP
+        >>> optimizer = flow.optim.Adam(model.parameters(), lr=1e-3)  # doctest: +SKIP
+        >>> model(x).sum().backward()  # doctest: +SKIP
+        >>> optimizer.step()  # doctest: +SKIP
+
+    """
+    world_size = flow.env.get_world_size()
+    rank = flow.env.get_rank()
+    if getattr(module, "_is_ddp_module", False) or hasattr(module, "_fsdp_state"):
+        raise ValueError("module is already wrapped for data parallel training")
+    if unit_modules is None:
+        unit_modules = list(module.children())
+    unit_modules = list(unit_modules)
+    module_names = {m: name for (name, m) in module.named_modules()}
+    for m in unit_modules:
+        if m is module or m not in module_names:
+            raise ValueError("unit_modules should be submodules of module")
+
+    # A parameter belongs to the innermost unit.
+    unit_modules.sort(key=lambda m: module_names[m].count("."), reverse=True)
+    claimed = set()
+    units = []
+    for m in unit_modules + [module]:
+        owners = collections.OrderedDict()
+        for owner in m.modules():
+            for (name, p) in owner._parameters.items():
+                if p is not None and p.requires_grad and p not in claimed:
+                    owners.setdefault(p, []).append((owner, name))
+        if len(owners) == 0:
+            units.append(None)
+            continue
+        if any(p._ref_tensor is not None for p in owners):
+            raise ValueError("parameters are already in contiguous buffers")
+        unit = _FSDPUnit(m, owners, world_size, rank)
+        claimed.update(owners)
+        claimed.update(flat_param.shard for flat_param in unit.flat_params)
+        units.append(unit)
+
+    root_unit = units.pop()
+    if root_unit is None:
+        root_unit = _FSDPUnit(module, collections.OrderedDict(), world_size, rank)
+    units = [unit for unit in units if unit is not None]
+    state = _FSDPState(root_unit, units, prefetch)
+    for unit in units:
+        unit.module._fsdp_unit = (state, unit)
+        unit.module.register_forward_pre_hook(_unit_pre_forward_hook)
+        unit.module.register_forward_hook(_unit_post_forward_hook)
+    module._fsdp_state = state
+    forward = module.forward
+    # Wrapped rather than hooked, so that the parameters are freed and the hooks
+    # of saved tensors are popped when the forward raises.
+    module.forward = functools.partial(state.root_forward, forward)
+    return module
@@ -0,0 +1,238 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import collections
+from typing import Callable, Type, Union
+
+import oneflow as flow
+from oneflow.framework.tensor import Tensor
+from oneflow.nn.utils.parameters_grouping import numel_in_bucket
+from oneflow.optim.optimizer import Optimizer
+
+
+def _nbytes(param):
+    return param.numel() * param.dtype.bytes
+
+
+def _partition_parameters(params, world_size):
+    # Greedy balancing of the bytes: the largest parameters first, each to the
+    # rank owning the fewest bytes.
+    partitions = [[] for _ in range(world_size)]
+    partition_sizes = [0] * world_size
+    for param in sorted(params, key=_nbytes, reverse=True):
+        rank = partition_sizes.index(min(partition_sizes))
+        partitions[rank].append(param)
+        partition_sizes[rank] += _nbytes(param)
+    order = {param: i for (i, param) in enumerate(params)}
+    return [sorted(partition, key=order.__getitem__) for partition in partitions]
+
+
+class _ShardedBuffer(object):
+    """The parameters of one dtype and device, and their gradients, in flat
+    buffers made of one shard per rank.
+    """
+
+    def __init__(self, params, world_size, rank):
+        self.rank = rank
+        self.partitions = _partition_parameters(params, world_size)
+        self.shard_size = max(
+            sum(numel_in_bucket(p) for p in partition) for partition in self.partitions
+        )
+        (dtype, device) = (params[0].dtype, params[0].device)
+        self.params = flow.zeros(
+            world_size * self.shard_size, dtype=dtype, device=device
+        )
+        self.grads = flow.zeros_like(self.params)
+        self.reduced_grads = flow.zeros(self.shard_size, dtype=dtype, device=device)
+        with flow.no_grad():
+            for (i, partition) in enumerate(self.partitions):
+                offset = i * self.shard_size
+                for p in partition:
+                    (size, shape) = (p.numel(), p.shape)
+                    self.params[offset : offset + size] = p.detach().view(-1)
+                    p.data = self.params[offset : offset + size].view(shape)
+                    p.grad = self.grads[offset : offset + size].view(shape)
+                    offset += numel_in_bucket(p)
+
+    def local_shard(self, buffer):
+        return buffer[self.rank * self.shard_size : (self.rank + 1) * self.shard_size]
+
+
+class ZeroRedundancyOptimizer(Optimizer):
+    r"""Wraps an optimizer to shard its states over the ranks, i.e. ZeRO stage 1
+    for local tensors.
+
+    Every rank owns the parameters of a shard, balanced by bytes, and only
+    keeps the states of the optimizer of these parameters, which divides the
+    memory of the states by the world size. At every step, the gradients are
+    reduce-scattered, i.e. every rank only receives the average of the
+    gradients of its shard, every rank updates its shard, and the updated
+    shards are all-gathered. A rank may own no parameter of a group, e.g. when
+    there are fewer parameters than ranks, in which case it only takes part in
+    the collectives.
+
+    The gradients are not sharded: backward still computes the gradients of all
+    the parameters into a flat buffer on every rank. With ``reduce_scatter``,
+    after :meth:`step` only the gradients of the shard of the rank are
+    averaged, the gradients of the other parameters keep the local values of
+    the rank.
+
+    The parameters and their gradients are moved into flat buffers, so the
+    gradients are averaged by the optimizer: the model should not be wrapped by
+    :func:`~flow.nn.parallel.DistributedDataParallel`. The parameters are
+    broadcast from rank 0 when the optimizer is created.
+
+    Args:
+        params (iterable): the parameters or dicts of parameter groups.
+        optimizer_class (type): the class of the optimizer of the shards, e.g.
+            :class:`~flow.optim.Adam`.
+        reduce_scatter (bool, optional): ``True`` to reduce-scatter the
+            gradients, or ``False`` to allreduce them, e.g. to clip their norm
+            before the step, in which case all the gradients are averaged.
+            Default: ``True``.
+        **defaults: the options of ``optimizer_class``.
+
+    :meth:`state_dict` and :meth:`load_state_dict` save and load the states of
+    the shard of the rank.
+
+    For example:
+
+    .. code-block:: python
+
+        >>> model = flow.nn.Linear(1024, 1024)  # doctest: +SKIP
+        >>> optimizer = flow.nn.parallel.ZeroRedundancyOptimizer(
+        ...     model.parameters(), flow.optim.Adam, lr=1e-3
+        ... )  # doctest: +SKIP
+        >>> model(x).sum().backward()  # doctest: +SKIP
+        >>> optimizer.step()  # doctest: +SKIP
+
+    """
+
+    def __init__(
+        self,
+        params,
+        optimizer_class: Type[Optimizer],
+        *,
+        reduce_scatter: bool = True,
+        **defaults,
+    ):
+        for option in ("contiguous_params", "clip_grad_max_norm"):
+            if defaults.get(option):
+                raise ValueError(
+                    "{} is not supported by ZeroRedundancyOptimizer".format(option)
+                )
+        super().__init__(params, defaults)
+        self.reduce_scatter = reduce_scatter
+        self.world_size = flow.env.get_world_size()
+        self.rank = flow.env.get_rank()
+
+        params = [
+            p
+            for group in self.param_groups
+            for p in group.parameters
+            if p.requires_grad
+        ]
+        if any(p._ref_tensor is not None for p in params):
+            raise ValueError(
+                "parameters are already in contiguous buffers, e.g. of "
+                "DistributedDataParallel, which ZeroRedundancyOptimizer replaces"
+            )
+        params_by_key = collections.OrderedDict()
+        for p in params:
+            params_by_key.setdefault((p.dtype, p.device), []).append(p)
+        self._buffers = [
+            _ShardedBuffer(params, self.world_size, self.rank)
+            for params in params_by_key.values()
+        ]
+        for buffer in self._buffers:
+            flow._C.comm_broadcast(buffer.params, inplace=True)
+
+        local_params = set(
+            p for buffer in self._buffers for p in buffer.partitions[self.rank]
+        )
+        local_param_groups = []
+        for group in self.param_groups:
+            local_group = self._group_options(group)
+            # Empty if the rank owns no parameter of the group, which keeps the
+            # groups of all the ranks aligned for lr schedulers.
+            local_group["params"] = [p for p in group.parameters if p in local_params]
+            local_param_groups.append(local_group)
+        self.optimizer = optimizer_class(local_param_groups, **defaults)
+        # The default options of optimizer_class, e.g. for lr schedulers.
+        for (group, local_group) in zip(self.param_groups, self.optimizer.param_groups):
+            for (k, v) in self._group_options(local_group).items():
+                group.setdefault(k, v)
+
+    @staticmethod
+    def _group_options(group):
+        return {
+            k: v
+            for (k, v) in group.items()
+            if k not in ("params", "contiguous_params", "_enable_clip_grad")
+        }
+
+    def _reduce_gradients(self):
+        for buffer in self._buffers:
+            if self.reduce_scatter:
+                flow._C.local_reduce_scatter(buffer.reduced_grads, buffer.grads)
+                grads = buffer.local_shard(buffer.grads)
+                grads.copy_(buffer.reduced_grads)
+            else:
+                grads = buffer.grads
+                flow._C.local_all_reduce(grads, inplace=True)
+            grads.mul_(1 / self.world_size)
+
+    def step(self, closure: Union[Callable, None] = None) -> Union[Tensor, None]:
+        """Averages the gradients, updates the shard of the rank and gathers the
+        updated shards of all ranks.
+
+        Args:
+            closure (Union[Callable, None], optional): A closure that reevaluates
+                the model and returns the loss.
+
+        Returns:
+            Union[Tensor, None]: The loss.
+        """
+        loss = None
+        if closure is not None:
+            with flow.enable_grad():
+                loss = closure()
+        self._reduce_gradients()
+        # Options such as the learning rate are set on the wrapper, e.g. by
+        # learning rate schedulers.
+        for (group, local_group) in zip(self.param_groups, self.optimizer.param_groups):
+            local_group.update(self._group_options(group))
+        self.optimizer.step()
+        with flow.no_grad():
+            for buffer in self._buffers:
+                flow._C.local_all_gather(
+                    buffer.params, buffer.local_shard(buffer.params)
+                )
+        return loss
+
+    def zero_grad(self, set_to_none: bool = False):
+        """Sets the gradients to zero. The gradients are views of flat buffers,
+        so they are never set to ``None``.
+        """
+        for buffer in self._buffers:
+            buffer.grads.zero_()
+
+    def state_dict(self):
+        """Returns the states of the optimizer of the shard of this rank."""
+        return self.optimizer.state_dict()
+
+    def load_state_dict(self, state_dict) -> None:
+        """Loads the states of the optimizer of the shard of this rank."""
+        self.optimizer.load_state_dict(state_dict)
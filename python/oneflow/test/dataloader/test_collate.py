@@ -0,0 +1,108 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import unittest
+from collections import namedtuple
+from multiprocessing.reduction import ForkingPickler
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.multiprocessing.arena import SharedMemoryArena
+from oneflow.utils.data._utils.collate import collate_buffer_allocator
+from oneflow.utils.data._utils.collate import default_collate
+
+Sample = namedtuple("Sample", ["image", "label"])
+
+
+def _make_batch(batch_size=4):
+    return [
+        {
+            "sample": Sample(
+                np.full((2, 3), i, dtype=np.uint8), np.array(i, dtype=np.int32)
+            ),
+            "weight": float(i) / 2,
+            "index": i,
+            "feature": flow.ones(5) * i,
+            "name": str(i),
+        }
+        for i in range(batch_size)
+    ]
+
+
+def _check_batch(test_case, batch, batch_size=4):
+    indices = np.arange(batch_size)
+    image = batch["sample"].image
+    test_case.assertEqual(image.dtype, flow.uint8)
+    test_case.assertEqual(image.shape, flow.Size([batch_size, 2, 3]))
+    expected_image = np.broadcast_to(indices[:, None, None], (batch_size, 2, 3))
+    test_case.assertTrue(np.array_equal(image.numpy(), expected_image))
+    test_case.assertEqual(batch["sample"].label.dtype, flow.int32)
+    test_case.assertTrue(np.array_equal(batch["sample"].label.numpy(), indices))
+    test_case.assertEqual(batch["weight"].dtype, flow.float64)
+    test_case.assertTrue(np.array_equal(batch["weight"].numpy(), indices / 2))
+    test_case.assertEqual(batch["index"].dtype, flow.int64)
+    test_case.assertTrue(np.array_equal(batch["index"].numpy(), indices))
+    test_case.assertTrue(
+        np.array_equal(batch["feature"].numpy(), np.repeat(indices[:, None], 5, 1))
+    )
+    test_case.assertEqual(batch["name"], [str(i) for i in indices])
+
+
+@flow.unittest.skip_unless_1n1d()
+class TestCollate(flow.unittest.TestCase):
+    def test_default_collate_nested(test_case):
+        _check_batch(test_case, default_collate(_make_batch()))
+
+    def test_default_collate_with_allocator(test_case):
+        shapes = []
+
+        def allocate(shape, dtype):
+            shapes.append(shape)
+            return flow.empty(shape, dtype=flow.float32) if dtype == np.uint8 else None
+
+        with collate_buffer_allocator(allocate):
+            batch = default_collate(
+                [np.full((2, 3), i, dtype=np.uint8) for i in range(4)]
+            )
+            label = default_collate([1, 2, 3, 4])
+        # The allocator is only used in the context.
+        default_collate([np.zeros(2, dtype=np.uint8)] * 4)
+        test_case.assertEqual(shapes, [(4, 2, 3), (4,)])
+        test_case.assertEqual(batch.dtype, flow.float32)
+        test_case.assertTrue(np.array_equal(batch.numpy()[:, 0, 0], [0, 1, 2, 3]))
+        test_case.assertEqual(label.dtype, flow.int64)
+
+    def test_default_collate_into_shared_memory_arena(test_case):
+        arena = SharedMemoryArena(2)
+        with collate_buffer_allocator(arena.allocate):
+            for _ in range(3):
+                batch = default_collate(_make_batch())
+                num_in_slab = len(arena.batch_tensors_)
+                packed = arena.pack(batch)
+                rebuilt = ForkingPickler.loads(ForkingPickler.dumps(packed))
+                _check_batch(test_case, rebuilt)
+                del batch, packed, rebuilt
+                flow._oneflow_internal.eager.Sync()
+        # All the fields but the strings are collated into the slab.
+        test_case.assertEqual(num_in_slab, 5)
+        test_case.assertEqual(arena.num_slab_allocations, 2)
+        test_case.assertEqual(arena.refcnts_.tolist(), [0, 0])
+        arena.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import unittest
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.utils.data import (
+    BatchSampler,
+    DataLoader,
+    DistributedSampler,
+    RandomSampler,
+)
+
+
+class RecordingDataset(flow.utils.data.Dataset):
+    def __init__(self, length=50):
+        self.length = length
+        self.loaded = []
+
+    def __getitem__(self, index):
+        self.loaded.append(index)
+        return np.array([index], dtype=np.int64)
+
+    def __len__(self):
+        return self.length
+
+
+def _split(iterable, num_first):
+    it = iter(iterable)
+    first = [next(it) for _ in range(num_first)]
+    return first, list(it)
+
+
+def _as_lists(batches):
+    return [b.numpy().flatten().tolist() for b in batches]
+
+
+@flow.unittest.skip_unless_1n1d()
+class TestDataLoaderState(flow.unittest.TestCase):
+    def test_random_sampler_resume(test_case):
+        for kwargs in ({}, {"replacement": True, "num_samples": 100}):
+            sampler = RandomSampler(range(50), **kwargs)
+            it = iter(sampler)
+            first = [next(it) for _ in range(37)]
+            state = sampler.state_dict()
+            test_case.assertEqual(state["num_consumed"], 37)
+            rest = list(it)
+            resumed = RandomSampler(range(50), **kwargs)
+            resumed.load_state_dict(state)
+            test_case.assertEqual(list(resumed), rest)
+            # Only the next iteration is resumed.
+            test_case.assertEqual(len(list(resumed)), len(first) + len(rest))
+
+    def test_batch_sampler_resume(test_case):
+        for sampler in (RandomSampler(range(23)), list(range(23))):
+            batch_sampler = BatchSampler(sampler, 4, drop_last=False)
+            _, rest = _split(batch_sampler, 2)
+            state = batch_sampler.state_dict()
+            test_case.assertEqual(state["num_consumed"], 6)
+            state["num_consumed"] = 2
+            batch_sampler.load_state_dict(state)
+            test_case.assertEqual(list(batch_sampler), rest)
+
+    def test_distributed_sampler_resume(test_case):
+        for lazy_shuffle in (False, True):
+            sampler = DistributedSampler(range(50), 4, 2, lazy_shuffle=lazy_shuffle)
+            sampler.set_epoch(3)
+            _, rest = _split(sampler, 5)
+            state = sampler.state_dict()
+            resumed = DistributedSampler(range(50), 4, 2, lazy_shuffle=lazy_shuffle)
+            resumed.load_state_dict(state)
+            test_case.assertEqual(resumed.epoch, 3)
+            test_case.assertEqual(list(resumed), rest)
+
+    def test_dataloader_resume(test_case):
+        for (num_workers, persistent_workers) in ((0, False), (2, False), (2, True)):
+            loader = DataLoader(
+                RecordingDataset(),
+                batch_size=4,
+                shuffle=True,
+                num_workers=num_workers,
+                persistent_workers=persistent_workers,
+            )
+            it = iter(loader)
+            first = _as_lists(next(it) for _ in range(3))
+            state = loader.state_dict()
+            test_case.assertEqual(state["num_yielded"], 3)
+            rest = _as_lists(it)
+            test_case.assertEqual(
+                sorted(sum(first + rest, [])), list(range(len(loader.dataset)))
+            )
+            dataset = RecordingDataset()
+            resumed = DataLoader(
+                dataset,
+                batch_size=4,
+                shuffle=True,
+                num_workers=num_workers,
+                persistent_workers=persistent_workers,
+            )
+            resumed.load_state_dict(state)
+            test_case.assertEqual(_as_lists(resumed), rest)
+            if num_workers == 0:
+                # The batches before the resumed position are never loaded.
+                test_case.assertEqual(sorted(dataset.loaded), sorted(sum(rest, [])))
+            test_case.assertEqual(resumed.state_dict()["num_yielded"], len(loader))
+            # The next epoch starts from the beginning.
+            test_case.assertEqual(len(_as_lists(resumed)), len(loader))
+
+    def test_resume_persistent_iterator_in_place(test_case):
+        loader = DataLoader(
+            RecordingDataset(20), batch_size=3, num_workers=2, persistent_workers=True
+        )
+        expected = _as_lists(loader)
+        it = iter(loader)
+        next(it)
+        next(it)
+        state = loader.state_dict()
+        next(it)
+        loader.load_state_dict(state)
+        test_case.assertEqual(_as_lists(loader), expected[2:])
+
+    def test_resume_without_sampler_state(test_case):
+        loader = DataLoader(RecordingDataset(), batch_sampler=[[0, 1], [2, 3], [4, 5]])
+        it = iter(loader)
+        next(it)
+        with test_case.assertRaises(ValueError):
+            DataLoader(RecordingDataset(), batch_sampler=[[0, 1]]).load_state_dict(
+                loader.state_dict()
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
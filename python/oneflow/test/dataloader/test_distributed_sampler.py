@@ -0,0 +1,105 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import unittest
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.utils.data import DistributedSampler
+
+
+class RangeDataset(flow.utils.data.Dataset):
+    def __init__(self, length):
+        self.length = length
+
+    def __getitem__(self, index):
+        return index
+
+    def __len__(self):
+        return self.length
+
+
+def _rank_indices(dataset, num_replicas, **kwargs):
+    return [
+        list(DistributedSampler(dataset, num_replicas, rank, **kwargs))
+        for rank in range(num_replicas)
+    ]
+
+
+@flow.unittest.skip_unless_1n1d()
+class TestDistributedSampler(flow.unittest.TestCase):
+    def test_lazy_shuffle_partitions_dataset(test_case):
+        for length in (1, 10, 17, 1000):
+            for num_replicas in (1, 3, 4):
+                for drop_last in (False, True):
+                    dataset = RangeDataset(length)
+                    eager = _rank_indices(dataset, num_replicas, drop_last=drop_last)
+                    lazy = _rank_indices(
+                        dataset, num_replicas, drop_last=drop_last, lazy_shuffle=True
+                    )
+                    test_case.assertEqual(
+                        [len(x) for x in lazy], [len(x) for x in eager]
+                    )
+                    merged = sorted(sum(lazy, []))
+                    test_case.assertEqual(merged, sorted(sum(eager, [])))
+                    if drop_last:
+                        test_case.assertEqual(len(set(merged)), len(merged))
+                    else:
+                        test_case.assertEqual(set(merged), set(range(length)))
+
+    def test_lazy_shuffle_epochs(test_case):
+        sampler = DistributedSampler(RangeDataset(100), 2, 0, lazy_shuffle=True)
+        first = list(sampler)
+        test_case.assertEqual(first, list(sampler))
+        sampler.set_epoch(1)
+        test_case.assertNotEqual(first, list(sampler))
+        test_case.assertNotEqual(first, sorted(first))
+
+    def test_unshuffled_order(test_case):
+        dataset = RangeDataset(10)
+        test_case.assertEqual(
+            _rank_indices(dataset, 4, shuffle=False),
+            [[0, 4, 8], [1, 5, 9], [2, 6, 0], [3, 7, 1]],
+        )
+        test_case.assertEqual(
+            _rank_indices(dataset, 4, shuffle=False, drop_last=True),
+            [[0, 4], [1, 5], [2, 6], [3, 7]],
+        )
+
+    def test_set_start_index(test_case):
+        for lazy_shuffle in (False, True):
+            sampler = DistributedSampler(
+                RangeDataset(50), 3, 1, lazy_shuffle=lazy_shuffle
+            )
+            full = list(sampler)
+            sampler.set_start_index(7)
+            test_case.assertEqual(list(sampler), full[7:])
+            # The offset only applies to the next iteration.
+            test_case.assertEqual(list(sampler), full)
+            with test_case.assertRaises(ValueError):
+                sampler.set_start_index(len(sampler) + 1)
+
+    def test_lazy_shuffle_huge_dataset(test_case):
+        # The indices are generated lazily, so the order of 10^10 indices is
+        # never materialized.
+        sampler = DistributedSampler(RangeDataset(10 ** 10), 8, 3, lazy_shuffle=True)
+        it = iter(sampler)
+        indices = [next(it) for _ in range(1000)]
+        test_case.assertEqual(len(set(indices)), 1000)
+        test_case.assertTrue(all(0 <= idx < 10 ** 10 for idx in indices))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import unittest
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+
+
+class RangeDataset(flow.utils.data.Dataset):
+    def __init__(self, length, offset=0):
+        self.length = length
+        self.offset = offset
+
+    def __getitem__(self, index):
+        return (
+            flow.tensor([index + self.offset], dtype=flow.float32),
+            flow.tensor(index + self.offset),
+        )
+
+    def __len__(self):
+        return self.length
+
+
+class BatchedRangeDataset(RangeDataset):
+    def __init__(self, length):
+        super().__init__(length)
+        self.num_getitems_calls = 0
+        self.indices_types = []
+
+    def __getitems__(self, indices):
+        self.num_getitems_calls += 1
+        self.indices_types.append(type(indices))
+        return [self[idx] for idx in indices]
+
+
+def _tensor_dataset(length, offset=0):
+    x = flow.arange(offset, offset + length, dtype=flow.float32).reshape(length, 1)
+    y = flow.arange(offset, offset + length)
+    return flow.utils.data.TensorDataset(x, y)
+
+
+def _check_samples(test_case, samples, expected_indices):
+    test_case.assertEqual(len(samples), len(expected_indices))
+    for ((x, y), index) in zip(samples, expected_indices):
+        test_case.assertEqual(x.numpy().tolist(), [index])
+        test_case.assertEqual(y.item(), index)
+
+
+@flow.unittest.skip_unless_1n1d()
+class TestGetItems(flow.unittest.TestCase):
+    def test_tensor_dataset_getitems(test_case):
+        dataset = _tensor_dataset(10)
+        _check_samples(test_case, dataset.__getitems__([3, 0, 9, 3]), [3, 0, 9, 3])
+        _check_samples(test_case, dataset.__getitems__([-1, -10]), [9, 0])
+        _check_samples(test_case, dataset.__getitems__(flow.tensor([-2, 1])), [8, 1])
+        with test_case.assertRaises(IndexError):
+            dataset.__getitems__(np.array([10]))
+        x, y = flow.utils.data._utils.collate.default_collate(
+            dataset.__getitems__([1, 2])
+        )
+        test_case.assertEqual(x.shape, flow.Size([2, 1]))
+        test_case.assertEqual(y.numpy().tolist(), [1, 2])
+
+    def test_subset_getitems(test_case):
+        for dataset in (_tensor_dataset(10), RangeDataset(10)):
+            subset = flow.utils.data.Subset(dataset, [9, 7, 5, 3, 1])
+            _check_samples(test_case, subset.__getitems__([0, 4, 2]), [9, 1, 5])
+            _check_samples(test_case, subset.__getitems__(np.array([-1, 1])), [1, 7])
+            _check_samples(test_case, subset.__getitems__(flow.tensor([3])), [3])
+        # The wrapped dataset gets indices of the type given to the subset.
+        dataset = BatchedRangeDataset(10)
+        subset = flow.utils.data.Subset(dataset, [9, 7, 5, 3, 1])
+        _check_samples(test_case, subset.__getitems__([0, 4]), [9, 1])
+        _check_samples(test_case, subset.__getitems__(np.array([1])), [7])
+        test_case.assertEqual(dataset.indices_types, [list, np.ndarray])
+
+    def test_concat_dataset_getitems(test_case):
+        for datasets in (
+            [_tensor_dataset(4), _tensor_dataset(3, offset=4), _tensor_dataset(5, 7)],
+            [_tensor_dataset(4), RangeDataset(3, offset=4), _tensor_dataset(5, 7)],
+        ):
+            dataset = flow.utils.data.ConcatDataset(datasets)
+            indices = [11, 0, 5, 3, -1, 4, 8]
+            expected = [index % len(dataset) for index in indices]
+            _check_samples(test_case, dataset.__getitems__(indices), expected)
+            with test_case.assertRaises(ValueError):
+                dataset.__getitems__([-13])
+            with test_case.assertRaises(IndexError):
+                dataset.__getitems__([0, 12])
+
+    def test_dataloader_uses_getitems(test_case):
+        dataset = BatchedRangeDataset(10)
+        loader = flow.utils.data.DataLoader(dataset, batch_size=4)
+        batches = list(loader)
+        test_case.assertEqual(dataset.num_getitems_calls, 3)
+        test_case.assertEqual(batches[-1][1].numpy().tolist(), [8, 9])
+        batched = list(flow.utils.data.DataLoader(_tensor_dataset(10), batch_size=4))
+        for ((x, y), (expected_x, expected_y)) in zip(batched, batches):
+            test_case.assertTrue(np.array_equal(x.numpy(), expected_x.numpy()))
+            test_case.assertTrue(np.array_equal(y.numpy(), expected_y.numpy()))
+
+
+if __name__ == "__main__":
+    unittest.main()
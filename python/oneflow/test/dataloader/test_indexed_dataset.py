@@ -0,0 +1,124 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import pickle
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.utils.data import (
+    DataLoader,
+    DistributedSampler,
+    IndexedBinDataset,
+    IndexedRecordDataset,
+)
+from oneflow.utils.data.record import main as build_record_indices
+
+
+def _record(i):
+    return "record-{}".format(i).encode() * (1 + i % 5)
+
+
+def _write_part_files(root, records_per_file):
+    i = 0
+    for (part, num_records) in enumerate(records_per_file):
+        with open(os.path.join(root, "part-{}".format(part)), "wb") as f:
+            for _ in range(num_records):
+                f.write(struct.pack("<q", len(_record(i))) + _record(i))
+                i += 1
+    return i
+
+
+def _write_megatron_dataset(prefix, sequences):
+    with open(prefix + ".bin", "wb") as f:
+        for sequence in sequences:
+            f.write(np.asarray(sequence, dtype=np.uint16).tobytes())
+    sizes = np.array([len(s) for s in sequences], dtype=np.int32)
+    pointers = np.concatenate(([0], np.cumsum(sizes[:-1]) * 2)).astype(np.int64)
+    doc_offsets = np.arange(len(sequences) + 1, dtype=np.int64)
+    with open(prefix + ".idx", "wb") as f:
+        f.write(b"MMIDIDX\x00\x00" + struct.pack("<QB", 1, 8))
+        f.write(struct.pack("<QQ", len(sequences), len(doc_offsets)))
+        f.write(sizes.tobytes() + pointers.tobytes() + doc_offsets.tobytes())
+
+
+@flow.unittest.skip_unless_1n1d()
+class TestIndexedDataset(flow.unittest.TestCase):
+    def test_random_access(test_case):
+        with tempfile.TemporaryDirectory() as root:
+            n = _write_part_files(root, [7, 0, 12, 3])
+            with test_case.assertRaises(FileNotFoundError):
+                IndexedRecordDataset(root)
+            build_record_indices([root, "--num_threads", "2"])
+            dataset = IndexedRecordDataset(root)
+            test_case.assertEqual(len(dataset), n)
+            expected = [_record(i) for i in range(n)]
+            test_case.assertEqual([dataset[i] for i in range(n)], expected)
+            test_case.assertEqual(dataset[-1], _record(n - 1))
+            indices = np.array([21, 0, 7, 6, 19], dtype=np.int64)
+            test_case.assertEqual(
+                dataset.__getitems__(indices), [_record(i) for i in indices.tolist()]
+            )
+            with test_case.assertRaises(IndexError):
+                dataset[n]
+            restored = pickle.loads(pickle.dumps(dataset))
+            test_case.assertEqual(restored[8], _record(8))
+
+    def test_exact_partition_and_global_shuffle(test_case):
+        with tempfile.TemporaryDirectory() as root:
+            n = _write_part_files(root, [30, 1, 2])
+            dataset = IndexedRecordDataset(root, build_index=True)
+            shards = [
+                [dataset[i] for i in DistributedSampler(dataset, 4, rank)]
+                for rank in range(4)
+            ]
+            test_case.assertEqual([len(s) for s in shards], [9, 9, 9, 9])
+            test_case.assertEqual(
+                set(sum(shards, [])), set(_record(i) for i in range(n))
+            )
+            loader = DataLoader(
+                dataset,
+                batch_size=4,
+                shuffle=True,
+                num_workers=2,
+                collate_fn=lambda batch: batch,
+            )
+            records = sum(list(loader), [])
+            test_case.assertEqual(sorted(records), sorted(_record(i) for i in range(n)))
+
+    def test_megatron_indexed_dataset(test_case):
+        sequences = [[1, 2, 3], [65535], [], [4, 5, 6, 7, 8]]
+        with tempfile.TemporaryDirectory() as root:
+            prefix = os.path.join(root, "gpt_text_document")
+            _write_megatron_dataset(prefix, sequences)
+            dataset = IndexedBinDataset(prefix)
+            test_case.assertEqual(len(dataset), 4)
+            test_case.assertEqual(dataset.dtype, np.uint16)
+            test_case.assertEqual([dataset[i].tolist() for i in range(4)], sequences)
+            test_case.assertEqual(dataset.get(3, 1, 2).tolist(), [5, 6])
+            test_case.assertEqual(dataset[-1].tolist(), sequences[-1])
+            with test_case.assertRaises(IndexError):
+                dataset.get(0, 2, 2)
+            restored = pickle.loads(pickle.dumps(dataset))
+            test_case.assertEqual(restored[0].tolist(), sequences[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import unittest
+from collections import namedtuple
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.utils.data._utils.collate import collate_buffer_allocator
+from oneflow.utils.data._utils.collate import default_collate
+from oneflow.utils.data._utils.pin_memory import pin_memory
+
+Sample = namedtuple("Sample", ["image", "label"])
+
+
+def _make_batch(batch_size=8):
+    return [
+        np.random.randint(0, 256, (3, 32, 32), dtype=np.uint8)
+        for _ in range(batch_size)
+    ]
+
+
+@flow.unittest.skip_unless_1n1d()
+class TestPinnedMemoryPool(flow.unittest.TestCase):
+    def test_buffers_are_reused(test_case):
+        pool = flow.utils.data.PinnedMemoryPool(pin_memory=False)
+        for i in range(5):
+            with collate_buffer_allocator(pool.allocate):
+                batch = default_collate(_make_batch())
+            test_case.assertEqual(batch.shape, flow.Size([8, 3, 32, 32]))
+            test_case.assertEqual(batch.dtype, flow.uint8)
+            del batch
+            flow._oneflow_internal.eager.Sync()
+        test_case.assertEqual(pool.num_allocations, 1)
+        test_case.assertEqual(pool.num_reuses, 4)
+        pool.empty_cache()
+        x = pool.allocate((3,), np.float32)
+        test_case.assertEqual(pool.num_allocations, 2)
+        test_case.assertEqual(x.shape, flow.Size([3]))
+
+    def test_buffers_in_use_are_not_reused(test_case):
+        pool = flow.utils.data.PinnedMemoryPool(pin_memory=False)
+        x = pool.allocate((16,), np.int64)
+        x.fill_(1)
+        y = pool.allocate((16,), np.int64)
+        y.fill_(2)
+        test_case.assertEqual(pool.num_allocations, 2)
+        test_case.assertTrue(np.array_equal(x.numpy(), np.ones(16)))
+        del x
+        z = pool.allocate((16,), np.int64)
+        test_case.assertEqual(pool.num_allocations, 2)
+        test_case.assertEqual(pool.num_reuses, 1)
+        # A block is not shared by tensors in use.
+        z.fill_(3)
+        test_case.assertTrue(np.array_equal(y.numpy(), np.full(16, 2)))
+
+    def test_blocks_are_cached_per_dtype(test_case):
+        pool = flow.utils.data.PinnedMemoryPool(pin_memory=False)
+        x = pool.allocate((2, 3), np.float32)
+        test_case.assertEqual(x.dtype, flow.float32)
+        test_case.assertEqual(x.shape, flow.Size([2, 3]))
+        del x
+        y = pool.allocate((5,), np.int32)
+        test_case.assertEqual(y.dtype, flow.int32)
+        test_case.assertEqual(pool.num_allocations, 2)
+        del y
+        pool.allocate((4, 4), np.float32)
+        test_case.assertEqual(pool.num_reuses, 1)
+
+    def test_pin_nested(test_case):
+        pool = flow.utils.data.PinnedMemoryPool(pin_memory=False)
+        image = flow.randn(4, 3)
+        label = flow.arange(4)
+        data = {"sample": Sample(image, label), "names": ["a", "b"], "size": 4}
+        out = pin_memory(data, pool)
+        test_case.assertTrue(np.array_equal(out["sample"].image.numpy(), image.numpy()))
+        test_case.assertTrue(np.array_equal(out["sample"].label.numpy(), label.numpy()))
+        test_case.assertEqual(out["sample"].label.dtype, flow.int64)
+        test_case.assertEqual(out["names"], ["a", "b"])
+        test_case.assertEqual(out["size"], 4)
+        test_case.assertEqual(pool.num_allocations, 2)
+        # Tensors from the pool are not copied again.
+        test_case.assertIs(pool.pin(out["sample"].image), out["sample"].image)
+
+    def test_device_prefetcher(test_case):
+        dataset = flow.utils.data.TensorDataset(flow.randn(10, 3), flow.arange(10))
+        loader = flow.utils.data.DataLoader(dataset, batch_size=4)
+        pool = flow.utils.data.PinnedMemoryPool(pin_memory=False)
+        for num_prefetch in (1, 2, 5):
+            prefetcher = flow.utils.data.DevicePrefetcher(
+                loader, "cpu", num_prefetch=num_prefetch, pool=pool
+            )
+            test_case.assertEqual(len(prefetcher), 3)
+            batches = list(prefetcher)
+            test_case.assertEqual(len(batches), 3)
+            for ((x, y), (expected_x, expected_y)) in zip(batches, loader):
+                test_case.assertEqual(x.device, flow.device("cpu"))
+                test_case.assertTrue(np.array_equal(x.numpy(), expected_x.numpy()))
+                test_case.assertTrue(np.array_equal(y.numpy(), expected_y.numpy()))
+        with test_case.assertRaises(ValueError):
+            flow.utils.data.DevicePrefetcher(loader, "cpu", num_prefetch=0)
+
+    @unittest.skipIf(os.getenv("ONEFLOW_TEST_CPU_ONLY"), "only test cpu cases")
+    def test_pool_tensors_are_pinned(test_case):
+        pool = flow.utils.data.PinnedMemoryPool()
+        with collate_buffer_allocator(pool.allocate):
+            batch = default_collate(_make_batch())
+        test_case.assertTrue(batch.is_pinned())
+        x = flow.randn(4, 3)
+        pinned = pool.pin(x)
+        test_case.assertTrue(pinned.is_pinned())
+        test_case.assertTrue(np.array_equal(pinned.numpy(), x.numpy()))
+        test_case.assertIs(pool.pin(pinned), pinned)
+        test_case.assertTrue(np.array_equal(batch.to("cuda").numpy(), batch.numpy()))
+
+    @unittest.skipIf(os.getenv("ONEFLOW_TEST_CPU_ONLY"), "only test cpu cases")
+    def test_dataloader_shares_the_pool(test_case):
+        dataset = flow.utils.data.TensorDataset(flow.randn(8, 3))
+        loader = flow.utils.data.DataLoader(dataset, batch_size=4, pin_memory=True)
+        num_allocations = None
+        for _ in range(3):
+            for (x,) in loader:
+                test_case.assertTrue(x.is_pinned())
+            del x
+            pool = loader._pinned_memory_pool
+            test_case.assertIsNotNone(pool)
+            if num_allocations is None:
+                num_allocations = pool.num_allocations
+            # The blocks of the first epoch are reused by the next ones.
+            test_case.assertEqual(pool.num_allocations, num_allocations)
+        test_case.assertIs(iter(loader)._pinned_memory_pool, pool)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.utils.data import (
+    DataLoader,
+    RecordFileDataset,
+    build_record_index,
+    decode_ofrecord,
+    load_record_index,
+)
+
+
+def _record(i):
+    return "record-{}".format(i).encode() * (1 + i % 7)
+
+
+def _write_part_files(root, num_files, records_per_file, tfrecord=False):
+    i = 0
+    for part in range(num_files):
+        with open(os.path.join(root, "part-{:05d}".format(part)), "wb") as f:
+            for _ in range(records_per_file):
+                record = _record(i)
+                f.write(struct.pack("<q", len(record)))
+                if tfrecord:
+                    f.write(b"\0" * 4)
+                f.write(record)
+                if tfrecord:
+                    f.write(b"\0" * 4)
+                i += 1
+    return i
+
+
+def _shards(root, num_replicas, **kwargs):
+    return [
+        list(RecordFileDataset(root, num_replicas=num_replicas, rank=rank, **kwargs))
+        for rank in range(num_replicas)
+    ]
+
+
+@flow.unittest.skip_unless_1n1d()
+class TestRecordFileDataset(flow.unittest.TestCase):
+    def test_read_in_order(test_case):
+        for tfrecord in (False, True):
+            with tempfile.TemporaryDirectory() as root:
+                n = _write_part_files(root, 3, 40, tfrecord=tfrecord)
+                dataset = RecordFileDataset(
+                    root,
+                    "tfrecord" if tfrecord else "ofrecord",
+                    num_replicas=1,
+                    rank=0,
+                    read_ahead_size=100,
+                )
+                test_case.assertEqual(list(dataset), [_record(i) for i in range(n)])
+
+    def test_shard_by_rank(test_case):
+        with tempfile.TemporaryDirectory() as root:
+            n = _write_part_files(root, 4, 25)
+            for f in sorted(os.listdir(root)):
+                build_record_index(os.path.join(root, f))
+            expected = sorted(_record(i) for i in range(n))
+            for (num_replicas, use_index) in ((2, False), (5, False), (3, True)):
+                shards = _shards(root, num_replicas, use_index=use_index)
+                test_case.assertEqual(sorted(sum(shards, [])), expected)
+                if use_index:
+                    test_case.assertEqual([len(s) for s in shards], [33, 33, 34])
+
+    def test_shard_by_worker_and_shuffle(test_case):
+        with tempfile.TemporaryDirectory() as root:
+            n = _write_part_files(root, 2, 50)
+            dataset = RecordFileDataset(
+                root, shuffle=True, shuffle_buffer_size=16, num_replicas=1, rank=0
+            )
+            loader = DataLoader(
+                dataset, batch_size=None, num_workers=2, collate_fn=lambda x: x
+            )
+            first = list(loader)
+            test_case.assertEqual(sorted(first), sorted(_record(i) for i in range(n)))
+            test_case.assertEqual(first, list(loader))
+            dataset.set_epoch(1)
+            second = list(loader)
+            test_case.assertEqual(sorted(second), sorted(first))
+            test_case.assertNotEqual(second, first)
+
+    def test_record_index(test_case):
+        with tempfile.TemporaryDirectory() as root:
+            _write_part_files(root, 1, 10)
+            path = os.path.join(root, "part-00000")
+            offsets = load_record_index(build_record_index(path))
+            test_case.assertEqual(len(offsets), 11)
+            test_case.assertEqual(offsets[-1], os.path.getsize(path))
+            lengths = np.diff(offsets) - 8
+            expected = [len(_record(i)) for i in range(10)]
+            test_case.assertEqual(lengths.tolist(), expected)
+
+    def test_decode_ofrecord(test_case):
+        import oneflow.core.record.record_pb2 as record_util
+
+        record = record_util.OFRecord()
+        record.feature["label"].int32_list.value.append(7)
+        record.feature["image"].bytes_list.value.append(b"jpeg")
+        record.feature["box"].float_list.value.extend([0.5, 1.5])
+        features = decode_ofrecord(record.SerializeToString())
+        test_case.assertEqual(features["label"].tolist(), [7])
+        test_case.assertEqual(features["label"].dtype, np.int32)
+        test_case.assertEqual(features["image"], [b"jpeg"])
+        test_case.assertEqual(features["box"].tolist(), [0.5, 1.5])
+
+
+if __name__ == "__main__":
+    unittest.main()
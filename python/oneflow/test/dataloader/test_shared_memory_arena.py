@@ -0,0 +1,114 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import unittest
+from multiprocessing.reduction import ForkingPickler
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.multiprocessing import arena as arena_module
+from oneflow.multiprocessing.arena import SharedMemoryArena, detach_arenas
+
+
+class NestedDataset(flow.utils.data.Dataset):
+    def __init__(self, length=64):
+        self.length = length
+
+    def __getitem__(self, index):
+        image = np.full((3, 8, 8), index, dtype=np.float32)
+        return {"image": image, "meta": (index, np.array([index, -index]))}
+
+    def __len__(self):
+        return self.length
+
+
+def _iterate(loader):
+    return [
+        (batch["image"].numpy().copy(), batch["meta"][0].numpy().copy())
+        for batch in loader
+    ]
+
+
+@flow.unittest.skip_unless_1n1d()
+class TestSharedMemoryArena(flow.unittest.TestCase):
+    def test_pack_and_recycle(test_case):
+        arena = SharedMemoryArena(2)
+        for step in range(5):
+            x = flow.tensor(np.arange(12, dtype=np.float32).reshape(3, 4) + step)
+            y = flow.tensor(np.array([step], dtype=np.int64))
+            packed = arena.pack({"x": x, "xy": (x, y), "name": "batch"})
+            test_case.assertEqual(arena.refcnts_.tolist().count(2), 1)
+            batch = ForkingPickler.loads(ForkingPickler.dumps(packed))
+            test_case.assertEqual(batch["name"], "batch")
+            test_case.assertTrue(np.array_equal(batch["x"].numpy(), x.numpy()))
+            test_case.assertTrue(np.array_equal(batch["xy"][1].numpy(), [step]))
+            # The same tensor is rebuilt only once.
+            test_case.assertIs(batch["x"], batch["xy"][0])
+            del packed, batch
+            flow._oneflow_internal.eager.Sync()
+        test_case.assertEqual(arena.refcnts_.tolist(), [0, 0])
+        test_case.assertEqual(arena.num_packed, 5)
+        test_case.assertEqual(arena.num_slab_allocations, 2)
+        arena.close()
+
+    def test_pack_fallback_when_all_slabs_in_use(test_case):
+        arena = SharedMemoryArena(1)
+        x = flow.ones(4)
+        held = ForkingPickler.loads(ForkingPickler.dumps(arena.pack(x)))
+        test_case.assertIs(arena.pack(x), x)
+        test_case.assertEqual(arena.num_fallbacks, 1)
+        del held
+        flow._oneflow_internal.eager.Sync()
+        test_case.assertIsNot(arena.pack(x), x)
+        arena.close()
+
+    def test_release_after_detach(test_case):
+        arena = SharedMemoryArena(1)
+        packed = arena.pack(flow.ones(4))
+        t = ForkingPickler.loads(ForkingPickler.dumps(packed))
+        attached = arena_module._attached_arenas[arena.control_.name]
+        detach_arenas([os.getpid()])
+        test_case.assertEqual(len(attached.slabs), 1)
+        # The last tensor closes the detached arena once it is freed.
+        del packed, t
+        flow._oneflow_internal.eager.Sync()
+        test_case.assertEqual(attached.num_live_tensors, 0)
+        test_case.assertEqual(attached.slabs, [])
+        test_case.assertEqual(arena.refcnts_.tolist(), [0])
+        arena.close()
+
+    def test_dataloader_with_shared_memory_arena(test_case):
+        dataset = NestedDataset()
+        expected = _iterate(
+            flow.utils.data.DataLoader(dataset, batch_size=8, num_workers=2)
+        )
+        loader = flow.utils.data.DataLoader(
+            dataset, batch_size=8, num_workers=2, shared_memory_arena=True
+        )
+        for _ in range(2):
+            actual = _iterate(loader)
+            test_case.assertEqual(len(actual), len(expected))
+            for ((image, meta), (expected_image, expected_meta)) in zip(
+                actual, expected
+            ):
+                test_case.assertTrue(np.array_equal(image, expected_image))
+                test_case.assertTrue(np.array_equal(meta, expected_meta))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import unittest
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+
+
+class SquareDataset(flow.utils.data.Dataset):
+    def __init__(self, length=37):
+        self.length = length
+
+    def __getitem__(self, index):
+        if index < 0:
+            raise IndexError("negative index")
+        return np.array([index * index], dtype=np.int64)
+
+    def __len__(self):
+        return self.length
+
+
+class ShardedIterableDataset(flow.utils.data.IterableDataset):
+    def __init__(self, length=20):
+        self.length = length
+
+    def __iter__(self):
+        worker_info = flow.utils.data.get_worker_info()
+        return iter(range(worker_info.id, self.length, worker_info.num_workers))
+
+
+class SameTensorDataset(flow.utils.data.Dataset):
+    def __init__(self):
+        self.tensor = flow.ones(2, 3)
+
+    def __getitem__(self, index):
+        return self.tensor
+
+    def __len__(self):
+        return 4
+
+
+@flow.unittest.skip_unless_1n1d()
+class TestThreadWorkers(flow.unittest.TestCase):
+    def test_map_dataset_in_order(test_case):
+        dataset = SquareDataset()
+        expected = [b.numpy() for b in flow.utils.data.DataLoader(dataset, 4)]
+        loader = flow.utils.data.DataLoader(
+            dataset, 4, num_workers=4, prefetch_factor=3, worker_type="thread"
+        )
+        actual = [b.numpy() for b in loader]
+        test_case.assertEqual(len(actual), len(expected))
+        for (a, e) in zip(actual, expected):
+            test_case.assertTrue(np.array_equal(a, e))
+
+    def test_iterable_dataset_sharded_by_worker(test_case):
+        loader = flow.utils.data.DataLoader(
+            ShardedIterableDataset(), num_workers=3, worker_type="thread"
+        )
+        test_case.assertEqual(sorted(x.item() for x in loader), list(range(20)))
+        test_case.assertIsNone(flow.utils.data.get_worker_info())
+
+    def test_zero_copy_handoff(test_case):
+        dataset = SameTensorDataset()
+        loader = flow.utils.data.DataLoader(
+            dataset, num_workers=2, worker_type="thread", collate_fn=lambda b: b[0]
+        )
+        for x in loader:
+            test_case.assertIs(x, dataset.tensor)
+
+    def test_persistent_thread_workers(test_case):
+        loader = flow.utils.data.DataLoader(
+            SquareDataset(10),
+            5,
+            num_workers=2,
+            worker_type="thread",
+            persistent_workers=True,
+        )
+        for _ in range(2):
+            test_case.assertEqual(
+                [b.numpy().tolist() for b in loader],
+                [[[0], [1], [4], [9], [16]], [[25], [36], [49], [64], [81]]],
+            )
+
+    def test_worker_exception(test_case):
+        loader = flow.utils.data.DataLoader(
+            SquareDataset(), sampler=[0, -1], num_workers=2, worker_type="thread",
+        )
+        with test_case.assertRaises(IndexError):
+            list(loader)
+
+    def test_invalid_worker_type(test_case):
+        with test_case.assertRaises(ValueError):
+            flow.utils.data.DataLoader(
+                SquareDataset(), num_workers=2, worker_type="fiber"
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import unittest
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.utils.data import (
+    BatchSampler,
+    DataLoader,
+    RandomSampler,
+    SequentialSampler,
+)
+
+
+class IndexDataset(flow.utils.data.Dataset):
+    def __init__(self, length=30):
+        self.length = length
+
+    def __getitem__(self, index):
+        assert isinstance(index, int)
+        return np.array([index], dtype=np.int64)
+
+    def __len__(self):
+        return self.length
+
+
+def _generator(seed):
+    generator = flow.Generator("cpu")
+    generator.manual_seed(seed)
+    return generator
+
+
+def _samplers(length):
+    return [
+        lambda: SequentialSampler(range(length)),
+        lambda: RandomSampler(range(length), generator=_generator(1)),
+        lambda: RandomSampler(
+            range(length), replacement=True, num_samples=77, generator=_generator(2)
+        ),
+        lambda: list(range(length))[::-1],
+    ]
+
+
+@flow.unittest.skip_unless_1n1d()
+class TestVectorizedSampler(flow.unittest.TestCase):
+    def test_same_batches_as_lists(test_case):
+        for make_sampler in _samplers(50):
+            for drop_last in (False, True):
+                expected = list(BatchSampler(make_sampler(), 8, drop_last))
+                batches = list(
+                    BatchSampler(make_sampler(), 8, drop_last, vectorized=True)
+                )
+                for batch in batches:
+                    test_case.assertIsInstance(batch, np.ndarray)
+                    test_case.assertEqual(batch.dtype, np.int64)
+                test_case.assertEqual([b.tolist() for b in batches], expected)
+
+    def test_vectorized_resume(test_case):
+        for make_sampler in _samplers(50):
+            batch_sampler = BatchSampler(make_sampler(), 8, False, vectorized=True)
+            it = iter(batch_sampler)
+            next(it)
+            next(it)
+            state = batch_sampler.state_dict()
+            rest = [b.tolist() for b in it]
+            batch_sampler = BatchSampler(make_sampler(), 8, False, vectorized=True)
+            batch_sampler.load_state_dict(state)
+            test_case.assertEqual([b.tolist() for b in batch_sampler], rest)
+
+    def test_replacement_same_indices_as_small_draws(test_case):
+        num_samples = (1 << 16) + 40
+        sampler = RandomSampler(
+            range(10),
+            replacement=True,
+            num_samples=num_samples,
+            generator=_generator(4),
+        )
+        # The indices drawn 32 at a time, as RandomSampler used to.
+        generator = _generator(4)
+        expected = []
+        for begin in range(0, num_samples, 32):
+            size = min(32, num_samples - begin)
+            expected += flow._C.randint(
+                high=10, size=(size,), dtype=flow.int64, generator=generator
+            ).tolist()
+        test_case.assertEqual(list(sampler), expected)
+
+    def test_replacement_resume_across_chunks(test_case):
+        num_samples = 2 * (1 << 16) + 5
+        make_sampler = lambda: RandomSampler(
+            range(10),
+            replacement=True,
+            num_samples=num_samples,
+            generator=_generator(3),
+        )
+        expected = np.concatenate(
+            list(BatchSampler(make_sampler(), 1000, False, vectorized=True))
+        )
+        test_case.assertEqual(len(expected), num_samples)
+        batch_sampler = BatchSampler(make_sampler(), 1000, False, vectorized=True)
+        it = iter(batch_sampler)
+        for _ in range(70):
+            next(it)
+        state = batch_sampler.state_dict()
+        batch_sampler = BatchSampler(make_sampler(), 1000, False, vectorized=True)
+        batch_sampler.load_state_dict(state)
+        rest = np.concatenate(list(batch_sampler))
+        test_case.assertTrue(np.array_equal(rest, expected[70000:]))
+
+    def test_dataloader_vectorized_sampler(test_case):
+        x = flow.arange(30, dtype=flow.float32).reshape(30, 1)
+        for dataset in (IndexDataset(), flow.utils.data.TensorDataset(x)):
+            for num_workers in (0, 2):
+                expected = list(DataLoader(dataset, 4, num_workers=num_workers))
+                actual = list(
+                    DataLoader(
+                        dataset, 4, num_workers=num_workers, vectorized_sampler=True
+                    )
+                )
+                test_case.assertEqual(len(actual), len(expected))
+                for (a, e) in zip(actual, expected):
+                    if isinstance(a, list):
+                        (a, e) = (a[0], e[0])
+                    test_case.assertTrue(np.array_equal(a.numpy(), e.numpy()))
+        with test_case.assertRaises(ValueError):
+            DataLoader(IndexDataset(), batch_size=None, vectorized_sampler=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
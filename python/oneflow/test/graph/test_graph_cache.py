@@ -0,0 +1,218 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import concurrent.futures
+import unittest
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.nn.graph.cache import LRUCache, ShapeBuckets
+
+
+class _Value(object):
+    pass
+
+
+def _test_dynamic_input_graph_cache(test_case, device):
+    linear = flow.nn.Linear(3, 8, False).to(device)
+    linear.eval()
+
+    class LinearGraph(flow.nn.Graph):
+        @flow.nn.Graph.with_dynamic_input_shape(size=4)
+        def __init__(self):
+            super().__init__()
+            self.linear = linear
+
+        def build(self, x):
+            return self.linear(x)
+
+    linear_g = LinearGraph()
+    x = flow.randn(4, 3, device=device)
+    x1 = flow.randn(2, 3, device=device)
+    for inp in (x, x1, x, x):
+        test_case.assertTrue(
+            np.allclose(linear_g(inp).numpy(), linear(inp).numpy(), 1e-4, 1e-4)
+        )
+
+    stats = linear_g.dynamic_input_graph_cache_stats()
+    test_case.assertEqual(len(stats), 2)
+    key_stats = list(stats.values())
+    test_case.assertEqual(key_stats[0]["hits"], 2)
+    test_case.assertEqual(key_stats[0]["compiles"], 1)
+    test_case.assertEqual(key_stats[1]["hits"], 0)
+    test_case.assertTrue(key_stats[1]["compile_time"] > 0)
+
+
+def _test_dynamic_input_graph_cache_with_buckets(test_case, device):
+    class DoubleGraph(flow.nn.Graph):
+        @flow.nn.Graph.with_dynamic_input_shape(
+            size=4, buckets={0: {1: [4, 8]}}, output_dims={0: {1: (0, 1)}}
+        )
+        def __init__(self):
+            super().__init__()
+
+        def build(self, x, bucket_mask):
+            return x * 2, bucket_mask.to(flow.int32).sum()
+
+    double_g = DoubleGraph()
+    for seq_len in (3, 5, 7, 2):
+        x = flow.randn(2, seq_len, 6, device=device)
+        out, valid_cnt = double_g(x)
+        test_case.assertEqual(out.shape, x.shape)
+        test_case.assertTrue(np.allclose(out.numpy(), x.numpy() * 2, 1e-5, 1e-5))
+        test_case.assertEqual(valid_cnt.item(), seq_len)
+    # Only one graph for each bucket.
+    test_case.assertEqual(len(double_g.dynamic_input_graph_cache_stats()), 2)
+
+
+def _test_dynamic_input_graph_cache_async_compile(test_case, device):
+    linear = flow.nn.Linear(3, 8, False).to(device)
+    linear.eval()
+
+    class LinearGraph(flow.nn.Graph):
+        @flow.nn.Graph.with_dynamic_input_shape(size=4, async_compile=True)
+        def __init__(self):
+            super().__init__()
+            self.linear = linear
+
+        def build(self, x):
+            return self.linear(x)
+
+    linear_g = LinearGraph()
+    linear_g.precompile(shapes=[(4, 3)], device=device)
+    x = flow.randn(2, 3, device=device)
+    # The 1st call runs eagerly while compiling in background.
+    test_case.assertTrue(
+        np.allclose(linear_g(x).numpy(), linear(x).numpy(), 1e-4, 1e-4)
+    )
+    for future in linear_g._dynamic_input_graph_cache._compile_futures.values():
+        future.result()
+    test_case.assertTrue(
+        np.allclose(linear_g(x).numpy(), linear(x).numpy(), 1e-4, 1e-4)
+    )
+    key_stats = list(linear_g.dynamic_input_graph_cache_stats().values())
+    test_case.assertEqual(len(key_stats), 2)
+    test_case.assertEqual(key_stats[0]["eager_runs"], 0)
+    test_case.assertEqual(key_stats[1]["eager_runs"], 1)
+    test_case.assertEqual(key_stats[1]["compiles"], 1)
+
+
+def _test_async_compile_eviction(test_case, device):
+    class LinearGraph(flow.nn.Graph):
+        @flow.nn.Graph.with_dynamic_input_shape(size=3, async_compile=True)
+        def __init__(self):
+            super().__init__()
+            self.linear = flow.nn.Linear(3, 8, False).to(device)
+
+        def build(self, x):
+            return self.linear(x)
+
+    linear_g = LinearGraph()
+    graph_cache = linear_g._dynamic_input_graph_cache
+    linear_g.precompile(shapes=[(4, 3), (2, 3), (1, 3)], device=device)
+    keys = list(linear_g.dynamic_input_graph_cache_stats())
+    # The least recently used graph is still being compiled, so the next one
+    # is evicted instead.
+    pending = concurrent.futures.Future()
+    graph_cache._compile_futures[keys[1]] = pending
+    linear_g.precompile(shapes=[(3, 3)], device=device)
+    stats = linear_g.dynamic_input_graph_cache_stats()
+    test_case.assertTrue(stats[keys[1]]["cached"])
+    test_case.assertFalse(stats[keys[2]]["cached"])
+    # The error of an evicted compilation is raised.
+    pending.set_exception(RuntimeError("compile failed"))
+    with test_case.assertRaises(RuntimeError):
+        linear_g.precompile(shapes=[(5, 3)], device=device)
+    test_case.assertFalse(linear_g.dynamic_input_graph_cache_stats()[keys[1]]["cached"])
+
+
+@flow.unittest.skip_unless_1n1d()
+class TestGraphCache(oneflow.unittest.TestCase):
+    def test_lru_cache_keep_the_1st(test_case):
+        cache = LRUCache(3)
+        for key in ("a", "b", "c"):
+            test_case.assertEqual(cache.set(key, _Value()), (key, None))
+        test_case.assertTrue(cache.is_full())
+        # "b" becomes the most recently used, so "c" is the least recently used.
+        test_case.assertIsNotNone(cache.get("b"))
+        test_case.assertEqual(cache.set("d", _Value()), ("d", "c"))
+        test_case.assertEqual([key for (key, _) in cache.items()], ["a", "b", "d"])
+        # The 1st item is never popped.
+        test_case.assertEqual(cache.set("e", _Value()), ("e", "b"))
+        test_case.assertIn("a", cache)
+        test_case.assertEqual(len(cache), 3)
+        # Keys which are not evictable are skipped.
+        test_case.assertEqual(
+            cache.set("f", _Value(), evictable=lambda key: key != "d"), ("f", "e")
+        )
+        test_case.assertEqual(cache.pop(evictable=lambda key: False), None)
+
+    def test_gen_key_with_dtype_and_device(test_case):
+        class DummyGraph(flow.nn.Graph):
+            @flow.nn.Graph.with_dynamic_input_shape(size=4)
+            def __init__(self):
+                super().__init__()
+
+            def build(self, x):
+                return x
+
+        graph_cache = DummyGraph()._dynamic_input_graph_cache
+        x = flow.ones(2, 3, dtype=flow.float32)
+        test_case.assertEqual(graph_cache.gen_key(x), graph_cache.gen_key(x.clone()))
+        test_case.assertNotEqual(
+            graph_cache.gen_key(x), graph_cache.gen_key(x.to(flow.float16))
+        )
+        test_case.assertNotEqual(
+            graph_cache.gen_key(x), graph_cache.gen_key(x.reshape(3, 2))
+        )
+        test_case.assertNotEqual(
+            graph_cache.gen_key(x, y=x), graph_cache.gen_key(x, z=x)
+        )
+        keys = [graph_cache.gen_key(x, v) for v in (1, 1.0, True)]
+        test_case.assertEqual(len(set(keys)), 3)
+        nan = float("nan")
+        test_case.assertEqual(graph_cache.gen_key(x, nan), graph_cache.gen_key(x, nan))
+
+    def test_shape_buckets_output_dims(test_case):
+        buckets = ShapeBuckets(
+            {0: {-2: [4, 8]}}, mask_name=None, output_dims={0: {1: (0, -2)}}
+        )
+        x = flow.randn(2, 3, 4)
+        (args, _, unpad) = buckets.pad((x,), {})
+        test_case.assertEqual(args[0].shape, flow.Size([2, 4, 4]))
+        (out, hidden) = unpad((args[0], flow.ones(2, 4)))
+        test_case.assertEqual(out.shape, x.shape)
+        # Outputs which are not declared are not sliced, even of a padded size.
+        test_case.assertEqual(hidden.shape, flow.Size([2, 4]))
+        with test_case.assertRaises(AssertionError):
+            ShapeBuckets({0: {3: [4]}}).pad((x,), {})
+
+    def test_dynamic_input_graph_cache_cpu(test_case):
+        _test_dynamic_input_graph_cache(test_case, "cpu")
+
+    def test_dynamic_input_graph_cache_with_buckets_cpu(test_case):
+        _test_dynamic_input_graph_cache_with_buckets(test_case, "cpu")
+
+    def test_dynamic_input_graph_cache_async_compile_cpu(test_case):
+        _test_dynamic_input_graph_cache_async_compile(test_case, "cpu")
+
+    def test_async_compile_eviction_cpu(test_case):
+        _test_async_compile_eviction(test_case, "cpu")
+
+
+if __name__ == "__main__":
+    unittest.main()
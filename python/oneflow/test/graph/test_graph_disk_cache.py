@@ -0,0 +1,144 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import json
+import time
+import tempfile
+import unittest
+import multiprocessing
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.nn.graph.cache import GraphDiskCache
+
+
+def _run_linear_graph_with_disk_cache(return_dict, cache_dir, tag):
+    flow.manual_seed(0)
+    linear = flow.nn.Linear(3, 8, False)
+    flow.nn.init.constant_(linear.weight, 2.3)
+    linear.eval()
+
+    class LinearGraph(flow.nn.Graph):
+        def __init__(self):
+            super().__init__()
+            self.linear = linear
+
+        def build(self, x):
+            return self.linear(x)
+
+    linear_g = LinearGraph()
+    linear_g.enable_disk_cache(cache_dir)
+    x = flow.tensor(np.random.randn(4, 3).astype(np.float32))
+    of_lazy_out = linear_g(x)
+    of_eager_out = linear(x)
+    return_dict[tag + "_equal"] = np.allclose(
+        of_lazy_out.numpy(), of_eager_out.numpy(), 1e-5, 1e-5
+    )
+    return_dict[tag + "_stats"] = linear_g._disk_cache.stats()
+
+
+def _make_fake_entry(cache_dir, name, size, used_time):
+    entry_dir = os.path.join(cache_dir, name)
+    os.makedirs(entry_dir)
+    with open(os.path.join(entry_dir, GraphDiskCache._entry_file), "wb") as f:
+        f.write(b"0" * size)
+    meta_path = os.path.join(entry_dir, GraphDiskCache._meta_file)
+    with open(meta_path, "w") as f:
+        json.dump({"size": size}, f)
+    os.utime(meta_path, (used_time, used_time))
+
+
+class _ConvGraph(flow.nn.Graph):
+    def __init__(self, conv, use_relu=False):
+        super().__init__()
+        self.conv = conv
+        self.use_relu = use_relu
+
+    def build(self, x):
+        y = self.conv(x)
+        return flow.relu(y) if self.use_relu else y
+
+
+@flow.unittest.skip_unless_1n1d()
+class TestGraphDiskCache(oneflow.unittest.TestCase):
+    def test_disk_cache_hit_across_processes(test_case):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            return_dict = multiprocessing.Manager().dict()
+            for tag in ("first", "second"):
+                p = multiprocessing.get_context("spawn").Process(
+                    target=_run_linear_graph_with_disk_cache,
+                    args=(return_dict, cache_dir, tag),
+                )
+                p.start()
+                p.join()
+                test_case.assertEqual(p.exitcode, 0)
+            test_case.assertTrue(return_dict["first_equal"])
+            test_case.assertTrue(return_dict["second_equal"])
+            test_case.assertEqual(return_dict["first_stats"]["misses"], 1)
+            test_case.assertEqual(return_dict["first_stats"]["stores"], 1)
+            test_case.assertEqual(return_dict["second_stats"]["hits"], 1)
+            test_case.assertEqual(return_dict["second_stats"]["misses"], 0)
+
+    def test_disk_cache_evict_by_size(test_case):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            disk_cache = GraphDiskCache(cache_dir, max_size=2500)
+            now = time.time()
+            for i in range(4):
+                _make_fake_entry(cache_dir, f"key{i}", 1000, now - 100 + i)
+            test_case.assertEqual(disk_cache.evict(), 2)
+            test_case.assertEqual(sorted(os.listdir(cache_dir))[-2:], ["key2", "key3"])
+            test_case.assertEqual(disk_cache.stats()["evictions"], 2)
+
+    def test_disk_cache_evict_by_age(test_case):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            disk_cache = GraphDiskCache(cache_dir, max_size=None, max_age=60)
+            now = time.time()
+            _make_fake_entry(cache_dir, "old", 10, now - 120)
+            _make_fake_entry(cache_dir, "new", 10, now)
+            test_case.assertEqual(disk_cache.evict(), 1)
+            test_case.assertFalse(os.path.exists(os.path.join(cache_dir, "old")))
+            test_case.assertTrue(os.path.exists(os.path.join(cache_dir, "new")))
+
+    def test_disk_cache_key_with_module_config(test_case):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            disk_cache = GraphDiskCache(cache_dir)
+            x = flow.randn(1, 3, 8, 8)
+
+            def gen_key(conv, use_relu=False):
+                graph = _ConvGraph(conv, use_relu)
+                # Graphs are named by the order of creation, as across processes.
+                graph._name = "_ConvGraph_0"
+                return disk_cache.gen_key(graph, x)
+
+            key = gen_key(flow.nn.Conv2d(3, 4, 3))
+            test_case.assertEqual(key, gen_key(flow.nn.Conv2d(3, 4, 3)))
+            # Hyperparameters which are not in the state dict.
+            test_case.assertNotEqual(key, gen_key(flow.nn.Conv2d(3, 4, 3, stride=2)))
+            test_case.assertNotEqual(key, gen_key(flow.nn.Conv2d(3, 4, 3).eval()))
+            # Attributes driving the control flow of build.
+            test_case.assertNotEqual(key, gen_key(flow.nn.Conv2d(3, 4, 3), True))
+
+    def test_disk_cache_miss(test_case):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            disk_cache = GraphDiskCache(cache_dir)
+            test_case.assertIsNone(disk_cache.load("not_exist"))
+            test_case.assertEqual(disk_cache.stats()["misses"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import unittest
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.framework.args_tree import ArgSpec
+
+
+class SumGraph(flow.nn.Graph):
+    def __init__(self):
+        super().__init__()
+
+    def build(self, inputs):
+        out = inputs["x0"]
+        for (name, x) in inputs.items():
+            if name != "x0":
+                out = out + x
+        return {"sum": out, "doubled": tuple(x * 2 for x in inputs.values())}
+
+
+@flow.unittest.skip_unless_1n1d()
+class TestGraphRunOverhead(oneflow.unittest.TestCase):
+    def test_arg_spec(test_case):
+        x = flow.ones(2)
+        y = flow.zeros(3)
+        io_args = ((x, None, [y, {"a": x}]), {"b": y})
+        spec = ArgSpec(io_args)
+        test_case.assertEqual(spec.num_tensors, 4)
+        flattened = spec.flatten(io_args)
+        test_case.assertTrue(all(a is b for (a, b) in zip(flattened, [x, y, x, y])))
+        rebuilt = spec.unflatten([t + 1 for t in flattened])
+        test_case.assertIsNone(rebuilt[0][1])
+        test_case.assertIsInstance(rebuilt[0][2], list)
+        test_case.assertTrue(np.array_equal(rebuilt[0][2][1]["a"].numpy(), [2, 2]))
+        test_case.assertTrue(np.array_equal(rebuilt[1]["b"].numpy(), [1, 1, 1]))
+        # Another structure is rejected instead of flattening the wrong leaves.
+        for other in (
+            ((x, None, [y, {"a": x}]), {"b": y, "c": x}),
+            ((x, None, (y, {"a": x})), {"b": y}),
+            ((x, x, [y, {"a": x}]), {"b": y}),
+            ((x, None, [y, {"z": x}]), {"b": y}),
+        ):
+            with test_case.assertRaises(ValueError):
+                spec.flatten(other)
+
+    def test_graph_run_with_nested_io(test_case):
+        sum_g = SumGraph()
+        for _ in range(3):
+            inputs = {"x" + str(i): flow.randn(4) for i in range(3)}
+            out = sum_g(inputs)
+            expected = sum(x.numpy() for x in inputs.values())
+            test_case.assertTrue(np.allclose(out["sum"].numpy(), expected, 1e-5))
+            test_case.assertEqual(len(out["doubled"]), 3)
+
+    def test_graph_run_with_another_input_structure(test_case):
+        sum_g = SumGraph()
+        sum_g({"x0": flow.randn(4), "x1": flow.randn(4)})
+        with test_case.assertRaises(ValueError):
+            sum_g({"x0": flow.randn(4), "x2": flow.randn(4)})
+
+    def test_graph_run_with_a_non_tensor_input(test_case):
+        class AddGraph(flow.nn.Graph):
+            def build(self, x, y):
+                return x + y
+
+        add_g = AddGraph()
+        add_g(flow.randn(4), flow.randn(4))
+        with test_case.assertRaises(ValueError):
+            add_g(flow.randn(4), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -261,6 +261,116 @@ class TestDDP(flow.unittest.TestCase):
         for dev_type in test_device:
             test_case._test_ddp_two_iters(dev_type)
 
+    def _test_ddp_buckets_by_bytes(test_case, dev_type):
+        class Model(flow.nn.Module):
+            def __init__(self):
+                super().__init__()
+                # 4 KB, i.e. 1024 floats, per small parameter.
+                self.small = flow.nn.ParameterList(
+                    [flow.nn.Parameter(flow.ones(1024)) for _ in range(6)]
+                )
+                self.large = flow.nn.Parameter(flow.ones(64 * 1024))
+
+            def forward(self, x):
+                # On rank 0, the gradients of the small parameters are ready in
+                # their declaration order.
+                small = list(self.small)
+                if flow.env.get_rank() == 0:
+                    small = small[::-1]
+                for w in small:
+                    x = x * w
+                return x.sum() + (self.large * x.mean()).sum()
+
+        rank = flow.env.get_rank()
+        x = (flow.ones(1024) * (rank + 1)).to(dev_type)
+        m = Model().to(dev_type)
+        m = ddp(m, bucket_cap_mb=8 / 1024, first_bucket_cap_mb=4 / 1024)
+        reducer = m._ddp_reducer
+        small = list(m.small)
+        expected_buckets = [
+            small[5:],
+            small[3:5][::-1],
+            small[1:3][::-1],
+            [small[0], m.large],
+        ]
+        # Filled in the reversed declaration order, with a smaller first bucket.
+        test_case.assertEqual(
+            [[id(p) for p in bucket] for bucket in reducer.buckets],
+            [[id(p) for p in bucket] for bucket in expected_buckets],
+        )
+        for _ in range(2):
+            m(x).backward()
+        # Rebuilt from the order of rank 0 on all ranks.
+        test_case.assertIsNone(reducer.ready_order)
+        rebuilt = [id(p) for bucket in reducer.buckets for p in bucket]
+        rebuilt.remove(id(m.large))
+        test_case.assertEqual(rebuilt, [id(p) for p in small])
+        # The gradient of the product is rank + 1, times 1 + sum(large) / 1024
+        # for the mean, averaged over the ranks and accumulated over 2 iterations.
+        for w in small:
+            test_case.assertTrue(
+                np_allclose_with_shape(w.grad.numpy(), np.full(1024, 2 * 1.5 * 65))
+            )
+        test_case.assertTrue(
+            np_allclose_with_shape(m.large.grad.numpy(), np.full(64 * 1024, 3.0))
+        )
+
+    def test_ddp_buckets_by_bytes(test_case):
+        for dev_type in test_device:
+            test_case._test_ddp_buckets_by_bytes(dev_type)
+
+    def _test_ddp_gradient_accumulation(test_case, dev_type, use_bucket):
+        class Mul(flow.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.w = flow.nn.Parameter(flow.Tensor([1, 1]))
+
+            def forward(self, x):
+                return x * self.w
+
+        rank = flow.env.get_rank()
+        x = (flow.Tensor([1, 1]) * (rank + 1)).to(dev_type)
+
+        m = ddp(Mul().to(dev_type), use_bucket=use_bucket)
+        for _ in range(2):
+            with m.no_sync():
+                m(x).sum().backward()
+            # The gradients are accumulated locally.
+            test_case.assertTrue(
+                np_allclose_with_shape(m.w.grad.numpy(), np.array([1, 1]) * (rank + 1))
+            )
+            m(x).sum().backward()
+            test_case.assertTrue(
+                np_allclose_with_shape(m.w.grad.numpy(), np.array([3, 3]))
+            )
+            m.w.grad.zero_()
+
+        m = ddp(
+            Mul().to(dev_type), use_bucket=use_bucket, gradient_accumulation_steps=3
+        )
+        for i in range(3):
+            m(x).sum().backward()
+            expected = (i + 1) * (rank + 1) if i < 2 else 4.5
+            test_case.assertTrue(
+                np_allclose_with_shape(m.w.grad.numpy(), np.array([1, 1]) * expected)
+            )
+        # Forwards without grad do not count as micro-batches.
+        with flow.no_grad():
+            m(x)
+        m.w.grad.zero_()
+        for i in range(3):
+            m(x).sum().backward()
+        test_case.assertTrue(
+            np_allclose_with_shape(m.w.grad.numpy(), np.array([4.5, 4.5]))
+        )
+
+        with test_case.assertRaises(ValueError):
+            ddp(Mul().to(dev_type), gradient_accumulation_steps=0)
+
+    def test_ddp_gradient_accumulation(test_case):
+        for dev_type, use_bucket in GenCartesianProduct((test_device, [True, False])):
+            test_case._test_ddp_gradient_accumulation(dev_type, use_bucket)
+
     def _test_broadcast_buffer(test_case, dev_type):
         rank = flow.env.get_rank()
 
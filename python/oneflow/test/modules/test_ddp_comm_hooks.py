@@ -0,0 +1,123 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import unittest
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.nn.parallel import DistributedDataParallel as ddp
+from oneflow.nn.parallel import comm_hooks
+
+test_device = ["cpu"] if os.getenv("ONEFLOW_TEST_CPU_ONLY") else ["cpu", "cuda"]
+
+
+class Model(flow.nn.Module):
+    def __init__(self, dtype=flow.float32):
+        super().__init__()
+        self.fc1 = flow.nn.Linear(16, 32, bias=False).to(dtype)
+        self.fc2 = flow.nn.Linear(32, 4).to(dtype)
+
+    def forward(self, x):
+        return self.fc2(self.fc1(x))
+
+
+def _grads(dev_type, x, hook=None, state=None, num_iters=1, dtype=flow.float32):
+    flow.manual_seed(0)
+    m = ddp(Model(dtype).to(dev_type))
+    if hook is not None:
+        m.register_comm_hook(state, hook)
+    for _ in range(num_iters):
+        m(x).sum().backward()
+    return [p.grad.numpy() for p in m.parameters()], m._ddp_reducer
+
+
+def _input(dev_type, dtype=flow.float32):
+    # A rank 1 gradient of fc1 when averaged over the ranks.
+    x = flow.arange(16, dtype=dtype).reshape(1, 16) / 16
+    return (x * (flow.env.get_rank() + 1)).to(dev_type)
+
+
+@flow.unittest.skip_unless_1n2d()
+class TestDDPCommHooks(flow.unittest.TestCase):
+    def test_low_precision_hooks(test_case):
+        for dev_type in test_device:
+            x = _input(dev_type)
+            expected, _ = _grads(dev_type, x)
+            for hook in (comm_hooks.fp16_compress_hook, comm_hooks.bf16_compress_hook):
+                grads, _ = _grads(dev_type, x, hook)
+                for (g, e) in zip(grads, expected):
+                    test_case.assertEqual(g.dtype, np.float32)
+                    test_case.assertTrue(np.allclose(g, e, rtol=1e-2, atol=1e-2))
+
+    def test_powersgd_hook(test_case):
+        for dev_type in test_device:
+            x = _input(dev_type)
+            expected, reducer = _grads(dev_type, x)
+            state = comm_hooks.PowerSGDState(start_powerSGD_iter=0)
+            grads, powersgd_reducer = _grads(
+                dev_type, x, comm_hooks.powerSGD_hook, state
+            )
+            # The rank 1 approximation of a rank 1 gradient is exact.
+            for (g, e) in zip(grads, expected):
+                test_case.assertTrue(np.allclose(g, e, rtol=1e-4, atol=1e-4))
+            test_case.assertEqual(state.iter, 1)
+            # The bias of fc2 is not compressed.
+            test_case.assertEqual(len(state.error_dict), 2)
+            test_case.assertLess(
+                powersgd_reducer.num_bytes_sent, reducer.num_bytes_sent
+            )
+
+    def test_powersgd_warm_up(test_case):
+        x = _input("cpu")
+        expected, _ = _grads("cpu", x, num_iters=3)
+        state = comm_hooks.PowerSGDState(start_powerSGD_iter=3)
+        grads, _ = _grads("cpu", x, comm_hooks.powerSGD_hook, state, num_iters=3)
+        for (g, e) in zip(grads, expected):
+            test_case.assertTrue(np.array_equal(g, e))
+        test_case.assertEqual(state.iter, 3)
+        test_case.assertEqual(len(state.error_dict), 0)
+
+    def test_topk_hook(test_case):
+        for dev_type in test_device:
+            x = _input(dev_type)
+            expected, reducer = _grads(dev_type, x)
+            # Every gradient is sent.
+            state = comm_hooks.TopKState(compress_ratio=1)
+            grads, _ = _grads(dev_type, x, comm_hooks.topk_hook, state)
+            for (g, e) in zip(grads, expected):
+                test_case.assertTrue(np.allclose(g, e, rtol=1e-5, atol=1e-5))
+            # The gradients which are not sent are fed back.
+            state = comm_hooks.TopKState(compress_ratio=0.1)
+            grads, topk_reducer = _grads(dev_type, x, comm_hooks.topk_hook, state)
+            test_case.assertLess(topk_reducer.num_bytes_sent, reducer.num_bytes_sent)
+            for error in state.error_dict.values():
+                test_case.assertGreater(int((error != 0).sum()), 0)
+        with test_case.assertRaises(ValueError):
+            comm_hooks.TopKState(compress_ratio=0)
+
+    def test_float64_parameters(test_case):
+        x = _input("cpu", flow.float64)
+        grads, _ = _grads("cpu", x, dtype=flow.float64)
+        expected, _ = _grads("cpu", x.to(flow.float32))
+        for (g, e) in zip(grads, expected):
+            test_case.assertEqual(g.dtype, np.float64)
+            test_case.assertTrue(np.allclose(g, e, rtol=1e-5, atol=1e-5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import unittest
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.nn.parallel import DistributedDataParallel as ddp
+from oneflow.nn.parallel import FullyShardedDataParallel as fsdp
+
+test_device = ["cpu"] if os.getenv("ONEFLOW_TEST_CPU_ONLY") else ["cpu", "cuda"]
+
+
+def _model(dev_type):
+    flow.manual_seed(0)
+    return flow.nn.Sequential(
+        flow.nn.Linear(8, 32),
+        flow.nn.ReLU(),
+        flow.nn.Linear(32, 32),
+        flow.nn.ReLU(),
+        flow.nn.Linear(32, 3),
+    ).to(dev_type)
+
+
+def _train(model, dev_type, num_steps=3):
+    optimizer = flow.optim.Adam(model.parameters(), lr=0.1)
+    rank = flow.env.get_rank()
+    for step in range(num_steps):
+        flow.manual_seed(step * 10 + rank)
+        x = flow.randn(4, 8).to(dev_type)
+        optimizer.zero_grad()
+        model(x).sum().backward()
+        optimizer.step()
+    x = flow.arange(16, dtype=flow.float32).reshape(2, 8).to(dev_type)
+    with flow.no_grad():
+        return model(x).numpy()
+
+
+@flow.unittest.skip_unless_1n2d()
+class TestFullyShardedDataParallel(flow.unittest.TestCase):
+    def test_matches_ddp(test_case):
+        for dev_type in test_device:
+            expected = _train(ddp(_model(dev_type)), dev_type)
+            for prefetch in (True, False):
+                model = fsdp(_model(dev_type), prefetch=prefetch)
+                output = _train(model, dev_type)
+                test_case.assertTrue(np.allclose(output, expected, 1e-5, 1e-5))
+
+    def test_sharded_parameters(test_case):
+        model = fsdp(_model("cpu"))
+        # Every parameter is aligned to 128 float32 elements, then split in two.
+        test_case.assertEqual(
+            [(name, p.numel()) for (name, p) in model.named_parameters()],
+            [
+                ("0._fsdp_flat_param_0", 192),
+                ("2._fsdp_flat_param_0", 576),
+                ("4._fsdp_flat_param_0", 128),
+            ],
+        )
+        test_case.assertFalse(hasattr(model[0], "weight"))
+
+    def test_gathered_only_in_forward(test_case):
+        model = fsdp(_model("cpu"))
+        units = model._fsdp_state.units
+        shapes = []
+        prefetched = []
+
+        def hook(module, input):
+            shapes.append(module.weight.shape)
+            prefetched.append(units[2].flat_params[0].prefetched is not None)
+
+        model[2].register_forward_pre_hook(hook)
+        for _ in range(2):
+            loss = model(flow.randn(4, 8)).sum()
+            test_case.assertFalse(hasattr(model[2], "weight"))
+            test_case.assertEqual(len(model._fsdp_state.views), 0)
+            loss.backward()
+            for unit in units:
+                test_case.assertIsNone(unit.flat_params[0].backward_full)
+        test_case.assertEqual(shapes, [flow.Size([32, 32])] * 2)
+        # The next unit is prefetched once the order of the units is known.
+        test_case.assertEqual(prefetched, [False, True])
+
+    def test_forward_raises(test_case):
+        model = fsdp(_model("cpu"))
+        state = model._fsdp_state
+
+        def hook(module, input):
+            raise ValueError("forward raised")
+
+        handle = model[2].register_forward_pre_hook(hook)
+        with test_case.assertRaises(ValueError):
+            model(flow.randn(4, 8))
+        handle.remove()
+        test_case.assertEqual(state.gathered, [])
+        test_case.assertEqual(len(state.views), 0)
+        test_case.assertFalse(hasattr(model[0], "weight"))
+        test_case.assertFalse(hasattr(model[2], "weight"))
+        model(flow.randn(4, 8)).sum().backward()
+        test_case.assertEqual(len(state.forward_order), 3)
+
+    def test_unit_forward_outside_module_forward(test_case):
+        model = fsdp(_model("cpu"))
+        with test_case.assertRaises(RuntimeError):
+            model[0](flow.randn(4, 8))
+
+    def test_unit_modules(test_case):
+        model = _model("cpu")
+        model = fsdp(model, unit_modules=[model[2]])
+        test_case.assertEqual(
+            [name for (name, _) in model.named_parameters()],
+            ["_fsdp_flat_param_0", "2._fsdp_flat_param_0"],
+        )
+        with test_case.assertRaises(ValueError):
+            fsdp(model)
+        with test_case.assertRaises(ValueError):
+            fsdp(_model("cpu"), unit_modules=[flow.nn.Linear(2, 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,6 +15,7 @@ limitations under the License.
 """
 
 import os
+import shutil
 import warnings
 import tempfile
 import unittest
@@ -107,6 +108,36 @@ class TestSaveLoad(flow.unittest.TestCase):
         m2.load_state_dict(loaded_state_dict)
         test_case.assertTrue(np.array_equal(m1.param.numpy(), m2.param.numpy()))
 
+    @flow.unittest.skip_unless_1n1d()
+    def test_save_dir_load_with_mmap(test_case):
+        m1 = CustomModuleForSaveLoad()
+        with tempfile.TemporaryDirectory() as save_dir:
+            flow.save(m1.state_dict(), save_dir, save_as_external_data=True)
+            loaded_state_dict = flow.load(save_dir, mmap=True)
+            loaded_param = loaded_state_dict["param"]
+            test_case.assertEqual(loaded_param.device, flow.device("cpu"))
+            test_case.assertTrue(np.array_equal(m1.param.numpy(), loaded_param.numpy()))
+            # Writes to the loaded tensor do not modify the checkpoint.
+            loaded_param.fill_(0)
+            reloaded_state_dict = flow.load(save_dir, mmap=True)
+            test_case.assertTrue(
+                np.array_equal(m1.param.numpy(), reloaded_state_dict["param"].numpy())
+            )
+            m2 = CustomModuleForSaveLoad()
+            m2.load_state_dict(reloaded_state_dict)
+        test_case.assertTrue(np.array_equal(m1.param.numpy(), m2.param.numpy()))
+
+    @flow.unittest.skip_unless_1n1d()
+    def test_load_old_dir_data_with_mmap(test_case):
+        test_data_dir = Path(__file__).parent / "save_load_test_data"
+        params = flow.load(test_data_dir / "3x3_i3o3_conv2d_params")
+        mmap_params = flow.load(test_data_dir / "3x3_i3o3_conv2d_params", mmap=True)
+        test_case.assertEqual(params.keys(), mmap_params.keys())
+        for key in params.keys():
+            test_case.assertTrue(
+                np.array_equal(params[key].numpy(), mmap_params[key].numpy())
+            )
+
     @flow.unittest.skip_unless_1n1d()
     def test_save_state_dict(test_case):
         class CustomModule(flow.nn.Module):
@@ -216,6 +247,164 @@ class TestSaveLoad(flow.unittest.TestCase):
     def test_save_and_load_global_from_nested_dict_2n2d(test_case):
         test_case._test_save_and_load_global_from_nested_dict()
 
+    @flow.unittest.skip_unless_1n1d()
+    def test_save_sharded(test_case):
+        state_dict = {
+            "x": flow.randn(5, 7),
+            "y": [flow.arange(10, dtype=flow.int64), flow.ones(0, 3)],
+            "step": 3,
+        }
+        with tempfile.TemporaryDirectory() as save_dir:
+            # A small max_inflight_bytes makes the writer wait for every shard.
+            flow.save(state_dict, save_dir, sharded=True, max_inflight_bytes=1)
+            for mmap in (False, True):
+                loaded = flow.load(save_dir, mmap=mmap)
+                test_case.assertEqual(loaded["step"], 3)
+                test_case.assertTrue(
+                    np.array_equal(loaded["x"].numpy(), state_dict["x"].numpy())
+                )
+                test_case.assertEqual(loaded["y"][0].dtype, flow.int64)
+                test_case.assertTrue(
+                    np.array_equal(loaded["y"][0].numpy(), np.arange(10))
+                )
+                test_case.assertEqual(loaded["y"][1].shape, (0, 3))
+
+    @flow.unittest.skip_unless_1n1d()
+    def test_save_async(test_case):
+        m = CustomModuleForSaveLoad().to("cuda")
+        expected = m.param.numpy()
+        with tempfile.TemporaryDirectory() as save_dir:
+            path = os.path.join(save_dir, "model")
+            future = flow.save(m.state_dict(), path, async_=True)
+            # Updates after flow.save returns are not in the checkpoint.
+            with flow.no_grad():
+                m.param.fill_(0)
+            test_case.assertEqual(future.result(), Path(path))
+            loaded = flow.load(path)
+            test_case.assertTrue(np.array_equal(loaded["param"].numpy(), expected))
+            test_case.assertEqual(os.listdir(save_dir), ["model"])
+
+    @flow.unittest.skip_unless_1n1d()
+    def test_checkpoint_manager(test_case):
+        m = CustomModuleForSaveLoad()
+        with tempfile.TemporaryDirectory() as save_dir:
+            manager = flow.CheckpointManager(
+                save_dir, keep_last_n=2, save_as_external_data=True
+            )
+            test_case.assertIsNone(manager.latest())
+            for step in range(4):
+                with flow.no_grad():
+                    m.param.fill_(step)
+                manager.save(m.state_dict(), step)
+            manager.wait()
+            test_case.assertEqual(
+                [path.name for path in manager.checkpoints()],
+                ["checkpoint_2", "checkpoint_3"],
+            )
+            loaded = manager.load_latest()
+            test_case.assertTrue(np.all(loaded["param"].numpy() == 3))
+
+    @flow.unittest.skip_unless_1n2d()
+    def test_checkpoint_manager_1n2d(test_case):
+        m = CustomModuleForSaveLoad()
+        save_dir = os.path.join(tempfile.gettempdir(), "test_checkpoint_manager")
+        for sharded in (False, True):
+            manager = flow.CheckpointManager(save_dir, sharded=sharded)
+            for step in range(2):
+                with flow.no_grad():
+                    m.param.fill_(step)
+                manager.save(m.state_dict(), step)
+            manager.wait()
+            # Every rank sees the complete checkpoints written by rank 0.
+            test_case.assertEqual(
+                sorted(os.listdir(save_dir)), ["checkpoint_0", "checkpoint_1"]
+            )
+            loaded = manager.load_latest()
+            test_case.assertTrue(np.all(loaded["param"].numpy() == 1))
+            flow.comm.barrier()
+            if flow.env.get_rank() == 0:
+                shutil.rmtree(save_dir)
+            flow.comm.barrier()
+
+    def _test_save_sharded_global(test_case):
+        placement = flow.placement("cuda", [[0, 1], [2, 3]])
+        x = flow.randn(5, 7).to_global(
+            placement, [flow.sbp.broadcast, flow.sbp.broadcast]
+        )
+        state_dict = {
+            "s0s1": x.to_global(sbp=[flow.sbp.split(0), flow.sbp.split(1)]),
+            "bs0": x.to_global(sbp=[flow.sbp.broadcast, flow.sbp.split(0)]),
+            "s1s1": x.to_global(sbp=[flow.sbp.split(1), flow.sbp.split(1)]),
+        }
+        save_dir = os.path.join(tempfile.gettempdir(), "test_save_sharded_global")
+        flow.save(state_dict, save_dir, sharded=True)
+        loaded = flow.load(save_dir)
+        for (key, value) in state_dict.items():
+            test_case.assertEqual(loaded[key].placement, placement)
+            test_case.assertEqual(loaded[key].sbp, value.sbp)
+            test_case.assertTrue(np.array_equal(loaded[key].numpy(), x.numpy()))
+        # Reassemble the whole tensors on every rank
+        loaded = flow.load(save_dir, map_location="cpu")
+        for key in state_dict.keys():
+            test_case.assertTrue(loaded[key].is_local)
+            test_case.assertTrue(np.array_equal(loaded[key].numpy(), x.numpy()))
+        flow.comm.barrier()
+        if flow.env.get_rank() == 0:
+            shutil.rmtree(save_dir)
+
+    @flow.unittest.skip_unless_1n4d()
+    def test_save_sharded_global_1n4d(test_case):
+        test_case._test_save_sharded_global()
+
+    @flow.unittest.skip_unless_1n2d()
+    def test_save_sharded_local_then_load_1n2d(test_case):
+        # Only rank 0 writes local tensors, the other ranks load right after.
+        x = flow.arange(12, dtype=flow.float32).reshape(3, 4)
+        save_dir = os.path.join(tempfile.gettempdir(), "test_save_sharded_local")
+        flow.save({"x": x}, save_dir, sharded=True)
+        loaded = flow.load(save_dir)
+        test_case.assertTrue(np.array_equal(loaded["x"].numpy(), x.numpy()))
+        flow.comm.barrier()
+        if flow.env.get_rank() == 0:
+            shutil.rmtree(save_dir)
+
+    def _test_load_with_resharding(test_case):
+        x = flow.randn(5, 7).to_global(flow.placement("cpu", [0]), flow.sbp.broadcast)
+        placement = flow.placement("cuda", range(4))
+        state_dict = {"x": x.to_global(placement, flow.sbp.split(0))}
+        rank = flow.env.get_rank()
+        sharded_dir = os.path.join(tempfile.gettempdir(), "test_reshard_sharded")
+        flow.save(state_dict, sharded_dir, sharded=True)
+        external_dir = os.path.join(tempfile.gettempdir(), "test_reshard_external")
+        flow.save(
+            state_dict, external_dir, global_dst_rank=0, save_as_external_data=True
+        )
+        flow.comm.barrier()
+        # Save on 4 ranks with split(0) and load on 2 ranks with split(1)
+        # or on 2x2 ranks with [split(1), split(0)].
+        for (target_placement, target_sbp) in [
+            (flow.placement("cuda", [1, 2]), flow.sbp.split(1)),
+            (
+                flow.placement("cuda", [[0, 1], [2, 3]]),
+                [flow.sbp.split(1), flow.sbp.split(0)],
+            ),
+            (flow.placement("cpu", [3]), lambda shape: flow.sbp.broadcast),
+        ]:
+            for save_dir in (sharded_dir, external_dir):
+                loaded = flow.load(
+                    save_dir, map_location=target_placement, sbp=target_sbp
+                )
+                test_case.assertEqual(loaded["x"].placement, target_placement)
+                test_case.assertTrue(np.array_equal(loaded["x"].numpy(), x.numpy()))
+        flow.comm.barrier()
+        if rank == 0:
+            shutil.rmtree(sharded_dir)
+            shutil.rmtree(external_dir)
+
+    @flow.unittest.skip_unless_1n4d()
+    def test_load_with_resharding_1n4d(test_case):
+        test_case._test_load_with_resharding()
+
     @flow.unittest.skip_unless_1n1d()
     def test_load_pytorch_weights(test_case):
         for device in ["cpu", "cuda"]:
@@ -0,0 +1,135 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import unittest
+
+import numpy as np
+
+import oneflow as flow
+import oneflow.unittest
+from oneflow.nn.parallel import DistributedDataParallel as ddp
+from oneflow.nn.parallel import ZeroRedundancyOptimizer
+from oneflow.nn.parallel.zero import _partition_parameters
+
+test_device = ["cpu"] if os.getenv("ONEFLOW_TEST_CPU_ONLY") else ["cpu", "cuda"]
+
+
+def _model(dev_type):
+    flow.manual_seed(0)
+    return flow.nn.Sequential(
+        flow.nn.Linear(8, 32), flow.nn.ReLU(), flow.nn.Linear(32, 4)
+    ).to(dev_type)
+
+
+def _train(model, optimizer, dev_type, num_steps=3):
+    rank = flow.env.get_rank()
+    for step in range(num_steps):
+        flow.manual_seed(step * 10 + rank)
+        x = flow.randn(4, 8).to(dev_type)
+        optimizer.zero_grad()
+        model(x).sum().backward()
+        optimizer.step()
+    return [p.numpy() for p in model.parameters()]
+
+
+@flow.unittest.skip_unless_1n2d()
+class TestZeroRedundancyOptimizer(flow.unittest.TestCase):
+    def test_partition_balanced_by_bytes(test_case):
+        params = [flow.zeros(n) for n in (10, 60, 20, 30, 40)]
+        partitions = _partition_parameters(params, 2)
+        sizes = [[p.numel() for p in partition] for partition in partitions]
+        # Declaration order in a partition.
+        test_case.assertEqual(sizes, [[60, 20], [10, 30, 40]])
+
+    def test_matches_ddp(test_case):
+        for dev_type in test_device:
+            model = ddp(_model(dev_type))
+            optimizer = flow.optim.Adam(model.parameters(), lr=0.1)
+            expected = _train(model, optimizer, dev_type)
+            for reduce_scatter in (False, True):
+                model = _model(dev_type)
+                optimizer = ZeroRedundancyOptimizer(
+                    model.parameters(),
+                    flow.optim.Adam,
+                    reduce_scatter=reduce_scatter,
+                    lr=0.1,
+                )
+                for (p, e) in zip(_train(model, optimizer, dev_type), expected):
+                    test_case.assertTrue(np.allclose(p, e, rtol=1e-5, atol=1e-5))
+
+    def test_sharded_states(test_case):
+        model = _model("cpu")
+        optimizer = ZeroRedundancyOptimizer(model.parameters(), flow.optim.Adam, lr=0.1)
+        _train(model, optimizer, "cpu", num_steps=1)
+        local_params = optimizer.optimizer.param_groups[0].parameters
+        num_local = sum(p.numel() for p in local_params)
+        num_local = flow.tensor([num_local])
+        flow.comm.all_reduce(num_local)
+        # Every parameter is owned by exactly one rank.
+        test_case.assertEqual(
+            num_local.item(), sum(p.numel() for p in model.parameters())
+        )
+        state = optimizer.state_dict()["state"]
+        param_states = [v for (k, v) in state.items() if isinstance(k, int)]
+        test_case.assertEqual(len(param_states), len(local_params))
+        for (p, param_state) in zip(local_params, param_states):
+            test_case.assertEqual(param_state["exp_avg"].shape, p.shape)
+        # The default options of Adam are visible to lr schedulers.
+        test_case.assertEqual(optimizer.param_groups[0]["betas"], (0.9, 0.999))
+
+    def test_fewer_params_than_ranks(test_case):
+        def make_model():
+            flow.manual_seed(0)
+            return flow.nn.Linear(8, 4, bias=False)
+
+        model = ddp(make_model())
+        optimizer = flow.optim.Adam(model.parameters(), lr=0.1)
+        expected = _train(model, optimizer, "cpu")
+        model = make_model()
+        optimizer = ZeroRedundancyOptimizer(model.parameters(), flow.optim.Adam, lr=0.1)
+        local_params = optimizer.optimizer.param_groups[0].parameters
+        test_case.assertEqual(len(local_params), 1 - flow.env.get_rank())
+        for (p, e) in zip(_train(model, optimizer, "cpu"), expected):
+            test_case.assertTrue(np.allclose(p, e, rtol=1e-5, atol=1e-5))
+        state = optimizer.state_dict()
+        optimizer.load_state_dict(state)
+
+    def test_lr_scheduler(test_case):
+        model = _model("cpu")
+        optimizer = ZeroRedundancyOptimizer(model.parameters(), flow.optim.SGD, lr=1)
+        scheduler = flow.optim.lr_scheduler.StepLR(optimizer, step_size=1, gamma=0)
+        scheduler.step()
+        before = [p.numpy() for p in model.parameters()]
+        after = _train(model, optimizer, "cpu", num_steps=1)
+        for (b, a) in zip(before, after):
+            test_case.assertTrue(np.array_equal(b, a))
+
+    def test_invalid_arguments(test_case):
+        with test_case.assertRaises(ValueError):
+            ZeroRedundancyOptimizer(
+                _model("cpu").parameters(),
+                flow.optim.SGD,
+                contiguous_params=True,
+                lr=0.1,
+            )
+        with test_case.assertRaises(ValueError):
+            ZeroRedundancyOptimizer(
+                ddp(_model("cpu")).parameters(), flow.optim.SGD, lr=0.1
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -40,6 +40,14 @@ from oneflow.utils.data.decorator import (
     non_deterministic,
 )
 from oneflow.utils.data.distributed import DistributedSampler
+from oneflow.utils.data.record import (
+    RecordFileDataset,
+    build_record_index,
+    load_record_index,
+    decode_ofrecord,
+)
+from oneflow.utils.data.indexed import IndexedRecordDataset, IndexedBinDataset
+from oneflow.utils.data._utils.pin_memory import PinnedMemoryPool, DevicePrefetcher
 
 
 __all__ = [
@@ -61,4 +69,12 @@ __all__ = [
     "guaranteed_datapipes_determinism",
     "non_deterministic",
     "DistributedSampler",
+    "RecordFileDataset",
+    "build_record_index",
+    "load_record_index",
+    "decode_ofrecord",
+    "IndexedRecordDataset",
+    "IndexedBinDataset",
+    "PinnedMemoryPool",
+    "DevicePrefetcher",
 ]
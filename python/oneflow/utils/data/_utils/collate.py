@@ -21,8 +21,14 @@ static methods.
 """
 import re
 import collections
+import contextlib
+import threading
+
+import numpy as np
 
 import oneflow as flow
+from oneflow.framework import dtype as dtype_util
+from oneflow.utils.data.dataset import _BatchedSamples
 
 
 string_classes = (str, bytes)
@@ -60,6 +66,83 @@ def default_convert(data):
         raise TypeError(default_convert_err_msg_format.format(elem_type))
 
 
+_buffer_allocator = threading.local()
+
+
+@contextlib.contextmanager
+def collate_buffer_allocator(allocate):
+    r"""Makes :func:`default_collate` in the current thread write every batched
+    field into a tensor returned by ``allocate(shape, numpy_dtype)``, e.g. a
+    pinned tensor or a view of a shared memory slab. ``allocate`` can return
+    ``None`` to fall back to a regular cpu buffer.
+    """
+    prev_allocate = getattr(_buffer_allocator, "allocate", None)
+    _buffer_allocator.allocate = allocate
+    try:
+        yield
+    finally:
+        _buffer_allocator.allocate = prev_allocate
+
+
+def pinned_allocator(shape, dtype):
+    r"""An allocator for :func:`collate_buffer_allocator` that returns pinned
+    memory, so that the batch needs no extra copy in ``pin_memory``."""
+    return flow.empty(
+        shape,
+        dtype=dtype_util.convert_numpy_dtype_to_oneflow_dtype(dtype),
+        pin_memory=True,
+    )
+
+
+def _get_buffer_allocator():
+    return getattr(_buffer_allocator, "allocate", None)
+
+
+def _collate_into_buffer(arrays, dtype):
+    # Computes the batch shape up front and writes every sample once into a
+    # single buffer, instead of creating a tensor per sample and stacking them.
+    out = None
+    shape = (len(arrays),) + tuple(np.shape(arrays[0]))
+    allocate = _get_buffer_allocator()
+    if allocate is not None:
+        out = allocate(shape, dtype)
+    if out is None:
+        out_numpy = np.empty(shape, dtype=dtype)
+        out = flow.from_numpy(out_numpy)
+    else:
+        out_numpy = out.numpy()
+    for (i, array) in enumerate(arrays):
+        out_numpy[i] = array
+    return out
+
+
+def _can_collate_arrays_into_buffer(batch):
+    elem = batch[0]
+    try:
+        dtype_util.convert_numpy_dtype_to_oneflow_dtype(elem.dtype)
+    except NotImplementedError:
+        return False
+    return all(b.dtype == elem.dtype and b.shape == elem.shape for b in batch)
+
+
+def _can_collate_tensors_into_buffer(batch):
+    # Stacking tensors already writes a single buffer, it is only worth writing
+    # them by ourselves when the buffer is special, e.g. pinned or shared.
+    elem = batch[0]
+    if _get_buffer_allocator() is None:
+        return False
+    if elem.dtype in (flow.float16, flow.bfloat16):
+        return False
+    return all(
+        t.is_local
+        and t.device.type == "cpu"
+        and not t.requires_grad
+        and t.dtype == elem.dtype
+        and t.shape == elem.shape
+        for t in batch
+    )
+
+
 default_collate_err_msg_format = (
     "default_collate: batch must contain tensors, numpy arrays, numbers, "
     "dicts or lists; found {}"
@@ -74,10 +157,15 @@ default_convert_err_msg_format = (
 def default_collate(batch):
     r"""Puts each data field into a tensor with outer dimension batch size"""
 
+    if isinstance(batch, _BatchedSamples):
+        # The fields are gathered already, e.g. by TensorDataset.__getitems__.
+        return list(batch.fields)
     elem = batch[0]
     elem_type = type(elem)
     if isinstance(elem, (flow.Tensor, flow._oneflow_internal.Tensor)):
-        # TODO: tensor.storage()._new_shared(numel)
+        if _can_collate_tensors_into_buffer(batch):
+            dtype = dtype_util.convert_oneflow_dtype_to_numpy_dtype(elem.dtype)
+            return _collate_into_buffer([t.numpy() for t in batch], dtype)
         return flow._C.stack(batch, dim=0)
     elif (
         elem_type.__module__ == "numpy"
@@ -89,12 +177,21 @@ def default_collate(batch):
             if np_str_obj_array_pattern.search(elem.dtype.str) is not None:
                 raise TypeError(default_collate_err_msg_format.format(elem.dtype))
 
+            if _can_collate_arrays_into_buffer(batch):
+                return _collate_into_buffer(batch, elem.dtype)
             return default_collate([flow.tensor(b) for b in batch])
         elif elem.shape == ():  # scalars
+            allocate = _get_buffer_allocator()
+            if allocate is not None and _can_collate_arrays_into_buffer(batch):
+                return _collate_into_buffer(batch, elem.dtype)
             return flow.tensor(batch)
     elif isinstance(elem, float):
+        if _get_buffer_allocator() is not None:
+            return _collate_into_buffer(batch, np.dtype(np.float64))
         return flow.tensor(batch, dtype=flow.float64)
     elif isinstance(elem, int):
+        if _get_buffer_allocator() is not None and not isinstance(elem, bool):
+            return _collate_into_buffer(batch, np.dtype(np.int64))
         return flow.tensor(batch)
     elif isinstance(elem, string_classes):
         return batch
@@ -17,6 +17,7 @@ limitations under the License.
 data from an iterable-style or map-style dataset. This logic is shared in both
 single- and multi-processing data loading.
 """
+import numpy as np
 
 
 class _BaseDatasetFetcher(object):
@@ -62,7 +63,13 @@ class _MapDatasetFetcher(_BaseDatasetFetcher):
 
     def fetch(self, possibly_batched_index):
         if self.auto_collation:
-            data = [self.dataset[idx] for idx in possibly_batched_index]
+            if hasattr(self.dataset, "__getitems__") and self.dataset.__getitems__:
+                data = self.dataset.__getitems__(possibly_batched_index)
+            else:
+                if isinstance(possibly_batched_index, np.ndarray):
+                    # Batches of a vectorized BatchSampler, datasets get int indices.
+                    possibly_batched_index = possibly_batched_index.tolist()
+                data = [self.dataset[idx] for idx in possibly_batched_index]
         else:
             data = self.dataset[possibly_batched_index]
         return self.collate_fn(data)
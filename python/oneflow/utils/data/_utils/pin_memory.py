@@ -22,20 +22,109 @@ static methods.
 """
 
 import oneflow as flow
+import collections
 import collections.abc
 import queue
+import sys
+import threading
+
+import numpy as np
 
 from . import MP_STATUS_CHECK_INTERVAL
 from oneflow._utils import ExceptionWrapper
+import oneflow.framework.dtype as dtype_util
 
 container_abcs = collections.abc
 string_classes = (str, bytes)
 
 
-def _pin_memory_loop(in_queue, out_queue, device_id, done_event):
-    # This setting is thread local, and prevents the copy in pin_memory from
-    # consuming all CPU cores.
-    flow.set_num_threads(1)
+class PinnedMemoryPool(object):
+    r"""A cache of pinned host blocks, so that batches are pinned without
+    allocating and registering new page-locked memory every time.
+
+    :meth:`allocate` returns a view of a cached pinned block, so the tensor is
+    pinned and copied to the device on the pinned stream. Blocks are cached per
+    dtype and by power of two numbers of elements. A block goes back to the
+    cache once the pool holds the last reference to the tensor returned for it,
+    so views derived from that tensor must not outlive it.
+
+    Args:
+        pin_memory (bool, optional): whether the blocks are pinned. If ``False``,
+            the pool caches ordinary host memory, e.g. on a CPU-only build.
+            Default: ``flow.cuda.is_available()``.
+    """
+
+    _MIN_BLOCK_NUMEL = 1024
+
+    def __init__(self, pin_memory=None):
+        if pin_memory is None:
+            pin_memory = flow.cuda.is_available()
+        self.pin_memory = pin_memory
+        self._lock = threading.Lock()
+        self._free_blocks = collections.defaultdict(list)
+        # Maps the id of every tensor handed out to (key, block, tensor).
+        self._used_blocks = {}
+        self.num_allocations = 0
+        self.num_reuses = 0
+
+    def _collect_free_blocks(self):
+        # A tensor only referenced by _used_blocks, the loop variable and the
+        # argument of getrefcount has been freed by its users.
+        for (key, block, tensor) in list(self._used_blocks.values()):
+            if sys.getrefcount(tensor) <= 3:
+                del self._used_blocks[id(tensor)]
+                self._free_blocks[key].append(block)
+
+    def _allocate(self, shape, dtype):
+        numel = int(np.prod(shape, dtype=np.int64))
+        key = (dtype, max(self._MIN_BLOCK_NUMEL, 1 << max(numel - 1, 0).bit_length()))
+        with self._lock:
+            self._collect_free_blocks()
+            free_blocks = self._free_blocks[key]
+            block = free_blocks.pop() if free_blocks else None
+            if block is None:
+                self.num_allocations += 1
+            else:
+                self.num_reuses += 1
+        if block is None:
+            block = flow.empty(key[1], dtype=dtype, pin_memory=self.pin_memory)
+        tensor = flow.narrow(block, 0, 0, numel).view(shape)
+        with self._lock:
+            self._used_blocks[id(tensor)] = (key, block, tensor)
+        return tensor
+
+    def allocate(self, shape, dtype):
+        r"""Returns an uninitialized tensor of ``shape`` and of the numpy ``dtype``
+        from the pool, i.e. the allocator interface of
+        :func:`~flow.utils.data._utils.collate.collate_buffer_allocator`.
+        """
+        return self._allocate(
+            tuple(shape), dtype_util.convert_numpy_dtype_to_oneflow_dtype(dtype)
+        )
+
+    def pin(self, tensor):
+        r"""Copies a local cpu tensor into a block of the pool. Tensors already
+        pinned or returned by the pool are not copied.
+        """
+        if self.pin_memory and tensor.is_pinned():
+            return tensor
+        with self._lock:
+            if id(tensor) in self._used_blocks:
+                return tensor
+        out = self._allocate(tuple(tensor.shape), tensor.dtype)
+        out.copy_(tensor)
+        return out
+
+    def empty_cache(self):
+        r"""Frees the cached blocks which are not in use."""
+        with self._lock:
+            self._collect_free_blocks()
+            self._free_blocks.clear()
+
+
+def _pin_memory_loop(in_queue, out_queue, device_id, done_event, pool=None):
+    # The number of threads of the CPU device is not set to 1 here, as it is
+    # process wide and would slow down all CPU kernels of the main process.
 
     # TODO: support flow.cuda.set_device
     # flow.cuda.set_device(device_id)
@@ -48,7 +137,7 @@ def _pin_memory_loop(in_queue, out_queue, device_id, done_event):
         idx, data = r
         if not done_event.is_set() and not isinstance(data, ExceptionWrapper):
             try:
-                data = pin_memory(data)
+                data = pin_memory(data, pool)
             except Exception:
                 data = ExceptionWrapper(
                     where="in pin memory thread for device {}".format(device_id)
@@ -63,18 +152,100 @@ def _pin_memory_loop(in_queue, out_queue, device_id, done_event):
         del r  # save memory
 
 
-def pin_memory(data):
+def pin_memory(data, pool=None):
     if isinstance(data, flow.Tensor):
+        if pool is not None and data.is_local and data.device.type == "cpu":
+            return pool.pin(data)
         return data.pin_memory()
     elif isinstance(data, string_classes):
         return data
     elif isinstance(data, container_abcs.Mapping):
-        return {k: pin_memory(sample) for k, sample in data.items()}
+        return {k: pin_memory(sample, pool) for k, sample in data.items()}
     elif isinstance(data, tuple) and hasattr(data, "_fields"):  # namedtuple
-        return type(data)(*(pin_memory(sample) for sample in data))
+        return type(data)(*(pin_memory(sample, pool) for sample in data))
     elif isinstance(data, container_abcs.Sequence):
-        return [pin_memory(sample) for sample in data]
+        return [pin_memory(sample, pool) for sample in data]
     elif hasattr(data, "pin_memory"):
         return data.pin_memory()
     else:
         return data
+
+
+def _to_device(data, device, pool):
+    if isinstance(data, flow.Tensor):
+        if pool is not None and data.is_local and data.device.type == "cpu":
+            data = pool.pin(data)
+        return data.to(device)
+    elif isinstance(data, string_classes):
+        return data
+    elif isinstance(data, container_abcs.Mapping):
+        return {k: _to_device(sample, device, pool) for k, sample in data.items()}
+    elif isinstance(data, tuple) and hasattr(data, "_fields"):  # namedtuple
+        return type(data)(*(_to_device(sample, device, pool) for sample in data))
+    elif isinstance(data, container_abcs.Sequence):
+        return [_to_device(sample, device, pool) for sample in data]
+    else:
+        return data
+
+
+class DevicePrefetcher(object):
+    r"""Wraps an iterable of batches, e.g. a :class:`~flow.utils.data.DataLoader`,
+    and copies the next ``num_prefetch`` batches to ``device`` ahead of the one
+    being returned.
+
+    The copies are launched asynchronously: the OneFlow virtual machine runs
+    the host to device copies on their own stream, so the copy of batch N+1
+    overlaps with the computation on batch N as long as the training loop does
+    not wait for it, e.g. by calling ``numpy()`` or ``item()`` on the batch.
+    Host tensors which are not pinned yet are first copied into ``pool``.
+
+    Args:
+        loader (iterable): the iterable of batches.
+        device (flow.device or str, optional): the device of the batches.
+            Default: ``"cuda"`` if available, else ``"cpu"``.
+        num_prefetch (int, optional): the number of batches copied ahead.
+            Default: ``1``.
+        pool (PinnedMemoryPool, optional): the pool pinning the host tensors.
+            Default: a new pool if ``device`` is not a cpu device, else ``None``.
+
+    For example:
+
+    .. code-block:: python
+
+        >>> import oneflow as flow
+        >>> dataset = flow.utils.data.TensorDataset(flow.arange(8))
+        >>> loader = flow.utils.data.DataLoader(dataset, batch_size=4)
+        >>> for (x,) in flow.utils.data.DevicePrefetcher(loader, "cpu"):
+        ...     print(x)
+        tensor([0, 1, 2, 3], dtype=oneflow.int64)
+        tensor([4, 5, 6, 7], dtype=oneflow.int64)
+
+    """
+
+    def __init__(self, loader, device=None, num_prefetch=1, pool=None):
+        if device is None:
+            device = "cuda" if flow.cuda.is_available() else "cpu"
+        if not isinstance(num_prefetch, int) or num_prefetch < 1:
+            raise ValueError(
+                "num_prefetch should be a positive integer, "
+                "but got num_prefetch={}".format(num_prefetch)
+            )
+        self.loader = loader
+        self.device = flow.device(device)
+        self.num_prefetch = num_prefetch
+        if pool is None and self.device.type != "cpu":
+            pool = PinnedMemoryPool()
+        self.pool = pool
+
+    def __iter__(self):
+        batches = iter(self.loader)
+        prefetched = collections.deque()
+        for batch in batches:
+            prefetched.append(_to_device(batch, self.device, self.pool))
+            if len(prefetched) > self.num_prefetch:
+                yield prefetched.popleft()
+        while prefetched:
+            yield prefetched.popleft()
+
+    def __len__(self):
+        return len(self.loader)
@@ -22,6 +22,7 @@ import os
 import sys
 import traceback
 import queue
+import threading
 from dataclasses import dataclass
 from typing import Union
 from oneflow.multiprocessing import _prctl_pr_set_pdeathsig  # type: ignore[attr-defined]
@@ -29,7 +30,7 @@ from oneflow.multiprocessing import unlink_all_shared_memory
 import signal
 
 import oneflow as flow
-from . import signal_handling, MP_STATUS_CHECK_INTERVAL, IS_WINDOWS, HAS_NUMPY
+from . import collate, signal_handling, MP_STATUS_CHECK_INTERVAL, IS_WINDOWS, HAS_NUMPY
 from oneflow._utils import ExceptionWrapper
 
 
@@ -85,6 +86,9 @@ else:
 
 
 _worker_info = None
+# The information of the worker running in the current thread, when workers are
+# threads of the main process.
+_thread_worker_info = threading.local()
 
 
 class WorkerInfo(object):
@@ -123,6 +127,9 @@ def get_worker_info():
     * :attr:`dataset`: the copy of the dataset object in **this** process. Note
       that this will be a different object in a different process than the one
       in the main process.
+    When called in a worker thread of a :class:`~flow.utils.data.DataLoader`
+    with ``worker_type="thread"``, this returns the information about that
+    thread, whose ``dataset`` is the one of the main process.
     When called in the main process, this returns ``None``.
     .. note::
        When used in a :attr:`worker_init_fn` passed over to
@@ -132,7 +139,7 @@ def get_worker_info():
        sharded dataset, or use ``seed`` to seed other libraries used in dataset
        code.
     """
-    return _worker_info
+    return getattr(_thread_worker_info, "info", _worker_info)
 
 
 r"""Dummy class used to signal the end of an IterableDataset"""
@@ -232,6 +239,111 @@ def _generate_state(base_seed, worker_id):
     return state
 
 
+def _fetch_loop(
+    dataset_kind,
+    dataset,
+    index_queue,
+    data_queue,
+    done_event,
+    auto_collation,
+    collate_fn,
+    drop_last,
+    init_fn,
+    worker_id,
+    is_alive,
+    where,
+    process_data=None,
+):
+    # The loop of a worker shared by worker processes and worker threads. It
+    # fetches the batches of the indices from `index_queue` and puts them into
+    # `data_queue` until the final signal `None` is received or `is_alive()`
+    # becomes false. `process_data` is applied to every fetched batch.
+    from oneflow.utils.data import _DatasetKind
+
+    init_exception = None
+
+    try:
+        if init_fn is not None:
+            init_fn(worker_id)
+
+        fetcher = _DatasetKind.create_fetcher(
+            dataset_kind, dataset, auto_collation, collate_fn, drop_last
+        )
+    except Exception:
+        init_exception = ExceptionWrapper(where=where)
+
+    # When using Iterable mode, some worker can exit earlier than others due
+    # to the IterableDataset behaving differently for different workers.
+    # When such things happen, an `_IterableDatasetStopIteration` object is
+    # sent over to the main process with the ID of this worker, so that the
+    # main process won't send more tasks to this worker, and will send
+    # `None` to this worker to properly exit it.
+    #
+    # Note that we cannot set `done_event` from a worker as it is shared
+    # among all processes. Instead, we set the `iteration_end` flag to
+    # signify that the iterator is exhausted. When either `done_event` or
+    # `iteration_end` is set, we skip all processing step and just wait for
+    # `None`.
+    iteration_end = False
+
+    while is_alive():
+        try:
+            r = index_queue.get(timeout=MP_STATUS_CHECK_INTERVAL)
+        except queue.Empty:
+            continue
+        if isinstance(r, _ResumeIteration):
+            # Acknowledge the main process
+            data_queue.put((r, None))
+            iteration_end = False
+            # Recreate the fetcher for worker-reuse policy
+            fetcher = _DatasetKind.create_fetcher(
+                dataset_kind, dataset, auto_collation, collate_fn, drop_last
+            )
+            continue
+        elif r is None:
+            # Received the final signal
+            assert done_event.is_set() or iteration_end
+            break
+        elif done_event.is_set() or iteration_end:
+            # `done_event` is set. But I haven't received the final signal
+            # (None) yet. I will keep continuing until get it, and skip the
+            # processing steps.
+            continue
+        idx, index = r
+        data: Union[_IterableDatasetStopIteration, ExceptionWrapper]
+
+        if init_exception is not None:
+            data = init_exception
+            init_exception = None
+        else:
+            try:
+                data = fetcher.fetch(index)
+            except Exception as e:
+                if (
+                    isinstance(e, StopIteration)
+                    and dataset_kind == _DatasetKind.Iterable
+                ):
+                    data = _IterableDatasetStopIteration(worker_id)
+                    # Set `iteration_end`
+                    #   (1) to save future `next(...)` calls, and
+                    #   (2) to avoid sending multiple `_IterableDatasetStopIteration`s.
+                    iteration_end = True
+                else:
+                    # It is important that we don't store exc_info in a variable.
+                    # `ExceptionWrapper` does the correct thing.
+                    # See NOTE [ Python Traceback Reference Cycle Problem ]
+                    data = ExceptionWrapper(where=where)
+        if process_data is not None and not isinstance(
+            data, (_IterableDatasetStopIteration, ExceptionWrapper)
+        ):
+            try:
+                data = process_data(data)
+            except Exception:
+                data = ExceptionWrapper(where=where)
+        data_queue.put((idx, data))
+        del data, idx, index, r  # save memory
+
+
 def _worker_loop(
     dataset_kind,
     dataset,
@@ -246,6 +358,7 @@ def _worker_loop(
     worker_id,
     num_workers,
     persistent_workers,
+    shared_memory_arena_slabs=0,
 ):
     # See NOTE [ Data Loader Multiprocessing Shutdown Logic ] for details on the
     # logic of this function.
@@ -282,89 +395,34 @@ def _worker_loop(
             id=worker_id, num_workers=num_workers, seed=seed, dataset=dataset
         )
 
-        from oneflow.utils.data import _DatasetKind
-
-        init_exception = None
+        # Batches are collated directly into a ring of shared memory slabs
+        # which are recycled once the main process releases them, instead of
+        # creating and unlinking a shared memory segment for every tensor.
+        arena = None
+        if shared_memory_arena_slabs > 0:
+            from oneflow.multiprocessing.arena import SharedMemoryArena
 
-        try:
-            if init_fn is not None:
-                init_fn(worker_id)
-
-            fetcher = _DatasetKind.create_fetcher(
-                dataset_kind, dataset, auto_collation, collate_fn, drop_last
-            )
-        except Exception:
-            init_exception = ExceptionWrapper(
-                where="in DataLoader worker process {}".format(worker_id)
-            )
-
-        # When using Iterable mode, some worker can exit earlier than others due
-        # to the IterableDataset behaving differently for different workers.
-        # When such things happen, an `_IterableDatasetStopIteration` object is
-        # sent over to the main process with the ID of this worker, so that the
-        # main process won't send more tasks to this worker, and will send
-        # `None` to this worker to properly exit it.
-        #
-        # Note that we cannot set `done_event` from a worker as it is shared
-        # among all processes. Instead, we set the `iteration_end` flag to
-        # signify that the iterator is exhausted. When either `done_event` or
-        # `iteration_end` is set, we skip all processing step and just wait for
-        # `None`.
-        iteration_end = False
+            arena = SharedMemoryArena(shared_memory_arena_slabs)
+            # This thread only does the work of this worker, so the allocator
+            # is set once for all batches.
+            collate._buffer_allocator.allocate = arena.allocate
 
         watchdog = ManagerWatchdog()
-
-        while watchdog.is_alive():
-            try:
-                r = index_queue.get(timeout=MP_STATUS_CHECK_INTERVAL)
-            except queue.Empty:
-                continue
-            if isinstance(r, _ResumeIteration):
-                # Acknowledge the main process
-                data_queue.put((r, None))
-                iteration_end = False
-                # Recreate the fetcher for worker-reuse policy
-                fetcher = _DatasetKind.create_fetcher(
-                    dataset_kind, dataset, auto_collation, collate_fn, drop_last
-                )
-                continue
-            elif r is None:
-                # Received the final signal
-                assert done_event.is_set() or iteration_end
-                break
-            elif done_event.is_set() or iteration_end:
-                # `done_event` is set. But I haven't received the final signal
-                # (None) yet. I will keep continuing until get it, and skip the
-                # processing steps.
-                continue
-            idx, index = r
-            data: Union[_IterableDatasetStopIteration, ExceptionWrapper]
-
-            if init_exception is not None:
-                data = init_exception
-                init_exception = None
-            else:
-                try:
-                    data = fetcher.fetch(index)
-                except Exception as e:
-                    if (
-                        isinstance(e, StopIteration)
-                        and dataset_kind == _DatasetKind.Iterable
-                    ):
-                        data = _IterableDatasetStopIteration(worker_id)
-                        # Set `iteration_end`
-                        #   (1) to save future `next(...)` calls, and
-                        #   (2) to avoid sending multiple `_IterableDatasetStopIteration`s.
-                        iteration_end = True
-                    else:
-                        # It is important that we don't store exc_info in a variable.
-                        # `ExceptionWrapper` does the correct thing.
-                        # See NOTE [ Python Traceback Reference Cycle Problem ]
-                        data = ExceptionWrapper(
-                            where="in DataLoader worker process {}".format(worker_id)
-                        )
-            data_queue.put((idx, data))
-            del data, idx, index, r  # save memory
+        _fetch_loop(
+            dataset_kind,
+            dataset,
+            index_queue,
+            data_queue,
+            done_event,
+            auto_collation,
+            collate_fn,
+            drop_last,
+            init_fn,
+            worker_id,
+            watchdog.is_alive,
+            "in DataLoader worker process {}".format(worker_id),
+            arena.pack if arena is not None else None,
+        )
     except KeyboardInterrupt:
         # Main process will raise KeyboardInterrupt anyways.
         pass
@@ -375,3 +433,53 @@ def _worker_loop(
     # Python subprocess will be exited by os._exit(), which skips destructors of
     # C++ objects, so we should explicitly call unlink_all_shared_memory() here
     unlink_all_shared_memory()
+
+
+def _thread_worker_loop(
+    dataset_kind,
+    dataset,
+    index_queue,
+    data_queue,
+    done_event,
+    auto_collation,
+    collate_fn,
+    drop_last,
+    base_seed,
+    init_fn,
+    worker_id,
+    num_workers,
+    pinned_memory_pool,
+):
+    # A worker running as a thread of the main process. Unlike worker processes,
+    # it does not reseed the random generators, which are shared with the main
+    # process, and batches are handed over by reference without any copy. The
+    # number of threads of the CPU device is not set here, as it is process wide.
+    _thread_worker_info.info = WorkerInfo(
+        id=worker_id,
+        num_workers=num_workers,
+        seed=base_seed + worker_id,
+        dataset=dataset,
+    )
+    process_data = None
+    if pinned_memory_pool is not None:
+        from .pin_memory import pin_memory as pin_data
+
+        # Collate directly into pinned memory, pin_data only handles the fields
+        # not collated by default_collate.
+        collate._buffer_allocator.allocate = pinned_memory_pool.allocate
+        process_data = lambda data: pin_data(data, pinned_memory_pool)
+    _fetch_loop(
+        dataset_kind,
+        dataset,
+        index_queue,
+        data_queue,
+        done_event,
+        auto_collation,
+        collate_fn,
+        drop_last,
+        init_fn,
+        worker_id,
+        lambda: True,
+        "in DataLoader worker thread {}".format(worker_id),
+        process_data,
+    )
@@ -18,8 +18,18 @@ import os
 import threading
 import itertools
 import queue
-
-from typing import Any, Callable, TypeVar, Generic, Sequence, List, Optional
+import weakref
+
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    TypeVar,
+    Generic,
+    Sequence,
+    List,
+    Optional,
+)
 import multiprocessing as python_multiprocessing
 
 import oneflow.multiprocessing as multiprocessing
@@ -144,6 +154,30 @@ class DataLoader(Generic[T_co]):
             If you are using oneflow with RDMA support in distributed training, the
             ``persistent_workers`` must be ``True`` otherwise will encounter segmentation
             fault. (default: ``False``)
+        shared_memory_arena (bool, optional, keyword-only arg): If ``True``, each
+            worker process writes its batches into a ring of ``prefetch_factor + 2``
+            pre-allocated shared memory slabs which are reused once the main process
+            releases the tensors of a batch, instead of creating and unlinking a
+            shared memory segment for every tensor. A batch is sent the usual way
+            when all slabs of its worker are still in use. (default: ``False``)
+        worker_type (str, optional, keyword-only arg): ``"process"`` runs the workers
+            as subprocesses. ``"thread"`` runs them as threads of the main process,
+            which avoids pickling batches and copying them through shared memory,
+            and is faster when loading data mostly releases the GIL, e.g. file
+            I/O, numpy or opencv. Worker threads share the dataset object and the
+            random generators of the main process. (default: ``"process"``)
+        vectorized_sampler (bool, optional, keyword-only arg): If ``True``, the
+            batch sampler yields each batch of indices as an int64 numpy array,
+            see ``vectorized`` of :class:`~flow.utils.data.BatchSampler`. The
+            arrays are sent to the workers and to ``__getitems__`` of the dataset
+            as they are. Only for map-style datasets with :attr:`batch_size`.
+            (default: ``False``)
+
+    :meth:`state_dict` captures the position of the current iteration, i.e. the
+    number of batches returned so far and the state of the sampler, and
+    :meth:`load_state_dict` makes the next iteration continue from it, e.g. to
+    restart a preempted job in the middle of an epoch. The skipped batches are
+    not loaded again.
 
 
     .. warning:: If the ``spawn`` start method is used, :attr:`worker_init_fn`
@@ -192,7 +226,10 @@ class DataLoader(Generic[T_co]):
         generator=flow.Generator("cpu"),
         *,
         prefetch_factor: int = 2,
-        persistent_workers: bool = False
+        persistent_workers: bool = False,
+        shared_memory_arena: bool = False,
+        worker_type: str = "process",
+        vectorized_sampler: bool = False
     ):
 
         if num_workers < 0:
@@ -216,6 +253,18 @@ class DataLoader(Generic[T_co]):
         if persistent_workers and num_workers == 0:
             raise ValueError("persistent_workers option needs num_workers > 0")
 
+        if shared_memory_arena and num_workers == 0:
+            raise ValueError("shared_memory_arena option needs num_workers > 0")
+
+        if worker_type not in ("process", "thread"):
+            raise ValueError(
+                "worker_type option should be 'process' or 'thread', but got {}".format(
+                    worker_type
+                )
+            )
+        if shared_memory_arena and worker_type != "process":
+            raise ValueError("shared_memory_arena option needs worker_type='process'")
+
         self.dataset = dataset
         self.prefetch_factor = prefetch_factor
         self.pin_memory = pin_memory
@@ -309,9 +358,21 @@ class DataLoader(Generic[T_co]):
                 else:
                     sampler = SequentialSampler(dataset)
 
+        if vectorized_sampler and (
+            self._dataset_kind == _DatasetKind.Iterable
+            or batch_size is None
+            or batch_sampler is not None
+        ):
+            raise ValueError(
+                "vectorized_sampler option needs a map-style dataset and "
+                "batch_size, and is mutually exclusive with batch_sampler"
+            )
+
         if batch_size is not None and batch_sampler is None:
             # auto_collation without custom batch_sampler
-            batch_sampler = BatchSampler(sampler, batch_size, drop_last)
+            batch_sampler = BatchSampler(
+                sampler, batch_size, drop_last, vectorized=vectorized_sampler
+            )
 
         self.batch_size = batch_size
         self.drop_last = drop_last
@@ -327,6 +388,12 @@ class DataLoader(Generic[T_co]):
 
         self.collate_fn = collate_fn
         self.persistent_workers = persistent_workers
+        self.shared_memory_arena = shared_memory_arena
+        self.worker_type = worker_type
+
+        self._last_iterator = None
+        self._num_yielded_to_resume = None
+        self._pinned_memory_pool = None
 
         self.__initialized = True
         self._IterableDataset_len_called = (
@@ -338,6 +405,8 @@ class DataLoader(Generic[T_co]):
     def _get_iterator(self) -> "_BaseDataLoaderIter":
         if self.num_workers == 0:
             return _SingleProcessDataLoaderIter(self)
+        elif self.worker_type == "thread":
+            return _ThreadPoolDataLoaderIter(self)
         else:
             self.check_worker_number_rationality()
             return _MultiProcessingDataLoaderIter(self)
@@ -366,14 +435,58 @@ class DataLoader(Generic[T_co]):
         # However, in the case of a multiple workers iterator
         # the iterator is only created once in the lifetime of the
         # DataLoader object so that workers can be reused
+        num_yielded_to_resume = self._num_yielded_to_resume
+        self._num_yielded_to_resume = None
         if self.persistent_workers and self.num_workers > 0:
             if self._iterator is None:
                 self._iterator = self._get_iterator()
-            elif not self._iterator._status_reset:
+            elif not self._iterator._status_reset or num_yielded_to_resume is not None:
+                # A fresh persistent iterator has already prefetched the
+                # beginning of the epoch.
                 self._iterator._reset(self)
-            return self._iterator
+            iterator = self._iterator
         else:
-            return self._get_iterator()
+            iterator = self._get_iterator()
+        if num_yielded_to_resume is not None:
+            iterator._num_yielded = num_yielded_to_resume
+        self._last_iterator = weakref.ref(iterator)
+        return iterator
+
+    def state_dict(self) -> Dict[str, Any]:
+        r"""Returns the state of the current iteration of this DataLoader, see
+        :meth:`_BaseDataLoaderIter.state_dict`. Before the first iteration, the
+        state resumes from the beginning of an epoch.
+        """
+        iterator = self._last_iterator() if self._last_iterator is not None else None
+        if iterator is None:
+            return {"num_yielded": 0}
+        return iterator.state_dict()
+
+    def load_state_dict(self, state_dict: Dict[str, Any]) -> None:
+        r"""Makes the next iteration of this DataLoader continue from a state
+        returned by :meth:`state_dict`. The sampler state is restored, so the
+        remaining batches are the ones that were not yet returned, and none of
+        the skipped samples is loaded.
+
+        Args:
+            state_dict (dict): DataLoader state, returned by :meth:`state_dict`.
+        """
+        num_yielded = state_dict["num_yielded"]
+        if num_yielded > 0:
+            if "sampler" not in state_dict or not hasattr(
+                self._index_sampler, "load_state_dict"
+            ):
+                raise ValueError(
+                    "Resuming in the middle of an epoch requires a sampler "
+                    "implementing state_dict and load_state_dict, but got {}".format(
+                        type(self._index_sampler).__name__
+                    )
+                )
+            # The sampler may have run ahead of the returned batches to prefetch.
+            self._index_sampler.load_state_dict(
+                dict(state_dict["sampler"], num_consumed=num_yielded)
+            )
+        self._num_yielded_to_resume = num_yielded
 
     @property
     def _auto_collation(self):
@@ -499,6 +612,14 @@ class _BaseDataLoaderIter(object):
         self._num_workers = loader.num_workers
         self._prefetch_factor = loader.prefetch_factor
         self._pin_memory = loader.pin_memory and flow.cuda.is_available()
+        # Batches are pinned into cached blocks, which are reused once the
+        # tensors of a batch are freed. The pool is shared by the iterators of
+        # the loader, so that the blocks are kept across epochs.
+        if self._pin_memory and loader._pinned_memory_pool is None:
+            loader._pinned_memory_pool = _utils.pin_memory.PinnedMemoryPool()
+        self._pinned_memory_pool = (
+            loader._pinned_memory_pool if self._pin_memory else None
+        )
         self._timeout = loader.timeout
         self._collate_fn = loader.collate_fn
         self._sampler_iter = iter(self._index_sampler)
@@ -507,6 +628,7 @@ class _BaseDataLoaderIter(object):
             0, np.iinfo(np.int64).max, (), generator=loader.generator
         ).item()
         self._persistent_workers = loader.persistent_workers
+        self._shared_memory_arena = loader.shared_memory_arena
         self._num_yielded = 0
         self._profile_name = "enumerate(DataLoader)#{}.__next__".format(
             self.__class__.__name__
@@ -554,6 +676,16 @@ class _BaseDataLoaderIter(object):
     def __len__(self) -> int:
         return len(self._index_sampler)
 
+    def state_dict(self) -> Dict[str, Any]:
+        r"""Returns the number of batches returned by this iterator and, once it
+        returned a batch, the state of its sampler, which stays the one at the
+        beginning of the epoch, e.g. its random generator state.
+        """
+        state = {"num_yielded": self._num_yielded}
+        if self._num_yielded > 0 and hasattr(self._index_sampler, "state_dict"):
+            state["sampler"] = self._index_sampler.state_dict()
+        return state
+
     def __getstate__(self):
         raise NotImplementedError("{} cannot be pickled", self.__class__.__name__)
 
@@ -574,9 +706,16 @@ class _SingleProcessDataLoaderIter(_BaseDataLoaderIter):
 
     def _next_data(self):
         index = self._next_index()  # may raise StopIteration
-        data = self._dataset_fetcher.fetch(index)  # may raise StopIteration
         if self._pin_memory:
-            data = _utils.pin_memory.pin_memory(data)
+            # Collate directly into pinned memory, so that pin_memory below
+            # only has to handle the fields not collated by default_collate.
+            with _utils.collate.collate_buffer_allocator(
+                self._pinned_memory_pool.allocate
+            ):
+                data = self._dataset_fetcher.fetch(index)  # may raise StopIteration
+            data = _utils.pin_memory.pin_memory(data, self._pinned_memory_pool)
+        else:
+            data = self._dataset_fetcher.fetch(index)  # may raise StopIteration
         return data
 
 
@@ -939,6 +1078,7 @@ class _MultiProcessingDataLoaderIter(_BaseDataLoaderIter):
                     i,
                     self._num_workers,
                     self._persistent_workers,
+                    self._prefetch_factor + 2 if self._shared_memory_arena else 0,
                 ),
             )
             w.daemon = True
@@ -964,6 +1104,7 @@ class _MultiProcessingDataLoaderIter(_BaseDataLoaderIter):
                     self._data_queue,
                     flow.cuda.current_device(),
                     self._pin_memory_thread_done_event,
+                    self._pinned_memory_pool,
                 ),
             )
             pin_memory_thread.daemon = True
@@ -1274,6 +1415,10 @@ class _MultiProcessingDataLoaderIter(_BaseDataLoaderIter):
                 if self._worker_pids_set:
                     _utils.signal_handling._remove_worker_pids(id(self))
                     self._worker_pids_set = False
+                if self._shared_memory_arena:
+                    from oneflow.multiprocessing.arena import detach_arenas
+
+                    detach_arenas(w.pid for w in self._workers)
                 for w in self._workers:
                     if w.is_alive():
                         # Existing mechanisms try to make the workers exit
@@ -1284,3 +1429,97 @@ class _MultiProcessingDataLoaderIter(_BaseDataLoaderIter):
 
     def __del__(self):
         self._shutdown_workers()
+
+
+class _ThreadPoolDataLoaderIter(_MultiProcessingDataLoaderIter):
+    r"""Runs the workers of :class:`_MultiProcessingDataLoaderIter` as threads of
+    the main process. Indices are sent and batches are received the same way, so
+    batches are still returned in order with ``prefetch_factor`` batches in flight
+    per worker, but they are handed over by reference through in-process queues
+    instead of being pickled and copied through shared memory.
+    """
+
+    def __init__(self, loader):
+        _BaseDataLoaderIter.__init__(self, loader)
+        assert self._num_workers > 0
+        assert self._prefetch_factor > 0
+
+        self._worker_init_fn = loader.worker_init_fn
+        self._worker_queue_idx_cycle = itertools.cycle(range(self._num_workers))
+        self._worker_result_queue = queue.Queue()  # type: ignore[var-annotated]
+        # Worker threads pin the batches by themselves.
+        self._data_queue = self._worker_result_queue
+        self._worker_pids_set = False
+        self._shutdown = False
+        self._workers_done_event = threading.Event()
+
+        self._index_queues = []
+        self._workers = []
+        for i in range(self._num_workers):
+            index_queue = queue.Queue()  # type: ignore[var-annotated]
+            w = threading.Thread(
+                target=_utils.worker._thread_worker_loop,
+                args=(
+                    self._dataset_kind,
+                    self._dataset,
+                    index_queue,
+                    self._worker_result_queue,
+                    self._workers_done_event,
+                    self._auto_collation,
+                    self._collate_fn,
+                    self._drop_last,
+                    self._base_seed,
+                    self._worker_init_fn,
+                    i,
+                    self._num_workers,
+                    self._pinned_memory_pool,
+                ),
+            )
+            w.daemon = True
+            w.start()
+            self._index_queues.append(index_queue)
+            self._workers.append(w)
+        self._reset(loader, first_iter=True)
+
+    def _try_get_data(self, timeout=_utils.MP_STATUS_CHECK_INTERVAL):
+        try:
+            data = self._data_queue.get(timeout=timeout)
+            return (True, data)
+        except queue.Empty:
+            failed_workers = []
+            for worker_id, w in enumerate(self._workers):
+                if self._workers_status[worker_id] and not w.is_alive():
+                    failed_workers.append(worker_id)
+                    self._mark_worker_as_unavailable(worker_id)
+            if len(failed_workers) > 0:
+                raise RuntimeError(
+                    "DataLoader worker thread(s) {} exited unexpectedly".format(
+                        ", ".join(str(worker_id) for worker_id in failed_workers)
+                    )
+                )
+            return (False, None)
+
+    def _get_data(self):
+        if self._timeout > 0:
+            success, data = self._try_get_data(self._timeout)
+            if success:
+                return data
+            raise RuntimeError(
+                "DataLoader timed out after {} seconds".format(self._timeout)
+            )
+        while True:
+            success, data = self._try_get_data()
+            if success:
+                return data
+
+    def _shutdown_workers(self):
+        if _utils is None or _utils.python_exit_status is not False:
+            return
+        if not self._shutdown:
+            self._shutdown = True
+            self._workers_done_event.set()
+            for worker_id in range(len(self._workers)):
+                if self._persistent_workers or self._workers_status[worker_id]:
+                    self._mark_worker_as_unavailable(worker_id, shutdown=True)
+            for w in self._workers:
+                w.join(timeout=_utils.MP_STATUS_CHECK_INTERVAL)
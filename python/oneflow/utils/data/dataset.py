@@ -14,6 +14,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 import bisect
+import collections.abc
 import functools
 from typing import (
     TypeVar,
@@ -28,6 +29,8 @@ from typing import (
     Callable,
 )
 
+import numpy as np
+
 import oneflow as flow
 from oneflow.framework.tensor import Tensor
 
@@ -64,6 +67,13 @@ class Dataset(Generic[T_co]):
     :class:`~flow.utils.data.Sampler` implementations and the default options
     of :class:`~flow.utils.data.DataLoader`.
 
+    Subclasses could also optionally implement :meth:`__getitems__`, which
+    takes a list of keys and returns the list of their samples. When it exists,
+    :class:`~flow.utils.data.DataLoader` calls it once per batch instead of
+    calling :meth:`__getitem__` for every sample, so that a batch can be fetched
+    by one vectorized read. With ``vectorized_sampler=True``, the keys are an
+    int64 numpy array.
+
     .. note::
       :class:`~flow.utils.data.DataLoader` by default constructs a index
       sampler that yields integral indices.  To make it work with a map-style
@@ -187,6 +197,59 @@ class IterableDataset(Dataset[T_co]):
         IterableDataset.reduce_ex_hook = hook_fn
 
 
+def _fetch_samples(dataset, indices):
+    getitems = getattr(dataset, "__getitems__", None)
+    if getitems is not None:
+        return getitems(indices)
+    if isinstance(indices, np.ndarray):
+        indices = indices.tolist()
+    return [dataset[idx] for idx in indices]
+
+
+class _BatchedSamples(collections.abc.Sequence):
+    r"""Samples of a batch fetched by one gather per field, which is what
+    :meth:`TensorDataset.__getitems__` returns. It behaves as the list of the
+    samples, while :func:`~flow.utils.data._utils.collate.default_collate` takes
+    the gathered fields as they are instead of stacking the samples again.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+
+    def __len__(self):
+        return self.fields[0].shape[0]
+
+    def __getitem__(self, idx):
+        return tuple(field[idx] for field in self.fields)
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def take(self, indices):
+        return _BatchedSamples(
+            flow.index_select(field, 0, _as_index_tensor(indices, field.device))
+            for field in self.fields
+        )
+
+    @staticmethod
+    def cat(parts):
+        return _BatchedSamples(
+            flow.cat([part.fields[i] for part in parts], dim=0)
+            for i in range(len(parts[0].fields))
+        )
+
+
+def _as_index_tensor(indices, device):
+    if isinstance(indices, Tensor):
+        return indices.to(device=device, dtype=flow.int64)
+    if isinstance(indices, np.ndarray):
+        # Index arrays of a vectorized BatchSampler are used without a copy.
+        indices = np.ascontiguousarray(indices, dtype=np.int64)
+        return flow.from_numpy(indices).to(device=device)
+    return flow.tensor(np.asarray(indices, dtype=np.int64), device=device)
+
+
 class TensorDataset(Dataset[Tuple[Tensor, ...]]):
     r"""Dataset wrapping tensors.
 
@@ -205,6 +268,23 @@ class TensorDataset(Dataset[Tuple[Tensor, ...]]):
     def __getitem__(self, index):
         return tuple(tensor[index] for tensor in self.tensors)
 
+    def __getitems__(self, indices):
+        # Negative indices count from the end, as in __getitem__.
+        length = len(self)
+        if isinstance(indices, Tensor):
+            indices = flow.where(indices < 0, indices + length, indices)
+        else:
+            indices = np.asarray(indices, dtype=np.int64)
+            if indices.size > 0 and (
+                indices.min() < -length or indices.max() >= length
+            ):
+                raise IndexError(
+                    "index out of range for a dataset of length {}".format(length)
+                )
+            if indices.size > 0 and indices.min() < 0:
+                indices = np.where(indices < 0, indices + length, indices)
+        return _BatchedSamples(self.tensors).take(indices)
+
     def __len__(self):
         return self.tensors[0].size(0)
 
@@ -257,6 +337,39 @@ class ConcatDataset(Dataset[T_co]):
             sample_idx = idx - self.cumulative_sizes[dataset_idx - 1]
         return self.datasets[dataset_idx][sample_idx]
 
+    def __getitems__(self, indices):
+        idx = np.asarray(indices, dtype=np.int64)
+        if len(idx) == 0:
+            return []
+        if np.any(idx < -len(self)):
+            raise ValueError("absolute value of index should not exceed dataset length")
+        if np.any(idx >= len(self)):
+            # As raised by __getitem__ when looking up the dataset.
+            raise IndexError("list index out of range")
+        idx = np.where(idx < 0, idx + len(self), idx)
+        cumulative_sizes = np.asarray(self.cumulative_sizes, dtype=np.int64)
+        dataset_idx = np.searchsorted(cumulative_sizes, idx, side="right")
+        sample_idx = idx - np.concatenate(([0], cumulative_sizes[:-1]))[dataset_idx]
+        # Fetch the samples of every dataset at once, in the order of `order`.
+        order = np.argsort(dataset_idx, kind="stable")
+        parts = []
+        for d in np.unique(dataset_idx):
+            part_idx = sample_idx[dataset_idx == d]
+            # The datasets get the indices in the container type they are given.
+            if not isinstance(indices, np.ndarray):
+                part_idx = part_idx.tolist()
+            parts.append(_fetch_samples(self.datasets[d], part_idx))
+        if len(parts) == 1:
+            return parts[0]
+        if all(isinstance(part, _BatchedSamples) for part in parts):
+            inverse_order = np.empty_like(order)
+            inverse_order[order] = np.arange(len(order))
+            return _BatchedSamples.cat(parts).take(inverse_order)
+        samples = [None] * len(order)
+        for (position, sample) in zip(order, (s for part in parts for s in part)):
+            samples[position] = sample
+        return samples
+
 
 class ChainDataset(IterableDataset):
     r"""Dataset for chainning multiple :class:`IterableDataset` s.
@@ -310,6 +423,25 @@ class Subset(Dataset[T_co]):
     def __getitem__(self, idx):
         return self.dataset[self.indices[idx]]
 
+    def _index_array(self):
+        # The indices are converted once, unless another sequence is assigned.
+        if getattr(self, "_index_array_source", None) is not self.indices:
+            if isinstance(self.indices, Tensor):
+                self._index_array_cache = self.indices.numpy().astype(np.int64)
+            else:
+                self._index_array_cache = np.asarray(self.indices, dtype=np.int64)
+            self._index_array_source = self.indices
+        return self._index_array_cache
+
+    def __getitems__(self, indices):
+        if isinstance(indices, Tensor):
+            indices = indices.numpy()
+        dataset_indices = self._index_array()[np.asarray(indices, dtype=np.int64)]
+        # The dataset gets the indices in the container type they are given.
+        if not isinstance(indices, np.ndarray):
+            dataset_indices = dataset_indices.tolist()
+        return _fetch_samples(self.dataset, dataset_indices)
+
     def __len__(self):
         return len(self.indices)
 
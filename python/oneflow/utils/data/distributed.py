@@ -15,7 +15,7 @@ limitations under the License.
 """
 import math
 import numpy as np
-from typing import TypeVar, Optional, Iterator
+from typing import Any, Dict, TypeVar, Optional, Iterator
 
 import oneflow as flow
 from oneflow.utils.data import Sampler, Dataset
@@ -23,6 +23,48 @@ from oneflow.utils.data import Sampler, Dataset
 
 T_co = TypeVar("T_co", covariant=True)
 
+# Number of indices generated at once by the lazy iteration.
+_LAZY_CHUNK_SIZE = 1 << 16
+
+
+class _FeistelPermutation(object):
+    r"""A seeded pseudo-random bijection of ``[0, n)`` evaluated element-wise in
+    O(1) memory. A balanced Feistel network permutes ``[0, 4^k)`` with
+    ``4^k >= n``, and values out of ``[0, n)`` are encrypted again ("cycle
+    walking") until they fall in range, which takes less than 4 rounds on
+    average.
+    """
+
+    def __init__(self, n: int, seed: int, num_rounds: int = 4) -> None:
+        self.n = n
+        self.half_bits = np.uint64(max(1, (max(1, n - 1).bit_length() + 1) // 2))
+        self.mask = np.uint64((1 << int(self.half_bits)) - 1)
+        self.keys = np.random.SeedSequence(seed).generate_state(
+            num_rounds, dtype=np.uint64
+        )
+
+    def _round(self, right, key):
+        h = (right ^ key) * np.uint64(0x9E3779B97F4A7C15)
+        h ^= h >> np.uint64(32)
+        h *= np.uint64(0xBF58476D1CE4E5B9)
+        h ^= h >> np.uint64(29)
+        return h & self.mask
+
+    def _encrypt(self, x):
+        left = x >> self.half_bits
+        right = x & self.mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self.half_bits) | right
+
+    def __call__(self, positions: np.ndarray) -> np.ndarray:
+        x = self._encrypt(positions.astype(np.uint64))
+        out_of_range = x >= np.uint64(self.n)
+        while np.any(out_of_range):
+            x[out_of_range] = self._encrypt(x[out_of_range])
+            out_of_range = x >= np.uint64(self.n)
+        return x.astype(np.int64)
+
 
 class DistributedSampler(Sampler[T_co]):
     r"""Sampler that restricts data loading to a subset of the dataset.
@@ -53,6 +95,12 @@ class DistributedSampler(Sampler[T_co]):
             tail of the data to make it evenly divisible across the number of
             replicas. If ``False``, the sampler will add extra indices to make
             the data evenly divisible across the replicas. Default: ``False``.
+        lazy_shuffle (bool, optional): if ``True``, the shuffled order is a seeded
+            bijective permutation evaluated index by index, so that each rank
+            generates its indices with constant memory instead of materializing a
+            permutation of the whole dataset, e.g. for datasets of billions of
+            samples. The order differs from the default one, padding and
+            :attr:`drop_last` work the same. Default: ``False``.
 
     .. warning::
         In distributed mode, calling the :meth:`set_epoch` method at
@@ -80,6 +128,8 @@ class DistributedSampler(Sampler[T_co]):
         shuffle: bool = True,
         seed: int = 0,
         drop_last: bool = False,
+        *,
+        lazy_shuffle: bool = False,
     ) -> None:
         if num_replicas is None:
             num_replicas = flow.env.get_world_size()
@@ -112,15 +162,29 @@ class DistributedSampler(Sampler[T_co]):
         self.total_size = self.num_samples * self.num_replicas
         self.shuffle = shuffle
         self.seed = seed
+        self.lazy_shuffle = lazy_shuffle
+        self._start_index = 0
+        self._num_consumed = 0
 
     def __iter__(self) -> Iterator[T_co]:
-        if self.shuffle:
-            # deterministically shuffle based on epoch and seed
-            g = flow.Generator("cpu")
-            g.manual_seed(self.seed + self.epoch)
-            indices = flow._C.randperm(len(self.dataset), generator=g).tolist()
+        start_index = self._start_index
+        # Resuming only applies to the next iteration.
+        self._start_index = 0
+        self._num_consumed = start_index
+        if self.lazy_shuffle or not self.shuffle:
+            # Without shuffling, the lazy iteration yields the same indices.
+            indices = self._lazy_iter(start_index)
         else:
-            indices = list(range(len(self.dataset)))
+            indices = self._randperm_indices()[start_index:]
+        for idx in indices:
+            self._num_consumed += 1
+            yield idx
+
+    def _randperm_indices(self):
+        # deterministically shuffle based on epoch and seed
+        g = flow.Generator("cpu")
+        g.manual_seed(self.seed + self.epoch)
+        indices = flow._C.randperm(len(self.dataset), generator=g).tolist()
 
         if not self.drop_last:
             # add extra samples to make it evenly divisible
@@ -140,11 +204,58 @@ class DistributedSampler(Sampler[T_co]):
         indices = indices[self.rank : self.total_size : self.num_replicas]
         assert len(indices) == self.num_samples
 
-        return iter(indices)
+        return indices
+
+    def _lazy_iter(self, start_index: int) -> Iterator[T_co]:
+        # The k-th index of this rank is at position `rank + k * num_replicas` of
+        # the padded (or truncated) global order, whose padding repeats the order
+        # from its beginning, i.e. the position is taken modulo the dataset size.
+        dataset_size = len(self.dataset)
+        permutation = None
+        if self.shuffle:
+            permutation = _FeistelPermutation(dataset_size, self.seed + self.epoch)
+        for begin in range(start_index, self.num_samples, _LAZY_CHUNK_SIZE):
+            end = min(begin + _LAZY_CHUNK_SIZE, self.num_samples)
+            positions = np.arange(begin, end, dtype=np.int64) * self.num_replicas
+            positions = (positions + self.rank) % dataset_size
+            if permutation is not None:
+                positions = permutation(positions)
+            yield from positions.tolist()
 
     def __len__(self) -> int:
         return self.num_samples
 
+    def set_start_index(self, start_index: int) -> None:
+        r"""Makes the next iteration of this sampler start from its
+        ``start_index``-th index, e.g. to resume an interrupted epoch. With
+        :attr:`lazy_shuffle` or without shuffling, the skipped indices are not
+        generated at all.
+
+        Args:
+            start_index (int): Number of indices of this rank to skip.
+        """
+        if start_index < 0 or start_index > self.num_samples:
+            raise ValueError(
+                "Invalid start_index {}, start_index should be in the interval"
+                " [0, {}]".format(start_index, self.num_samples)
+            )
+        self._start_index = start_index
+
+    def state_dict(self) -> Dict[str, Any]:
+        r"""Returns the epoch and the number of indices yielded by the current
+        iteration.
+        """
+        return {"epoch": self.epoch, "num_consumed": self._num_consumed}
+
+    def load_state_dict(self, state_dict: Dict[str, Any]) -> None:
+        r"""Restores the epoch and makes the next iteration resume after
+        ``state_dict["num_consumed"]`` indices, see :meth:`set_start_index`.
+        """
+        if "epoch" in state_dict:
+            self.set_epoch(state_dict["epoch"])
+        # A resumed BatchSampler counts the indices of its last partial batch.
+        self.set_start_index(min(state_dict["num_consumed"], self.num_samples))
+
     def set_epoch(self, epoch: int) -> None:
         """Sets the epoch for this sampler. 
         When :attr:`shuffle=True`, this ensures all replicas use a different random 
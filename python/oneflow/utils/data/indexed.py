@@ -0,0 +1,228 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import mmap
+import os
+import struct
+from typing import Callable, Optional, Sequence, Union
+
+import numpy as np
+
+from oneflow.utils.data.dataset import Dataset
+from oneflow.utils.data.record import (
+    _check_record_format,
+    _list_record_files,
+    _record_index_path,
+    build_record_index,
+    load_record_index,
+)
+
+
+def _mmap_file(path):
+    # mmap cannot map empty files, which have no record anyway.
+    if os.path.getsize(path) == 0:
+        return b""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _normalize_indices(indices, length):
+    idx = np.asarray(indices, dtype=np.int64)
+    if np.any(idx < -length) or np.any(idx >= length):
+        raise IndexError("index out of range for a dataset of length {}".format(length))
+    return np.where(idx < 0, idx + length, idx)
+
+
+class IndexedRecordDataset(Dataset[bytes]):
+    r"""Map-style dataset of the records of OFRecord or TFRecord part files, which
+    reads any record in O(1) through the memory-mapped offset index next to each
+    file, see :func:`~flow.utils.data.build_record_index` or
+    ``python3 -m oneflow.utils.data.record``.
+
+    Since every record has its own index, a :class:`~flow.utils.data.RandomSampler`
+    shuffles the records of all files exactly, and a
+    :class:`~flow.utils.data.DistributedSampler` gives every rank the same number
+    of records however they are spread over the files.
+
+    Args:
+        files (str or sequence of str): record files, or a directory whose
+            ``part-*`` files are used in lexicographic order.
+        record_format (str, optional): ``"ofrecord"`` or ``"tfrecord"``.
+            Default: ``"ofrecord"``.
+        transform (callable, optional): applied to the bytes of every record, e.g.
+            :func:`~flow.utils.data.decode_ofrecord`. Default: ``None``.
+        build_index (bool, optional): if ``True``, builds the missing index files
+            instead of raising an error. Default: ``False``.
+    """
+
+    def __init__(
+        self,
+        files: Union[str, Sequence[str]],
+        record_format: str = "ofrecord",
+        transform: Optional[Callable] = None,
+        build_index: bool = False,
+    ) -> None:
+        self.header_size, self.footer_size = _check_record_format(record_format)
+        self.files = _list_record_files(files)
+        self.record_format = record_format
+        self.transform = transform
+        for path in self.files:
+            if build_index and not os.path.exists(_record_index_path(path)):
+                build_record_index(path, record_format)
+        self._load_indices()
+
+    def _load_indices(self):
+        self.offsets = [load_record_index(_record_index_path(f)) for f in self.files]
+        self.cumulative_sizes = np.cumsum(
+            [len(offsets) - 1 for offsets in self.offsets], dtype=np.int64
+        )
+        # Record files are mapped lazily, i.e. in the DataLoader workers.
+        self._buffers = [None] * len(self.files)
+
+    def __getstate__(self):
+        # The memory maps are opened again after unpickling.
+        state = self.__dict__.copy()
+        del state["offsets"], state["cumulative_sizes"], state["_buffers"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._load_indices()
+
+    def __len__(self):
+        return int(self.cumulative_sizes[-1]) if len(self.files) > 0 else 0
+
+    def _read(self, file_index, record_index):
+        buffer = self._buffers[file_index]
+        if buffer is None:
+            buffer = self._buffers[file_index] = _mmap_file(self.files[file_index])
+        offsets = self.offsets[file_index]
+        begin = int(offsets[record_index]) + self.header_size
+        end = int(offsets[record_index + 1]) - self.footer_size
+        record = buffer[begin:end]
+        if self.transform is not None:
+            record = self.transform(record)
+        return record
+
+    def _locate(self, indices):
+        idx = _normalize_indices(indices, len(self))
+        file_indices = np.searchsorted(self.cumulative_sizes, idx, side="right")
+        starts = np.concatenate(([0], self.cumulative_sizes[:-1]))
+        return file_indices, idx - starts[file_indices]
+
+    def __getitem__(self, index):
+        file_indices, record_indices = self._locate([index])
+        return self._read(int(file_indices[0]), int(record_indices[0]))
+
+    def __getitems__(self, indices):
+        file_indices, record_indices = self._locate(indices)
+        return [
+            self._read(f, r)
+            for (f, r) in zip(file_indices.tolist(), record_indices.tolist())
+        ]
+
+
+# See MegatronGPTIndex in oneflow/user/data/gpt_dataset.h.
+_MEGATRON_INDEX_MAGIC = b"MMIDIDX\x00\x00"
+# Magic, version, dtype code, number of sequences and of document offsets.
+_MEGATRON_INDEX_HEADER_SIZE = 34
+_MEGATRON_DTYPES = {
+    1: np.uint8,
+    2: np.int8,
+    3: np.int16,
+    4: np.int32,
+    5: np.int64,
+    6: np.float32,
+    7: np.float64,
+    8: np.uint16,
+}
+
+
+class IndexedBinDataset(Dataset[np.ndarray]):
+    r"""Map-style dataset of the token sequences of a Megatron indexed dataset,
+    i.e. the ``.bin`` and ``.idx`` files read by
+    :class:`~flow.nn.GPTIndexedBinDataReader`.
+
+    The sizes and addresses of the sequences are memory-mapped from the ``.idx``
+    file instead of being loaded, and every sequence is a read-only view of the
+    memory-mapped ``.bin`` file, so that any sequence is read in O(1) without
+    loading the dataset.
+
+    Args:
+        data_file_prefix (str): path of the files without the ``.bin`` and
+            ``.idx`` extensions.
+    """
+
+    def __init__(self, data_file_prefix: str) -> None:
+        self.data_file_prefix = data_file_prefix
+        self._load_index()
+
+    def _load_index(self):
+        index_path = self.data_file_prefix + ".idx"
+        with open(index_path, "rb") as f:
+            header = f.read(_MEGATRON_INDEX_HEADER_SIZE)
+        if header[: len(_MEGATRON_INDEX_MAGIC)] != _MEGATRON_INDEX_MAGIC:
+            raise ValueError("{} is not a Megatron index file".format(index_path))
+        (dtype_code,) = struct.unpack_from("<B", header, 17)
+        (num_sequences, num_doc_offsets) = struct.unpack_from("<QQ", header, 18)
+        self.dtype = np.dtype(_MEGATRON_DTYPES[dtype_code])
+        offset = _MEGATRON_INDEX_HEADER_SIZE
+        self.sizes = np.memmap(
+            index_path, np.int32, "r", offset=offset, shape=(num_sequences,)
+        )
+        offset += self.sizes.nbytes
+        self.pointers = np.memmap(
+            index_path, np.int64, "r", offset=offset, shape=(num_sequences,)
+        )
+        offset += self.pointers.nbytes
+        self.doc_offsets = np.memmap(
+            index_path, np.int64, "r", offset=offset, shape=(num_doc_offsets,)
+        )
+        self._buffer = None
+
+    def __getstate__(self):
+        return {"data_file_prefix": self.data_file_prefix}
+
+    def __setstate__(self, state):
+        self.__init__(state["data_file_prefix"])
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def get(self, index: int, offset: int = 0, length: Optional[int] = None):
+        r"""Returns ``length`` tokens of a sequence from its ``offset``-th token,
+        by default up to the end of the sequence.
+        """
+        (index,) = _normalize_indices([index], len(self)).tolist()
+        if self._buffer is None:
+            self._buffer = _mmap_file(self.data_file_prefix + ".bin")
+        size = int(self.sizes[index])
+        if length is None:
+            length = size - offset
+        if offset < 0 or length < 0 or offset + length > size:
+            raise IndexError(
+                "tokens [{}, {}) out of sequence {} of {} tokens".format(
+                    offset, offset + length, index, size
+                )
+            )
+        return np.frombuffer(
+            self._buffer,
+            dtype=self.dtype,
+            count=length,
+            offset=int(self.pointers[index]) + offset * self.dtype.itemsize,
+        )
+
+    def __getitem__(self, index):
+        return self.get(index)
@@ -0,0 +1,427 @@
+"""
+Copyright 2020 The OneFlow Authors. All rights reserved.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+import os
+import queue
+import struct
+import threading
+from typing import Callable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+import oneflow as flow
+from oneflow.utils.data.dataset import IterableDataset
+
+
+# (header size, footer size) of a record: OFRecord part files prefix every record
+# with its int64 length, TFRecord files add the crc32 of the length and of the
+# record, which are not checked here.
+_RECORD_FRAMINGS = {"ofrecord": (8, 0), "tfrecord": (12, 4)}
+
+_INDEX_MAGIC = b"OFRECIDX"
+_INDEX_VERSION = 1
+# Magic, version and number of records.
+_INDEX_HEADER_SIZE = 24
+
+
+def _check_record_format(record_format):
+    if record_format not in _RECORD_FRAMINGS:
+        raise ValueError(
+            "record_format should be one of {}, but got {}".format(
+                tuple(_RECORD_FRAMINGS), record_format
+            )
+        )
+    return _RECORD_FRAMINGS[record_format]
+
+
+def _read_ahead(path, begin, end, chunk_size, num_chunks=2):
+    # Reads [begin, end) of a file by large sequential reads in a background
+    # thread, which keeps up to `num_chunks` chunks ahead of the consumer.
+    chunks = queue.Queue(num_chunks)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        try:
+            with open(path, "rb", buffering=0) as f:
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(
+                        f.fileno(), begin, end - begin, os.POSIX_FADV_SEQUENTIAL
+                    )
+                f.seek(begin)
+                remaining = end - begin
+                while remaining > 0:
+                    chunk = f.read(min(chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    if not put(chunk):
+                        return
+            put(b"")
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=read, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if isinstance(chunk, Exception):
+                raise chunk
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        stop.set()
+
+
+def _iter_records(chunks, record_format, path):
+    # Splits a stream of chunks into records, a record may span several chunks.
+    header_size, footer_size = _RECORD_FRAMINGS[record_format]
+    buffer = b""
+    pos = 0
+    for chunk in chunks:
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        while len(buffer) - pos >= header_size:
+            (length,) = struct.unpack_from("<q", buffer, pos)
+            if length <= 0:
+                raise ValueError("invalid record length {} in {}".format(length, path))
+            begin = pos + header_size
+            if begin + length + footer_size > len(buffer):
+                break
+            yield buffer[begin : begin + length]
+            pos = begin + length + footer_size
+    if pos != len(buffer):
+        raise ValueError("{} ends with a truncated record".format(path))
+
+
+def _record_index_path(path):
+    return path + ".index"
+
+
+def build_record_index(
+    path: str, record_format: str = "ofrecord", index_path: Optional[str] = None
+) -> str:
+    r"""Builds the index file of a record file, which stores the offset of every
+    record so that :class:`RecordFileDataset` can seek to any record instead of
+    scanning the file.
+
+    The index is a 24 bytes header, i.e. a magic, a version and the number of
+    records ``n``, followed by ``n + 1`` little-endian int64 offsets, the last one
+    being the size of the file. It can be memory-mapped with
+    :func:`load_record_index`.
+
+    Args:
+        path (str): path of the record file.
+        record_format (str): ``"ofrecord"`` or ``"tfrecord"``. Default: ``"ofrecord"``.
+        index_path (str, optional): path of the index file. Default: ``path``
+            followed by ``".index"``.
+
+    Returns:
+        The path of the index file.
+    """
+    header_size, footer_size = _check_record_format(record_format)
+    if index_path is None:
+        index_path = _record_index_path(path)
+    file_size = os.path.getsize(path)
+    offsets = []
+    # Only the length prefixes are read, a seek past the buffered bytes skips the
+    # record without reading it.
+    with open(path, "rb", buffering=1 << 20) as f:
+        offset = 0
+        while offset < file_size:
+            f.seek(offset)
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError("{} ends with a truncated record".format(path))
+            (length,) = struct.unpack("<q", header)
+            if length <= 0:
+                raise ValueError("invalid record length {} in {}".format(length, path))
+            offsets.append(offset)
+            offset += header_size + length + footer_size
+    if offset != file_size:
+        raise ValueError("{} ends with a truncated record".format(path))
+    offsets.append(file_size)
+    # Write to a temporary file first, so that a reader never sees a partial index.
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_INDEX_MAGIC)
+        f.write(struct.pack("<qq", _INDEX_VERSION, len(offsets) - 1))
+        f.write(np.asarray(offsets, dtype="<i8").tobytes())
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def load_record_index(index_path: str) -> np.ndarray:
+    r"""Memory-maps an index file written by :func:`build_record_index`.
+
+    Returns:
+        The read-only int64 array of the ``n + 1`` record offsets, record ``i``
+        spanning the bytes ``[offsets[i], offsets[i + 1])`` of the record file.
+    """
+    with open(index_path, "rb") as f:
+        header = f.read(_INDEX_HEADER_SIZE)
+    if len(header) != _INDEX_HEADER_SIZE or header[:8] != _INDEX_MAGIC:
+        raise ValueError("{} is not a record index file".format(index_path))
+    (version, num_records) = struct.unpack("<qq", header[8:])
+    if version != _INDEX_VERSION:
+        raise ValueError(
+            "unsupported version {} of record index file {}".format(version, index_path)
+        )
+    return np.memmap(
+        index_path,
+        dtype="<i8",
+        mode="r",
+        offset=_INDEX_HEADER_SIZE,
+        shape=(num_records + 1,),
+    )
+
+
+def decode_ofrecord(record: bytes) -> dict:
+    r"""Parses a serialized ``OFRecord`` into a dict from the feature names to
+    numpy arrays, or to lists of bytes for ``bytes_list`` features.
+    """
+    import oneflow.core.record.record_pb2 as record_util
+
+    ofrecord = record_util.OFRecord()
+    ofrecord.ParseFromString(record)
+    features = {}
+    for (name, feature) in ofrecord.feature.items():
+        kind = feature.WhichOneof("kind")
+        if kind == "bytes_list":
+            features[name] = list(feature.bytes_list.value)
+        else:
+            dtype = {
+                "float_list": np.float32,
+                "double_list": np.float64,
+                "int32_list": np.int32,
+                "int64_list": np.int64,
+            }[kind]
+            features[name] = np.array(getattr(feature, kind).value, dtype=dtype)
+    return features
+
+
+def _list_record_files(files):
+    if isinstance(files, str):
+        if not os.path.isdir(files):
+            return [files]
+        return sorted(
+            os.path.join(files, name)
+            for name in os.listdir(files)
+            if name.startswith("part-") and not name.endswith(".index")
+        )
+    return list(files)
+
+
+def _shuffle_records(records, buffer_size, rng):
+    buffer = []
+    for record in records:
+        if len(buffer) < buffer_size:
+            buffer.append(record)
+            continue
+        i = rng.integers(buffer_size)
+        yield buffer[i]
+        buffer[i] = record
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+class RecordFileDataset(IterableDataset):
+    r"""Streams the records of OFRecord or TFRecord part files, i.e. files of
+    length-prefixed records, for :class:`~flow.utils.data.DataLoader`.
+
+    The records are sharded over the ranks and the DataLoader workers of every
+    rank:
+
+    - with ``use_index=True``, the records of all files are split into equal
+      contiguous ranges by record count, using the index files built by
+      :func:`build_record_index`, and every shard seeks to its range.
+    - otherwise, when there are at least as many files as shards, every shard
+      reads whole files.
+    - otherwise, every shard reads all files and keeps one record out of the
+      number of shards.
+
+    Each file is read by large sequential reads of ``read_ahead_size`` bytes in a
+    background thread, ahead of the parsing of the records.
+
+    Args:
+        files (str or sequence of str): record files, or a directory whose
+            ``part-*`` files are read in lexicographic order.
+        record_format (str, optional): ``"ofrecord"`` for records prefixed by their
+            int64 length, or ``"tfrecord"``. Default: ``"ofrecord"``.
+        transform (callable, optional): applied to the bytes of every record, e.g.
+            :func:`decode_ofrecord`. Default: ``None``.
+        shuffle (bool, optional): if ``True``, the order of the files is shuffled
+            at every epoch and the records of every shard are shuffled through a
+            buffer of ``shuffle_buffer_size`` records. Default: ``False``.
+        shuffle_buffer_size (int, optional): Default: ``10000``.
+        seed (int, optional): random seed, identical on all ranks. Default: ``0``.
+        num_replicas (int, optional): number of ranks. Default: the world size.
+        rank (int, optional): rank of the current process. Default: the current
+            rank.
+        read_ahead_size (int, optional): size of the sequential reads in bytes.
+            Default: 16 MiB.
+        use_index (bool, optional): shard by record count with the index file next
+            to every record file. Default: ``False``.
+
+    For example:
+
+    .. code-block:: python
+
+        >>> dataset = RecordFileDataset("/data/imagenet/train", shuffle=True,
+        ...                             transform=decode_ofrecord)
+        >>> loader = DataLoader(dataset, batch_size=256, num_workers=8)
+        >>> for epoch in range(n_epochs):
+        ...     dataset.set_epoch(epoch)
+        ...     train(loader)
+    """
+
+    def __init__(
+        self,
+        files: Union[str, Sequence[str]],
+        record_format: str = "ofrecord",
+        transform: Optional[Callable] = None,
+        shuffle: bool = False,
+        shuffle_buffer_size: int = 10000,
+        seed: int = 0,
+        num_replicas: Optional[int] = None,
+        rank: Optional[int] = None,
+        read_ahead_size: int = 16 << 20,
+        use_index: bool = False,
+    ) -> None:
+        _check_record_format(record_format)
+        if num_replicas is None:
+            num_replicas = flow.env.get_world_size()
+        if rank is None:
+            rank = flow.env.get_rank()
+        if rank >= num_replicas or rank < 0:
+            raise ValueError(
+                "Invalid rank {}, rank should be in the interval"
+                " [0, {}]".format(rank, num_replicas - 1)
+            )
+        if shuffle_buffer_size <= 0 or read_ahead_size <= 0:
+            raise ValueError(
+                "shuffle_buffer_size and read_ahead_size should be positive"
+            )
+        self.files = _list_record_files(files)
+        if len(self.files) == 0:
+            raise ValueError("no record file in {}".format(files))
+        self.record_format = record_format
+        self.transform = transform
+        self.shuffle = shuffle
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.read_ahead_size = read_ahead_size
+        self.use_index = use_index
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        r"""Sets the epoch, which changes the shuffled order when
+        :attr:`shuffle=True`.
+        """
+        self.epoch = epoch
+
+    def _read(self, path, begin=0, end=None):
+        if end is None:
+            end = os.path.getsize(path)
+        chunks = _read_ahead(path, begin, end, self.read_ahead_size)
+        return _iter_records(chunks, self.record_format, path)
+
+    def _iter_shard(self, files, shard, num_shards) -> Iterator[bytes]:
+        if self.use_index:
+            offsets = [load_record_index(_record_index_path(f)) for f in files]
+            counts = np.array([len(o) - 1 for o in offsets], dtype=np.int64)
+            total = int(counts.sum())
+            begin = total * shard // num_shards
+            end = total * (shard + 1) // num_shards
+            file_begins = np.concatenate(([0], np.cumsum(counts)))
+            for (path, index, file_begin) in zip(files, offsets, file_begins):
+                first = max(begin - file_begin, 0)
+                last = min(end - file_begin, len(index) - 1)
+                if first < last:
+                    yield from self._read(path, int(index[first]), int(index[last]))
+        elif len(files) >= num_shards:
+            for path in files[shard::num_shards]:
+                yield from self._read(path)
+        else:
+            i = 0
+            for path in files:
+                for record in self._read(path):
+                    if i % num_shards == shard:
+                        yield record
+                    i += 1
+
+    def __iter__(self) -> Iterator:
+        worker_info = flow.utils.data.get_worker_info()
+        num_workers = 1 if worker_info is None else worker_info.num_workers
+        worker_id = 0 if worker_info is None else worker_info.id
+        num_shards = self.num_replicas * num_workers
+        shard = self.rank * num_workers + worker_id
+        files = self.files
+        if self.shuffle:
+            # The same file order on all shards, so that they partition the files.
+            order = np.random.default_rng([self.seed, self.epoch]).permutation(
+                len(files)
+            )
+            files = [files[i] for i in order]
+        records = self._iter_shard(files, shard, num_shards)
+        if self.shuffle:
+            rng = np.random.default_rng([self.seed, self.epoch, shard])
+            records = _shuffle_records(records, self.shuffle_buffer_size, rng)
+        if self.transform is not None:
+            records = map(self.transform, records)
+        return records
+
+
+def main(args=None):
+    r"""Builds the index files of record files, e.g.::
+
+        python3 -m oneflow.utils.data.record /data/imagenet/train/part-*
+    """
+    import argparse
+    import concurrent.futures
+
+    parser = argparse.ArgumentParser(
+        description="Build the offset index files of OFRecord or TFRecord files"
+    )
+    parser.add_argument("files", nargs="+", help="record files or directories")
+    parser.add_argument(
+        "--record_format", default="ofrecord", choices=tuple(_RECORD_FRAMINGS)
+    )
+    parser.add_argument(
+        "--num_threads", type=int, default=8, help="files indexed in parallel"
+    )
+    args = parser.parse_args(args)
+    files = [path for f in args.files for path in _list_record_files(f)]
+    with concurrent.futures.ThreadPoolExecutor(args.num_threads) as executor:
+        for index_path in executor.map(
+            lambda path: build_record_index(path, args.record_format), files
+        ):
+            print(index_path)
+
+
+if __name__ == "__main__":
+    main()
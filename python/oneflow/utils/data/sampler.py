@@ -13,7 +13,18 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from typing import Iterator, Optional, Sequence, List, TypeVar, Generic, Sized
+import itertools
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    Optional,
+    Sequence,
+    List,
+    TypeVar,
+    Generic,
+    Sized,
+)
 import numpy as np
 
 import oneflow as flow
@@ -21,6 +32,34 @@ import oneflow as flow
 
 T_co = TypeVar("T_co", covariant=True)
 
+# Number of indices RandomSampler draws per randint call with replacement.
+_REPLACEMENT_CHUNK_SIZE = 1 << 16
+
+
+def _batch_index_arrays(pieces, batch_size, drop_last):
+    # Regroups consecutive int64 index arrays into batches, which are views of the
+    # pieces unless a batch spans several of them.
+    pending = []
+    num_pending = 0
+    for piece in pieces:
+        begin = 0
+        if num_pending > 0:
+            begin = min(batch_size - num_pending, len(piece))
+            pending.append(piece[:begin])
+            num_pending += begin
+            if num_pending == batch_size:
+                yield np.concatenate(pending)
+                pending = []
+                num_pending = 0
+        while len(piece) - begin >= batch_size:
+            yield piece[begin : begin + batch_size]
+            begin += batch_size
+        if begin < len(piece):
+            pending.append(piece[begin:])
+            num_pending += len(piece) - begin
+    if num_pending > 0 and not drop_last:
+        yield np.concatenate(pending)
+
 
 class Sampler(Generic[T_co]):
     r"""Base class for all Samplers.
@@ -78,9 +117,37 @@ class SequentialSampler(Sampler[int]):
 
     def __init__(self, data_source):
         self.data_source = data_source
+        self._start_index = 0
+        self._num_consumed = 0
 
     def __iter__(self):
-        return iter(range(len(self.data_source)))
+        start_index, self._start_index = self._start_index, 0
+        self._num_consumed = start_index
+        for idx in range(start_index, len(self.data_source)):
+            self._num_consumed += 1
+            yield idx
+
+    def _iter_index_arrays(self, batch_size, drop_last):
+        start_index, self._start_index = self._start_index, 0
+        self._num_consumed = start_index
+        n = len(self.data_source)
+        pieces = (
+            np.arange(begin, min(begin + batch_size, n), dtype=np.int64)
+            for begin in range(start_index, n, batch_size)
+        )
+        for batch in _batch_index_arrays(pieces, batch_size, drop_last):
+            self._num_consumed += len(batch)
+            yield batch
+
+    def state_dict(self) -> Dict[str, Any]:
+        r"""Returns the number of indices yielded by the current iteration."""
+        return {"num_consumed": self._num_consumed}
+
+    def load_state_dict(self, state_dict: Dict[str, Any]) -> None:
+        r"""Makes the next iteration resume after ``state_dict["num_consumed"]``
+        indices.
+        """
+        self._start_index = state_dict["num_consumed"]
 
     def __len__(self) -> int:
         return len(self.data_source)
@@ -96,6 +163,11 @@ class RandomSampler(Sampler[int]):
         num_samples (int): number of samples to draw, default=`len(dataset)`. This argument
             is supposed to be specified only when `replacement` is ``True``.
         generator (Generator): Generator used in sampling.
+
+    :meth:`state_dict` captures the generator state at the beginning of the current
+    iteration and the number of indices yielded so far. After
+    :meth:`load_state_dict`, the next iteration replays the same order from the
+    first index that was not yielded.
     """
     data_source: Sized
     replacement: bool
@@ -111,6 +183,9 @@ class RandomSampler(Sampler[int]):
         self.replacement = replacement
         self._num_samples = num_samples
         self.generator = generator
+        self._generator_state = None
+        self._num_consumed = 0
+        self._resume_state = None
 
         if not isinstance(self.replacement, bool):
             raise TypeError(
@@ -138,6 +213,20 @@ class RandomSampler(Sampler[int]):
         return self._num_samples
 
     def __iter__(self):
+        for piece in self._index_pieces():
+            for idx in piece.tolist():
+                self._num_consumed += 1
+                yield idx
+
+    def _iter_index_arrays(self, batch_size, drop_last):
+        pieces = self._index_pieces()
+        for batch in _batch_index_arrays(pieces, batch_size, drop_last):
+            self._num_consumed += len(batch)
+            yield batch
+
+    def _index_pieces(self):
+        # Yields the indices of this iteration from the resumed position as int64
+        # arrays, which both the per-index and the per-batch iterations slice.
         n = len(self.data_source)
         if self.generator is None:
             generator = flow.Generator("cpu")
@@ -148,19 +237,45 @@ class RandomSampler(Sampler[int]):
             # )
         else:
             generator = self.generator
+        resume_state, self._resume_state = self._resume_state, None
+        start_index = 0
+        if resume_state is not None:
+            generator_state = resume_state.get("generator_state")
+            if generator_state is not None:
+                generator.set_state(generator_state)
+            start_index = resume_state["num_consumed"]
+        self._generator_state = generator.get_state()
+        self._num_consumed = start_index
         if self.replacement:
-            for _ in range(self.num_samples // 32):
-                yield from flow._C.randint(
-                    high=n, size=(32,), dtype=flow.int64, generator=generator
-                ).numpy().tolist()
-            yield from flow._C.randint(
-                high=n,
-                size=(self.num_samples % 32,),
-                dtype=flow.int64,
-                generator=generator,
-            ).numpy().tolist()
+            # The cpu kernel draws the indices one by one from the generator, so
+            # the chunk size doesn't change them: they are the same as when they
+            # were drawn 32 at a time.
+            chunk_size = _REPLACEMENT_CHUNK_SIZE
+            for offset in range(0, self.num_samples, chunk_size):
+                size = min(chunk_size, self.num_samples - offset)
+                # Skipped chunks are still drawn to advance the generator.
+                chunk = flow._C.randint(
+                    high=n, size=(size,), dtype=flow.int64, generator=generator
+                )
+                if start_index < offset + size:
+                    yield chunk.numpy()[max(0, start_index - offset) :]
         else:
-            yield from flow._C.randperm(n, generator=generator).numpy().tolist()
+            yield flow._C.randperm(n, generator=generator).numpy()[start_index:]
+
+    def state_dict(self) -> Dict[str, Any]:
+        r"""Returns the generator state at the beginning of the current iteration
+        and the number of indices it yielded.
+        """
+        return {
+            "generator_state": self._generator_state,
+            "num_consumed": self._num_consumed,
+        }
+
+    def load_state_dict(self, state_dict: Dict[str, Any]) -> None:
+        r"""Makes the next iteration resume from the given :meth:`state_dict`,
+        without generating the skipped indices one by one.
+        """
+        self._resume_state = state_dict
 
     def __len__(self):
         return self.num_samples
@@ -197,15 +312,31 @@ class BatchSampler(Sampler[List[int]]):
         batch_size (int): Size of mini-batch.
         drop_last (bool): If ``True``, the sampler will drop the last batch if
             its size would be less than ``batch_size``
+        vectorized (bool, optional, keyword-only arg): If ``True``, each batch is
+            an int64 numpy array instead of a list of ints. Batches of a
+            :class:`RandomSampler` or a :class:`SequentialSampler` are then sliced
+            from a single index buffer without creating a Python object per
+            index. (default: ``False``)
 
     Example:
         >>> list(BatchSampler(SequentialSampler(range(10)), batch_size=3, drop_last=False))
         [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
         >>> list(BatchSampler(SequentialSampler(range(10)), batch_size=3, drop_last=True))
         [[0, 1, 2], [3, 4, 5], [6, 7, 8]]
+
+    The number of yielded batches is part of :meth:`state_dict`. When resuming,
+    ``sampler`` is resumed with its own ``load_state_dict`` if it has one, and the
+    skipped indices are drawn and dropped otherwise.
     """
 
-    def __init__(self, sampler: Sampler[int], batch_size: int, drop_last: bool) -> None:
+    def __init__(
+        self,
+        sampler: Sampler[int],
+        batch_size: int,
+        drop_last: bool,
+        *,
+        vectorized: bool = False
+    ) -> None:
         # Since collections.abc.Iterable does not check for `__getitem__`, which
         # is one way for an object to be an iterable, we don't do an `isinstance`
         # check here.
@@ -226,10 +357,32 @@ class BatchSampler(Sampler[List[int]]):
         self.sampler = sampler
         self.batch_size = batch_size
         self.drop_last = drop_last
+        self.vectorized = vectorized
+        self._start_index = 0
+        self._num_consumed = 0
 
     def __iter__(self):
+        start_index, self._start_index = self._start_index, 0
+        self._num_consumed = start_index
+        # Subclasses may change the order of the indices, hence the exact types.
+        if self.vectorized and type(self.sampler) in (RandomSampler, SequentialSampler):
+            batches = self.sampler._iter_index_arrays(self.batch_size, self.drop_last)
+        else:
+            sampler_iter = iter(self.sampler)
+            if start_index > 0 and not hasattr(self.sampler, "load_state_dict"):
+                num_skipped = start_index * self.batch_size
+                sampler_iter = itertools.islice(sampler_iter, num_skipped, None)
+            if self.vectorized:
+                batches = self._array_batches(sampler_iter)
+            else:
+                batches = self._list_batches(sampler_iter)
+        for batch in batches:
+            self._num_consumed += 1
+            yield batch
+
+    def _list_batches(self, sampler_iter):
         batch = []
-        for idx in self.sampler:
+        for idx in sampler_iter:
             batch.append(idx)
             if len(batch) == self.batch_size:
                 yield batch
@@ -237,6 +390,37 @@ class BatchSampler(Sampler[List[int]]):
         if len(batch) > 0 and not self.drop_last:
             yield batch
 
+    def _array_batches(self, sampler_iter):
+        while True:
+            batch = np.fromiter(
+                itertools.islice(sampler_iter, self.batch_size), dtype=np.int64
+            )
+            if len(batch) == 0 or (self.drop_last and len(batch) < self.batch_size):
+                return
+            yield batch
+
+    def state_dict(self) -> Dict[str, Any]:
+        r"""Returns the number of batches yielded by the current iteration and the
+        state of ``sampler`` if it has a ``state_dict`` method.
+        """
+        state = {"num_consumed": self._num_consumed}
+        if hasattr(self.sampler, "state_dict"):
+            state["sampler"] = self.sampler.state_dict()
+        return state
+
+    def load_state_dict(self, state_dict: Dict[str, Any]) -> None:
+        r"""Makes the next iteration resume after ``state_dict["num_consumed"]``
+        batches.
+        """
+        self._start_index = state_dict["num_consumed"]
+        if hasattr(self.sampler, "load_state_dict"):
+            # The state of the sampler counts indices, not batches.
+            sampler_state = dict(
+                state_dict.get("sampler", {}),
+                num_consumed=self._start_index * self.batch_size,
+            )
+            self.sampler.load_state_dict(sampler_state)
+
     def __len__(self):
         # Can only be called if self.sampler has __len__ implemented
         # We cannot enforce this condition, so we turn off typechecking for the
@@ -0,0 +1,295 @@
+r"""Benchmarks of the per call overheads of nn.Graph and of the data pipeline.
+
+Runs the given benchmarks, or all of them by default:
+
+    python3 tools/overhead_benchmark.py graph_run shared_memory_arena
+
+The ddp_comm_hooks benchmark runs on the processes started by
+oneflow.distributed.launch, e.g.
+
+    python3 -m oneflow.distributed.launch --nproc_per_node 8 \
+        tools/overhead_benchmark.py ddp_comm_hooks
+"""
+import argparse
+import time
+
+import numpy as np
+
+import oneflow as flow
+from oneflow.framework.args_tree import ArgsTree, ArgSpec
+from oneflow.multiprocessing.arena import SharedMemoryArena
+from oneflow.nn.parallel import DistributedDataParallel as ddp
+from oneflow.nn.parallel import comm_hooks
+from oneflow.utils.data import BatchSampler, RandomSampler, SequentialSampler
+from oneflow.utils.data._utils.collate import collate_buffer_allocator
+from oneflow.utils.data._utils.collate import default_collate
+
+
+BENCHMARKS = {}
+
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__[len("benchmark_") :]] = fn
+    return fn
+
+
+def _time_per_call(fn, iters):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    return (time.perf_counter() - start) / iters * 1e6
+
+
+class SumGraph(flow.nn.Graph):
+    def __init__(self):
+        super().__init__()
+
+    def build(self, inputs):
+        out = inputs["x0"]
+        for (name, x) in inputs.items():
+            if name != "x0":
+                out = out + x
+        return {"sum": out, "doubled": tuple(x * 2 for x in inputs.values())}
+
+
+def _args_tree_io(args, kwargs, outputs):
+    # The io processing of nn.Graph's run before ArgSpec.
+    args_tree = ArgsTree((args, kwargs), False)
+    args_tree.map_leaf(
+        lambda v: v.contiguous_()
+        if isinstance(v, flow.Tensor) and not v.is_contiguous()
+        else v
+    )
+    flattened = [
+        arg
+        for arg in ArgsTree((args, kwargs), False).iter_nodes()
+        if isinstance(arg, flow.Tensor)
+    ]
+    copied = ArgsTree((outputs, {}), True, "_output", None).map_leaf(
+        lambda arg: arg.value().to(copy=True)
+        if isinstance(arg.value(), flow.Tensor)
+        else None
+    )
+    return flattened, copied
+
+
+def _arg_spec_io(in_spec, out_spec, args, kwargs, outputs_tensor_tuple):
+    flattened = in_spec.flatten((args, kwargs))
+    for arg in flattened:
+        if not arg.is_contiguous():
+            arg.contiguous_()
+    return (
+        flattened,
+        out_spec.unflatten([t.to(copy=True) for t in outputs_tensor_tuple]),
+    )
+
+
+@benchmark
+def benchmark_graph_run():
+    # Per-call overhead of nn.Graph's run with 1, 10 and 100 inputs. "before" and
+    # "after" are the io processing with ArgsTree and with ArgSpec, "graph" is a
+    # whole call of a graph.
+    iters = 200
+    print("num_inputs | before(us) | after(us) | graph(us)")
+    for num_inputs in (1, 10, 100):
+        inputs = {"x" + str(i): flow.randn(2) for i in range(num_inputs)}
+        sum_g = SumGraph()
+        outputs = sum_g(inputs)
+        args, kwargs = (inputs,), {}
+        in_spec = ArgSpec((args, kwargs))
+        out_spec = ArgSpec((outputs,))
+        outputs_tensor_tuple = out_spec.flatten((outputs,))
+        before = _time_per_call(lambda: _args_tree_io(args, kwargs, (outputs,)), iters)
+        after = _time_per_call(
+            lambda: _arg_spec_io(in_spec, out_spec, args, kwargs, outputs_tensor_tuple),
+            iters,
+        )
+        graph = _time_per_call(lambda: sum_g(inputs), iters)
+        print(f"{num_inputs:10d} | {before:10.1f} | {after:9.1f} | {graph:9.1f}")
+
+
+class ImageDataset(flow.utils.data.Dataset):
+    def __init__(self, length, shape=(3, 64, 64)):
+        self.length = length
+        self.image = np.random.rand(*shape).astype(np.float32)
+
+    def __getitem__(self, index):
+        return self.image, index
+
+    def __len__(self):
+        return self.length
+
+
+def _arena_samples_per_second(num_workers, shared_memory_arena, num_batches=64):
+    batch_size = 32
+    loader = flow.utils.data.DataLoader(
+        ImageDataset(num_batches * batch_size),
+        batch_size=batch_size,
+        num_workers=num_workers,
+        shared_memory_arena=shared_memory_arena,
+    )
+    start = time.perf_counter()
+    for (images, _) in loader:
+        pass
+    return num_batches * batch_size / (time.perf_counter() - start)
+
+
+@benchmark
+def benchmark_shared_memory_arena():
+    print("num_workers | per-tensor shm(samples/s) | arena(samples/s)")
+    for num_workers in (1, 2, 4, 8, 16, 32):
+        baseline = _arena_samples_per_second(num_workers, False)
+        arena = _arena_samples_per_second(num_workers, True)
+        print(f"{num_workers:11d} | {baseline:25.1f} | {arena:16.1f}")
+
+
+def _stack_collate(batch):
+    # The collate of numpy arrays before writing samples into a single buffer.
+    return flow._C.stack([flow.tensor(b) for b in batch], dim=0)
+
+
+def _images_per_second(collate_fn, batch, iters=20):
+    collate_fn(batch)
+    start = time.perf_counter()
+    for _ in range(iters):
+        collate_fn(batch)
+    return iters * len(batch) / (time.perf_counter() - start)
+
+
+@benchmark
+def benchmark_collate():
+    batch = [
+        np.random.randint(0, 256, (224, 224, 3), dtype=np.uint8) for _ in range(64)
+    ]
+    arena = SharedMemoryArena(1)
+
+    def collate_into_arena(batch):
+        with collate_buffer_allocator(arena.allocate):
+            out = default_collate(batch)
+        arena.pack(out)
+        arena.refcnts_[:] = 0
+
+    stack = _images_per_second(_stack_collate, batch)
+    single_buffer = _images_per_second(default_collate, batch)
+    shared = _images_per_second(collate_into_arena, batch)
+    arena.close()
+    print(
+        f"224x224x3 uint8 images/s, stack: {stack:.1f}, "
+        f"single buffer: {single_buffer:.1f}, shared memory: {shared:.1f}"
+    )
+
+
+class IODataset(flow.utils.data.Dataset):
+    # Sleeping releases the GIL like file I/O, the rest is decoding-like numpy work.
+    def __getitem__(self, index):
+        time.sleep(0.002)
+        image = np.full((64, 64, 3), index % 256, dtype=np.uint8)
+        return (image.astype(np.float32) / 255.0).transpose(2, 0, 1)
+
+    def __len__(self):
+        return 1024
+
+
+def _workers_samples_per_second(worker_type, num_workers):
+    dataset = IODataset()
+    loader = flow.utils.data.DataLoader(
+        dataset, batch_size=32, num_workers=num_workers, worker_type=worker_type
+    )
+    start = time.perf_counter()
+    for _ in loader:
+        pass
+    return len(dataset) / (time.perf_counter() - start)
+
+
+@benchmark
+def benchmark_thread_workers():
+    print("num_workers | process(samples/s) | thread(samples/s)")
+    for num_workers in (1, 2, 4, 8):
+        process = _workers_samples_per_second("process", num_workers)
+        thread = _workers_samples_per_second("thread", num_workers)
+        print(f"{num_workers:11d} | {process:18.1f} | {thread:17.1f}")
+
+
+def _epoch_seconds(batch_sampler):
+    start = time.perf_counter()
+    for _ in batch_sampler:
+        pass
+    return time.perf_counter() - start
+
+
+@benchmark
+def benchmark_sampler():
+    batch_size = 256
+    print("sampler                | indices | seconds | ns/index")
+    for (name, length, vectorized) in (
+        ("RandomSampler lists", 10 ** 6, False),
+        ("RandomSampler arrays", 10 ** 7, True),
+        ("SequentialSampler lists", 10 ** 6, False),
+        ("SequentialSampler arrays", 10 ** 7, True),
+    ):
+        if name.startswith("Random"):
+            sampler = RandomSampler(range(length))
+        else:
+            sampler = SequentialSampler(range(length))
+        batch_sampler = BatchSampler(sampler, batch_size, False, vectorized=vectorized)
+        seconds = _epoch_seconds(batch_sampler)
+        print(
+            f"{name:24s} | 1e{len(str(length)) - 1:<5d} | {seconds:7.2f} "
+            f"| {seconds / length * 1e9:8.1f}"
+        )
+
+
+def _ddp_step(hook, state, num_iters=10):
+    m = ddp(flow.nn.Sequential(*[flow.nn.Linear(1024, 1024) for _ in range(8)]))
+    if hook is not None:
+        m.register_comm_hook(state, hook)
+    x = flow.randn(32, 1024)
+    m(x).sum().backward()
+    reducer = m._ddp_reducer
+    reducer.num_bytes_sent = 0
+    flow._oneflow_internal.eager.Sync()
+    start = time.perf_counter()
+    for _ in range(num_iters):
+        m(x).sum().backward()
+    flow._oneflow_internal.eager.Sync()
+    step_time = (time.perf_counter() - start) / num_iters
+    return reducer.num_bytes_sent / num_iters, step_time
+
+
+@benchmark
+def benchmark_ddp_comm_hooks():
+    hooks = [
+        ("allreduce", None, None),
+        ("fp16", comm_hooks.fp16_compress_hook, None),
+        ("bf16", comm_hooks.bf16_compress_hook, None),
+        (
+            "powerSGD rank 4",
+            comm_hooks.powerSGD_hook,
+            comm_hooks.PowerSGDState(4, start_powerSGD_iter=0),
+        ),
+        ("top 1%", comm_hooks.topk_hook, comm_hooks.TopKState(0.01)),
+    ]
+    results = [(name, *_ddp_step(hook, state)) for (name, hook, state) in hooks]
+    if flow.env.get_rank() == 0:
+        print(f"{flow.env.get_world_size()} processes on cpu")
+        print("hook            | MB sent per step | step time(ms)")
+        for (name, num_bytes, step_time) in results:
+            mb, ms = num_bytes / 2 ** 20, step_time * 1e3
+            print(f"{name:15s} | {mb:16.2f} | {ms:13.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help="the benchmarks to run, among: " + ", ".join(BENCHMARKS),
+    )
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+    for name in args.benchmarks or BENCHMARKS:
+        print(f"== {name}")
+        BENCHMARKS[name]()